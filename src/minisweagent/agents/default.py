@@ -2,7 +2,7 @@
 
 import re
 import subprocess
-from collections.abc import Callable
+from collections.abc import Callable, Generator
 from dataclasses import asdict, dataclass
 
 from jinja2 import Template
@@ -68,12 +68,16 @@ class DefaultAgent:
     def add_message(self, role: str, content: str, **kwargs):
         self.messages.append({"role": role, "content": content, **kwargs})
 
-    def run(self, task: str, **kwargs) -> tuple[str, str]:
-        """Run step() until agent is finished. Return exit status & message"""
+    def start(self, task: str, **kwargs):
+        """Reset the messages to the system and instance message of a new task."""
         self.extra_template_vars |= {"task": task, **kwargs}
         self.messages = []
         self.add_message("system", self.render_template(self.config.system_template))
         self.add_message("user", self.render_template(self.config.instance_template))
+
+    def run(self, task: str, **kwargs) -> tuple[str, str]:
+        """Run step() until agent is finished. Return exit status & message"""
+        self.start(task, **kwargs)
         while True:
             try:
                 self.step()
@@ -83,14 +87,36 @@ class DefaultAgent:
                 self.add_message("user", str(e))
                 return type(e).__name__, str(e)
 
+    def run_steps(self, task: str, **kwargs) -> Generator[list[dict], dict, tuple[str, str]]:
+        """Like `run`, but leaves querying the model to the caller (e.g., to batch the queries of many agents).
+
+        The generator yields the messages whenever the model needs to be queried and expects the
+        response of the model to be sent back. It returns the exit status & message.
+        """
+        self.start(task, **kwargs)
+        while True:
+            try:
+                self.check_limits()
+                response = yield self.messages
+                self.add_message("assistant", **response)
+                self.get_observation(response)
+            except NonTerminatingException as e:
+                self.add_message("user", str(e))
+            except TerminatingException as e:
+                self.add_message("user", str(e))
+                return type(e).__name__, str(e)
+
     def step(self) -> dict:
         """Query the LM, execute the action, return the observation."""
         return self.get_observation(self.query())
 
-    def query(self) -> dict:
-        """Query the model and return the response."""
+    def check_limits(self):
         if 0 < self.config.step_limit <= self.model.n_calls or 0 < self.config.cost_limit <= self.model.cost:
             raise LimitsExceeded()
+
+    def query(self) -> dict:
+        """Query the model and return the response."""
+        self.check_limits()
         response = self.model.query(self.messages)
         self.add_message("assistant", **response)
         return response
@@ -44,8 +44,8 @@ class _TextualAgent(DefaultAgent):
         super().__init__(*args, config_class=TextualAgentConfig, **kwargs)
         self._current_action_from_human = False
 
-    def add_message(self, role: str, content: str):
-        super().add_message(role, content)
+    def add_message(self, role: str, content: str, **kwargs):
+        super().add_message(role, content, **kwargs)
         if self.app.agent_state != "UNINITIALIZED":
             self.app.call_from_thread(self.app.on_message_added)
 
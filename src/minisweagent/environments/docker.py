@@ -1,10 +1,27 @@
 import os
 import shlex
 import subprocess
+import sys
+import time
 import uuid
 from dataclasses import asdict, dataclass, field
+from functools import partial
 from typing import Any
 
+from minisweagent.environments.utils.recycling import (
+    FINGERPRINT_SCRIPT,
+    PristineState,
+    RecycledContainer,
+    get_changed_files_script,
+    get_new_changes,
+    get_remove_added_script,
+    get_reset_script,
+    parse_changes,
+    parse_duration,
+    put_recycled_container,
+    take_recycled_container,
+)
+from minisweagent.environments.utils.shell_session import ShellSession
 from minisweagent.utils.log import get_logger
 
 
@@ -28,6 +45,21 @@ class DockerEnvironmentConfig:
     """Additional arguments to pass to the docker/container executable."""
     container_timeout: str = "2h"
     """Max duration to keep container running. Uses the same format as the sleep command."""
+    session: bool = False
+    """Run all commands in one long-lived shell per container instead of a new `docker exec` per command.
+    `forward_env` is read when the shell is started.
+    """
+    session_subshell: bool = True
+    """Run every command of the session in a subshell, so that directory and environment variable changes
+    don't persist (the same semantics as a new `docker exec` per command).
+    """
+    recycle: bool = False
+    """Instead of removing the container in `cleanup`, reset it to its original state and hand it to the next
+    environment with the same image and container settings (see `minisweagent.environments.utils.recycling`).
+    `cwd` must be a git repository. Containers that fail the verification after the reset are removed.
+    """
+    recycle_max_idle: int = 4
+    """Maximum number of reset containers that are kept for the same image."""
 
 
 class DockerEnvironment:
@@ -37,8 +69,27 @@ class DockerEnvironment:
         """
         self.logger = get_logger("minisweagent.environment")
         self.container_id: str | None = None
+        self.session: ShellSession | None = None
         self.config = config_class(**kwargs)
-        self._start_container()
+        self.pristine: PristineState | None = None
+        """State right after the container was started (only when recycling)."""
+        self.started_at = time.time()
+        if not self.config.recycle:
+            self._start_container()
+        elif recycled := take_recycled_container(
+            self._get_recycle_key(),
+            lifetime=parse_duration(self.config.container_timeout),
+            min_remaining=parse_duration(self.config.container_timeout) / 2,
+        ):
+            self.logger.info(f"Reusing container {recycled.container_id}")
+            self.container_id, self.pristine, self.started_at = (
+                recycled.container_id,
+                recycled.pristine,
+                recycled.started_at,
+            )
+        else:
+            self._start_container()
+            self.pristine = self._capture_pristine()
 
     def get_template_vars(self) -> dict[str, Any]:
         return asdict(self.config)
@@ -70,17 +121,34 @@ class DockerEnvironment:
         self.logger.info(f"Started container {container_name} with ID {result.stdout.strip()}")
         self.container_id = result.stdout.strip()
 
+    def _get_env(self) -> dict[str, str]:
+        """Forwarded host variables, overridden by `env`."""
+        env = {key: value for key in self.config.forward_env if (value := os.getenv(key)) is not None}
+        return env | self.config.env
+
+    def _get_env_args(self) -> list[str]:
+        return [arg for key, value in self._get_env().items() for arg in ["-e", f"{key}={value}"]]
+
+    def _get_session(self) -> ShellSession:
+        if self.session is None:
+            assert self.container_id, "Container not started"
+            argv = [self.config.executable, "exec", "-i", "-w", self.config.cwd, *self._get_env_args()]
+            self.session = ShellSession([*argv, self.container_id, "bash", "-l"])
+        return self.session
+
     def execute(self, command: str, cwd: str = "") -> dict[str, Any]:
         """Execute a command in the Docker container and return the result as a dict."""
         cwd = cwd or self.config.cwd
         assert self.container_id, "Container not started"
+        if self.config.session:
+            return self._get_session().run(
+                command, cwd=cwd, timeout=self.config.timeout, subshell=self.config.session_subshell
+            )
+        return self._exec(command, cwd)
 
-        cmd = [self.config.executable, "exec", "-w", cwd]
-        for key in self.config.forward_env:
-            if (value := os.getenv(key)) is not None:
-                cmd.extend(["-e", f"{key}={value}"])
-        for key, value in self.config.env.items():
-            cmd.extend(["-e", f"{key}={value}"])
+    def _exec(self, command: str, cwd: str) -> dict[str, Any]:
+        """Execute a command with a new `docker exec`."""
+        cmd = [self.config.executable, "exec", "-w", cwd, *self._get_env_args()]
         cmd.extend([self.container_id, "bash", "-lc", command])
 
         result = subprocess.run(
@@ -94,12 +162,104 @@ class DockerEnvironment:
         )
         return {"output": result.stdout, "returncode": result.returncode}
 
+    # ---- Recycling ----
+
+    def _get_recycle_key(self) -> tuple:
+        """Containers are only handed to environments with the same key."""
+        return (
+            type(self).__name__,
+            self.config.executable,
+            getattr(self.config, "socket", ""),
+            self.config.image,
+            tuple(self.config.run_args),
+            self.config.cwd,
+            self.config.container_timeout,
+        )
+
+    def _get_changes(self) -> set[str]:
+        """Changes of the container's writable layer (lines of `docker diff`)."""
+        result = subprocess.run(
+            [self.config.executable, "diff", self.container_id],  # type: ignore[list-item]
+            capture_output=True,
+            text=True,
+            timeout=60,
+            check=True,
+        )
+        return parse_changes(result.stdout)
+
+    def _capture_pristine(self) -> PristineState | None:
+        result = self._exec(FINGERPRINT_SCRIPT.format(cwd=shlex.quote(self.config.cwd)), self.config.cwd)
+        if result["returncode"] != 0:
+            self.logger.warning(f"Not recycling container: {self.config.cwd} is not a git repository")
+            return None
+        return PristineState(
+            head=result["output"].split("\n", 1)[0].strip(),
+            fingerprint=result["output"],
+            changes=self._get_changes(),
+        )
+
+    def reset(self) -> bool:
+        """Reset the container to its original state and verify it. Returns False if that wasn't possible."""
+        if self.pristine is None or self.container_id is None:
+            return False
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        cwd = self.config.cwd
+        try:
+            if self._exec(get_reset_script(cwd, self.pristine), cwd)["returncode"] != 0:
+                return self._reject("git reset failed")
+            changes = get_new_changes(self._get_changes(), self.pristine, cwd)
+            if changes["D"]:
+                return self._reject(f"files were deleted: {changes['D'][:5]}")
+            if changes["A"]:
+                self._exec(get_remove_added_script(changes["A"]), "/")
+            if changed_files := self._exec(get_changed_files_script(changes["C"]), "/")["output"].split():
+                return self._reject(f"files were changed: {changed_files[:5]}")
+            if self._exec(FINGERPRINT_SCRIPT.format(cwd=shlex.quote(cwd)), cwd)["output"] != self.pristine.fingerprint:
+                return self._reject("git state differs after the reset")
+            if (remaining := get_new_changes(self._get_changes(), self.pristine, cwd))["A"] or remaining["D"]:
+                return self._reject(f"files remain after the reset: {(remaining['A'] + remaining['D'])[:5]}")
+        except (subprocess.SubprocessError, OSError, RuntimeError) as e:
+            return self._reject(str(e))
+        return True
+
+    def _reject(self, reason: str) -> bool:
+        self.logger.info(f"Not recycling container {self.container_id}: {reason}")
+        return False
+
+    def _recycle(self) -> bool:
+        """Reset the container and park it for the next environment."""
+        if sys.is_finalizing() or not self.reset():
+            return False
+        container = RecycledContainer(
+            container_id=self.container_id,  # type: ignore[arg-type]
+            pristine=self.pristine,  # type: ignore[arg-type]
+            started_at=self.started_at,
+            cleanup=partial(self._remove_container, self.container_id),  # type: ignore[arg-type]
+        )
+        if not put_recycled_container(self._get_recycle_key(), container, max_idle=self.config.recycle_max_idle):
+            return False
+        self.logger.info(f"Recycled container {self.container_id}")
+        return True
+
+    # ---- Cleanup ----
+
+    def _remove_container(self, container_id: str) -> None:
+        self.logger.info(f"Stopping container {container_id}")
+        cmd = f"(timeout 60 {self.config.executable} stop {container_id} || {self.config.executable} rm -f {container_id}) >/dev/null 2>&1 &"
+        subprocess.Popen(cmd, shell=True)
+
     def cleanup(self):
-        """Stop and remove the Docker container."""
-        if getattr(self, "container_id", None) is not None:  # if init fails early, container_id might not be set
-            self.logger.info(f"Stopping container {self.container_id}")
-            cmd = f"(timeout 60 {self.config.executable} stop {self.container_id} || {self.config.executable} rm -f {self.container_id}) >/dev/null 2>&1 &"
-            subprocess.Popen(cmd, shell=True)
+        """Stop and remove the Docker container (or reset and park it when recycling)."""
+        if getattr(self, "session", None) is not None:
+            self.session.close()  # type: ignore
+            self.session = None
+        if getattr(self, "container_id", None) is None:  # if init fails early, container_id might not be set
+            return
+        if not (self.config.recycle and self._recycle()):
+            self._remove_container(self.container_id)  # type: ignore[arg-type]
+        self.container_id = None
 
     def __del__(self):
         """Cleanup container when object is destroyed."""
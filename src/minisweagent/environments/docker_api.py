@@ -0,0 +1,73 @@
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Any
+
+from minisweagent.environments.docker import DockerEnvironment, DockerEnvironmentConfig
+from minisweagent.environments.utils.docker_client import DockerAPIError, get_docker_client, translate_run_args
+
+
+@dataclass
+class DockerAPIEnvironmentConfig(DockerEnvironmentConfig):
+    socket: str = os.getenv("MSWEA_DOCKER_SOCKET", "/var/run/docker.sock")
+    """Path to the docker daemon socket (podman: `$XDG_RUNTIME_DIR/podman/podman.sock`).
+    `executable` is only used to start the shell for `session: true`.
+    """
+    pull_timeout: int = 600
+    """Timeout for pulling the image if it isn't available locally."""
+
+
+class DockerAPIEnvironment(DockerEnvironment):
+    def __init__(self, *, config_class: type = DockerAPIEnvironmentConfig, **kwargs):
+        """Like `DockerEnvironment`, but talks to the Docker Engine API over the unix socket
+        instead of starting a `docker` CLI process for every command.
+        `run_args` are translated into the container create request; unsupported options raise a `ValueError`.
+        See `DockerAPIEnvironmentConfig` for keyword arguments.
+        """
+        super().__init__(config_class=config_class, **kwargs)
+
+    def _start_container(self):
+        """Create and start the container (pulling the image if necessary)."""
+        self.client = get_docker_client(self.config.socket)
+        container_name = f"minisweagent-{uuid.uuid4().hex[:8]}"
+        body = translate_run_args(self.config.run_args)
+        platform = body.pop("_platform", "")
+        body |= {"Image": self.config.image, "Cmd": ["sleep", self.config.container_timeout]}
+        body.setdefault("WorkingDir", self.config.cwd)
+        self.logger.debug(f"Creating container {container_name} with {body}")
+        try:
+            container_id = self.client.create_container(body, name=container_name, platform=platform)
+        except DockerAPIError as e:
+            if e.status_code != 404:
+                raise
+            self.logger.info(f"Pulling image {self.config.image}")
+            self.client.pull_image(self.config.image, timeout=self.config.pull_timeout)
+            container_id = self.client.create_container(body, name=container_name, platform=platform)
+        try:
+            self.client.start_container(container_id)
+        except DockerAPIError:
+            self.client.remove_container(container_id)
+            raise
+        self.logger.info(f"Started container {container_name} with ID {container_id}")
+        self.container_id = container_id
+
+    def _exec(self, command: str, cwd: str) -> dict[str, Any]:
+        """Execute a command with a new exec instance."""
+        return self.client.exec_run(
+            self.container_id,  # type: ignore[arg-type]
+            ["bash", "-lc", command],
+            workdir=cwd,
+            env=self._get_env(),
+            timeout=self.config.timeout,
+        )
+
+    def _get_changes(self) -> set[str]:
+        return self.client.container_changes(self.container_id)  # type: ignore[arg-type]
+
+    def _remove_container(self, container_id: str) -> None:
+        """`sleep` ignores SIGTERM, so we kill the container right away instead of stopping it first."""
+        self.logger.info(f"Removing container {container_id}")
+        try:
+            self.client.remove_container(container_id)
+        except Exception as e:
+            self.logger.warning(f"Failed to remove container {container_id}: {e}")
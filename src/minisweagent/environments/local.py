@@ -4,12 +4,22 @@ import subprocess
 from dataclasses import asdict, dataclass, field
 from typing import Any
 
+from minisweagent.environments.utils.shell_session import get_shell_pool
+
+_POOL_SHELL = ["bash", "--noprofile", "--norc"]
+
 
 @dataclass
 class LocalEnvironmentConfig:
     cwd: str = ""
     env: dict[str, str] = field(default_factory=dict)
     timeout: int = 30
+    shell_pool_size: int = 0
+    """Run commands in warm bash processes (shared by all local environments) instead of starting
+    a new shell per command. Up to this many idle shells are kept (0: disabled). Every command runs
+    in a subshell with its own cwd and `env`. Changes to `os.environ` after the shells were started
+    are not seen by the commands.
+    """
 
 
 class LocalEnvironment:
@@ -20,6 +30,9 @@ class LocalEnvironment:
     def execute(self, command: str, cwd: str = ""):
         """Execute a command in the local environment and return the result as a dict."""
         cwd = cwd or self.config.cwd or os.getcwd()
+        if self.config.shell_pool_size > 0:
+            with get_shell_pool(_POOL_SHELL, self.config.shell_pool_size).session() as session:
+                return session.run(command, cwd=cwd, env=self.config.env, timeout=self.config.timeout)
         result = subprocess.run(
             command,
             shell=True,
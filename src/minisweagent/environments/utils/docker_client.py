@@ -0,0 +1,296 @@
+"""Minimal client for the Docker Engine API over the unix socket.
+
+Talking to the daemon directly avoids starting a `docker` CLI process (and a new daemon connection)
+for every `exec`, `run` and `rm`. All environments using the same socket share one `httpx.Client`
+with a pool of keep-alive connections (see `get_docker_client`).
+
+Only the endpoints needed by `DockerAPIEnvironment` are implemented. See
+https://docs.docker.com/reference/api/engine/ for the API reference.
+"""
+
+import json
+import re
+import subprocess
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import httpx
+
+
+class DockerAPIError(RuntimeError):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Docker API error {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+def demux(chunks: Iterable[bytes]) -> Iterator[tuple[int, bytes]]:
+    """Split a multiplexed exec/attach stream (8 byte header: stream type, 3 zero bytes, big endian
+    payload size) into `(stream, payload)` frames (stream 1: stdout, 2: stderr). Frames can be split across chunks arbitrarily.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= 8:
+            size = int.from_bytes(buffer[4:8], "big")
+            if len(buffer) < 8 + size:
+                break
+            yield buffer[0], bytes(buffer[8 : 8 + size])
+            del buffer[: 8 + size]
+    if buffer:
+        raise DockerAPIError(0, f"Truncated stream ({len(buffer)} bytes left)")
+
+
+def _split_image(image: str) -> tuple[str, str]:
+    """Split an image reference into name and tag (or digest) for pulling."""
+    if "@" in image:
+        return tuple(image.split("@", 1))  # type: ignore[return-value]
+    name, _, tag = image.rpartition(":")
+    if not name or "/" in tag:  # no tag, or the colon belongs to a registry port
+        return image, "latest"
+    return name, tag
+
+
+class DockerClient:
+    def __init__(self, socket: str = "/var/run/docker.sock", *, max_connections: int = 100):
+        """Args:
+        socket: Path to the docker daemon socket (podman: `$XDG_RUNTIME_DIR/podman/podman.sock`).
+        max_connections: Size of the connection pool. Running execs occupy a connection each.
+        """
+        self.socket = socket
+        self.client = httpx.Client(
+            transport=httpx.HTTPTransport(uds=socket),
+            base_url="http://docker",
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(60.0),
+        )
+
+    def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        response = self.client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise DockerAPIError(response.status_code, self._get_message(response))
+        return response
+
+    @staticmethod
+    def _get_message(response: httpx.Response) -> str:
+        try:
+            return response.json().get("message", response.text)
+        except ValueError:
+            return response.text
+
+    def ping(self) -> bool:
+        try:
+            return self.client.get("/_ping", timeout=5).text == "OK"
+        except httpx.TransportError:
+            return False
+
+    # ---- Images ----
+
+    def pull_image(self, image: str, *, timeout: float = 600) -> None:
+        name, tag = _split_image(image)
+        params = {"fromImage": name, "tag": tag}
+        with self.client.stream("POST", "/images/create", params=params, timeout=timeout) as response:
+            if response.status_code >= 400:
+                response.read()
+                raise DockerAPIError(response.status_code, self._get_message(response))
+            for line in response.iter_lines():  # errors are reported in the progress stream
+                if line.strip() and "error" in (progress := json.loads(line)):
+                    raise DockerAPIError(500, progress["error"])
+
+    def image_exists(self, image: str) -> bool:
+        try:
+            self._request("GET", f"/images/{image}/json")
+        except DockerAPIError as e:
+            if e.status_code == 404:
+                return False
+            raise
+        return True
+
+    # ---- Containers ----
+
+    def create_container(self, body: dict[str, Any], *, name: str = "", platform: str = "") -> str:
+        """Create a container (see the API reference for `body`) and return its ID."""
+        params = {k: v for k, v in {"name": name, "platform": platform}.items() if v}
+        return self._request("POST", "/containers/create", params=params, json=body).json()["Id"]
+
+    def start_container(self, container_id: str) -> None:
+        self._request("POST", f"/containers/{container_id}/start")
+
+    def stop_container(self, container_id: str, *, timeout: int = 10) -> None:
+        self._request("POST", f"/containers/{container_id}/stop", params={"t": timeout}, timeout=timeout + 30)
+
+    def remove_container(self, container_id: str, *, force: bool = True) -> None:
+        """Remove a container (killing it first if `force`). Missing containers are ignored."""
+        try:
+            self._request("DELETE", f"/containers/{container_id}", params={"force": str(force).lower()})
+        except DockerAPIError as e:
+            if e.status_code != 404:
+                raise
+
+    def container_changes(self, container_id: str) -> set[str]:
+        """Changes of the container's writable layer in the format of `docker diff` (e.g., `A /tmp/file`)."""
+        changes = self._request("GET", f"/containers/{container_id}/changes").json() or []
+        return {f"{'CAD'[change['Kind']]} {change['Path']}" for change in changes}
+
+    def list_containers(self, *, labels: dict[str, str] | None = None, all: bool = True) -> list[dict[str, Any]]:
+        """List containers, optionally only those with all of the given labels (empty value: any value)."""
+        params: dict[str, str] = {"all": str(all).lower()}
+        if labels:
+            label_filters = [f"{k}={v}" if v else k for k, v in labels.items()]
+            params["filters"] = json.dumps({"label": label_filters})
+        return self._request("GET", "/containers/json", params=params).json()
+
+    # ---- Exec ----
+
+    def exec_run(
+        self,
+        container_id: str,
+        cmd: list[str],
+        *,
+        workdir: str = "",
+        env: dict[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
+        """Run a command in a container and return its output (stdout and stderr merged in
+        order of arrival) and exit code, like `docker exec` with `stderr=subprocess.STDOUT`.
+
+        Raises:
+            subprocess.TimeoutExpired: With the output so far (the process in the container keeps running,
+                just like when killing a `docker exec` client).
+        """
+        body: dict[str, Any] = {"AttachStdout": True, "AttachStderr": True, "Cmd": cmd}
+        if workdir:
+            body["WorkingDir"] = workdir
+        if env:
+            body["Env"] = [f"{k}={v}" for k, v in env.items()]
+        exec_id = self._request("POST", f"/containers/{container_id}/exec", json=body).json()["Id"]
+        output = bytearray()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            with self.client.stream(
+                "POST",
+                f"/exec/{exec_id}/start",
+                json={"Detach": False, "Tty": False},
+                timeout=httpx.Timeout(60.0, read=timeout),
+            ) as response:
+                if response.status_code >= 400:
+                    response.read()
+                    raise DockerAPIError(response.status_code, self._get_message(response))
+                for _, payload in demux(response.iter_raw()):
+                    output += payload
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise subprocess.TimeoutExpired(cmd, timeout or 0, output=bytes(output))
+        except httpx.ReadTimeout:
+            raise subprocess.TimeoutExpired(cmd, timeout or 0, output=bytes(output))
+        returncode = self._request("GET", f"/exec/{exec_id}/json").json()["ExitCode"]
+        return {"output": output.decode("utf-8", errors="replace"), "returncode": returncode}
+
+    def close(self) -> None:
+        self.client.close()
+
+
+_DOCKER_CLIENTS: dict[str, DockerClient] = {}
+_DOCKER_CLIENTS_LOCK = threading.Lock()
+
+
+def get_docker_client(socket: str = "/var/run/docker.sock") -> DockerClient:
+    """Clients (and their connection pools) are shared by everything using the same socket."""
+    with _DOCKER_CLIENTS_LOCK:
+        if (client := _DOCKER_CLIENTS.get(socket)) is None:
+            client = _DOCKER_CLIENTS[socket] = DockerClient(socket)
+        return client
+
+
+# ---- Translation of `docker run` arguments ----
+
+_MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def _parse_memory(value: str) -> int:
+    if not (match := re.fullmatch(r"(\d+(?:\.\d+)?)\s*([bkmg]?)b?", value.strip().lower())):
+        raise ValueError(f"Invalid memory size: {value!r}")
+    return int(float(match.group(1)) * _MEMORY_UNITS[match.group(2)])
+
+
+def _split_key_value(value: str) -> tuple[str, str]:
+    key, _, val = value.partition("=")
+    return key, val
+
+
+def _add_tmpfs(body: dict[str, Any], value: str) -> None:
+    path, _, options = value.partition(":")
+    body["HostConfig"].setdefault("Tmpfs", {})[path] = options
+
+
+# Options without a value and options with a value, and how to apply them to the create request
+_FLAG_OPTIONS = {
+    "--rm": lambda body: body["HostConfig"].__setitem__("AutoRemove", True),
+    "--privileged": lambda body: body["HostConfig"].__setitem__("Privileged", True),
+    "--init": lambda body: body["HostConfig"].__setitem__("Init", True),
+    "--read-only": lambda body: body["HostConfig"].__setitem__("ReadonlyRootfs", True),
+}
+_VALUE_OPTIONS = {
+    "--env": lambda body, v: body["Env"].append(v),
+    "--label": lambda body, v: body["Labels"].__setitem__(*_split_key_value(v)),
+    "--volume": lambda body, v: body["HostConfig"].setdefault("Binds", []).append(v),
+    "--network": lambda body, v: body["HostConfig"].__setitem__("NetworkMode", v),
+    "--memory": lambda body, v: body["HostConfig"].__setitem__("Memory", _parse_memory(v)),
+    "--memory-swap": lambda body, v: body["HostConfig"].__setitem__("MemorySwap", _parse_memory(v)),
+    "--shm-size": lambda body, v: body["HostConfig"].__setitem__("ShmSize", _parse_memory(v)),
+    "--cpus": lambda body, v: body["HostConfig"].__setitem__("NanoCpus", int(float(v) * 1e9)),
+    "--cpuset-cpus": lambda body, v: body["HostConfig"].__setitem__("CpusetCpus", v),
+    "--pids-limit": lambda body, v: body["HostConfig"].__setitem__("PidsLimit", int(v)),
+    "--add-host": lambda body, v: body["HostConfig"].setdefault("ExtraHosts", []).append(v),
+    "--cap-add": lambda body, v: body["HostConfig"].setdefault("CapAdd", []).append(v),
+    "--cap-drop": lambda body, v: body["HostConfig"].setdefault("CapDrop", []).append(v),
+    "--security-opt": lambda body, v: body["HostConfig"].setdefault("SecurityOpt", []).append(v),
+    "--tmpfs": _add_tmpfs,
+    "--user": lambda body, v: body.__setitem__("User", v),
+    "--hostname": lambda body, v: body.__setitem__("Hostname", v),
+    "--entrypoint": lambda body, v: body.__setitem__("Entrypoint", [v] if v else [""]),
+    "--platform": lambda body, v: body.__setitem__("_platform", v),
+}
+_ALIASES = {
+    "-e": "--env",
+    "-l": "--label",
+    "-v": "--volume",
+    "--net": "--network",
+    "-m": "--memory",
+    "-u": "--user",
+    "-h": "--hostname",
+}
+
+
+def translate_run_args(run_args: list[str]) -> dict[str, Any]:
+    """Translate `docker run` arguments into (parts of) a container create request.
+
+    The result has the keys `Env`, `Labels`, `HostConfig` and everything else the options set.
+    The platform (not part of the request body) is returned as `_platform`.
+
+    Raises:
+        ValueError: For options that are not supported.
+    """
+    body: dict[str, Any] = {"Env": [], "Labels": {}, "HostConfig": {}}
+    args = list(run_args)
+    while args:
+        arg = args.pop(0)
+        option, has_value, value = arg.partition("=") if arg.startswith("--") else (arg, False, "")
+        option = _ALIASES.get(option, option)
+        if option in _FLAG_OPTIONS and not has_value:
+            _FLAG_OPTIONS[option](body)
+        elif option in _VALUE_OPTIONS:
+            if not has_value:
+                if not args:
+                    raise ValueError(f"Missing value for docker run option {arg!r}")
+                value = args.pop(0)
+            _VALUE_OPTIONS[option](body, value)
+        else:
+            supported = sorted([*_FLAG_OPTIONS, *_VALUE_OPTIONS, *_ALIASES])
+            msg = (
+                f"docker run option {arg!r} is not supported by the docker API backend "
+                f"(supported: {', '.join(supported)}). Use the docker CLI environment (environment_class: docker) instead."
+            )
+            raise ValueError(msg)
+    return body
@@ -0,0 +1,149 @@
+"""Reuse containers across environments with the same image instead of creating a new one every time.
+
+When a recycling environment is cleaned up, its container is reset to the state it had right
+after it was started, verified, and parked. The next environment with the same image and container
+settings takes it instead of starting a new container.
+
+Reset:
+
+1. Kill all processes in the container (except PID 1, the `sleep` that keeps it alive).
+2. `git reset --hard` to the original commit and `git clean -fd` the working directory,
+   and remove ignored files that weren't there originally.
+3. Remove files that were added outside of the working directory. The changes are taken from the
+   container's writable layer (`docker diff`), compared to the changes right after the start.
+
+Verification: the git state (HEAD, refs, stashes, status including ignored files) must be identical to the
+original state, and the writable layer must not contain any other changes outside of the working
+directory (apart from directories whose entries were added and removed). Otherwise the container is
+removed, so state never leaks into the next run.
+"""
+
+import atexit
+import re
+import shlex
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+FINGERPRINT_SCRIPT = (
+    "cd {cwd} && git rev-parse HEAD && git show-ref --head && git stash list "
+    "&& git status --porcelain=v1 --ignored --untracked-files=normal"
+)
+"""Prints the git state of the working directory that must be identical before and after a reset."""
+
+
+@dataclass
+class PristineState:
+    """State of a container right after it was started."""
+
+    head: str
+    fingerprint: str
+    """Output of `FINGERPRINT_SCRIPT`."""
+    changes: set[str] = field(default_factory=set)
+    """Lines of `docker diff` (e.g., `A /tmp/file`)."""
+
+
+@dataclass
+class RecycledContainer:
+    container_id: str
+    pristine: PristineState
+    started_at: float
+    """`time.time()` when the container was started (its `sleep` runs out eventually)."""
+    cleanup: Callable[[], None]
+    """Removes the container."""
+
+
+def get_reset_script(cwd: str, pristine: PristineState) -> str:
+    """Kill all processes, reset the git working directory and remove ignored files that weren't there originally."""
+    original_ignored = "\n".join(line[3:] for line in pristine.fingerprint.splitlines() if line.startswith("!! "))
+    return f"""kill -9 -1 2>/dev/null
+cd {shlex.quote(cwd)} || exit 1
+git reset -q --hard {shlex.quote(pristine.head)} && git clean -q -ffd && git stash clear || exit 1
+git status --porcelain=v1 --ignored --untracked-files=normal | sed -n 's/^!! //p' \\
+    | grep -vxF -f <(printf '%s\\n' {shlex.quote(original_ignored)}) \\
+    | while IFS= read -r path; do rm -rf -- "$path"; done
+true
+"""
+
+
+def parse_changes(output: str) -> set[str]:
+    return {line.strip() for line in output.splitlines() if re.match(r"^[ACD] /", line.strip())}
+
+
+def _is_within(path: str, directory: str) -> bool:
+    directory = directory.rstrip("/") or "/"
+    return directory == "/" or path == directory or path.startswith(directory + "/")
+
+
+def get_new_changes(changes: set[str], pristine: PristineState, cwd: str) -> dict[str, list[str]]:
+    """Changes of the writable layer since the start outside of the working directory, by kind (A, C, D)."""
+    result: dict[str, list[str]] = {"A": [], "C": [], "D": []}
+    for line in sorted(changes - pristine.changes):
+        kind, path = line.split(" ", 1)
+        if not _is_within(path, cwd):
+            result[kind].append(path)
+    return result
+
+
+def get_remove_added_script(added: list[str]) -> str:
+    """Remove added paths (only the top-most ones, their children are removed with them)."""
+    top_most = [p for p in added if not any(p != q and _is_within(p, q) for q in added)]
+    return "rm -rf -- " + " ".join(shlex.quote(p) for p in top_most) if top_most else "true"
+
+
+def get_changed_files_script(changed: list[str]) -> str:
+    """Print the changed paths that are not directories (changed directories are fine, e.g., entries added and removed)."""
+    paths = " ".join(shlex.quote(p) for p in changed)
+    return f'for p in {paths}; do [ -d "$p" ] || echo "$p"; done' if changed else "true"
+
+
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> float:
+    """Parse a duration in the format of the `sleep` command (e.g., `2h`, `30m`, `3600`)."""
+    if not (match := re.fullmatch(r"(\d+(?:\.\d+)?)([smhd]?)", value.strip())):
+        raise ValueError(f"Invalid duration: {value!r}")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+_RECYCLED_CONTAINERS: dict[tuple, list[RecycledContainer]] = {}
+_RECYCLED_CONTAINERS_LOCK = threading.Lock()
+
+
+def take_recycled_container(
+    key: tuple, *, min_remaining: float = 0.0, lifetime: float = float("inf")
+) -> RecycledContainer | None:
+    """Take a parked container for `key` that has at least `min_remaining` seconds of its `lifetime` left.
+    Containers that are too old are removed.
+    """
+    while True:
+        with _RECYCLED_CONTAINERS_LOCK:
+            containers = _RECYCLED_CONTAINERS.get(key, [])
+            if not containers:
+                return None
+            container = containers.pop()
+        if lifetime - (time.time() - container.started_at) >= min_remaining:
+            return container
+        container.cleanup()
+
+
+def put_recycled_container(key: tuple, container: RecycledContainer, *, max_idle: int) -> bool:
+    """Park a container. Returns False if there are already `max_idle` parked containers for `key`."""
+    with _RECYCLED_CONTAINERS_LOCK:
+        containers = _RECYCLED_CONTAINERS.setdefault(key, [])
+        if len(containers) >= max_idle:
+            return False
+        containers.append(container)
+        return True
+
+
+@atexit.register
+def remove_recycled_containers() -> None:
+    """Remove all parked containers (called on exit)."""
+    with _RECYCLED_CONTAINERS_LOCK:
+        containers = [c for cs in _RECYCLED_CONTAINERS.values() for c in cs]
+        _RECYCLED_CONTAINERS.clear()
+    for container in containers:
+        container.cleanup()
@@ -0,0 +1,250 @@
+"""Run many commands in one long-lived bash process.
+
+Starting a new process per command (`docker exec`, `bash -c`, ...) costs a process spawn, a
+round trip to the container runtime and the shell startup (sourcing profile files) for every
+single step. A `ShellSession` starts the shell once and sends commands over its stdin.
+
+Protocol: every command is sent as a quoted heredoc (so it can contain anything, including
+heredocs of its own) that is read into a variable and `eval`ed with stdin redirected from
+`/dev/null` and stderr merged into stdout. Afterwards the shell prints a sentinel with a random
+id and the exit code. Everything before the sentinel is the output of the command.
+
+If the command doesn't finish within the timeout, the shell is killed and a new one is started for
+the next command. The same happens if the shell itself dies (e.g., `exit` in a command that doesn't run
+in a subshell).
+
+`ShellPool` keeps warm shells for local commands. Run `python -m minisweagent.environments.utils.shell_session`
+for a benchmark against a new shell per command.
+"""
+
+import os
+import queue
+import re
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class ShellSession:
+    def __init__(self, argv: list[str], *, cwd: str | None = None, env: dict[str, str] | None = None):
+        """Args:
+        argv: Command that starts a bash reading commands from stdin, e.g., `["bash", "-l"]` or
+            `["docker", "exec", "-i", container_id, "bash", "-l"]`.
+        cwd: Working directory of the shell process (on the host).
+        env: Environment of the shell process (on the host). Defaults to the environment of this process.
+        """
+        self.argv = argv
+        self.cwd = cwd
+        self.env = env
+        self.process: subprocess.Popen | None = None
+        self.n_restarts = 0
+        """Number of times the shell had to be restarted (after timeouts or when it died)."""
+        self._chunks: queue.Queue[bytes | None] = queue.Queue()
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> None:
+        self._chunks = queue.Queue()
+        self.process = subprocess.Popen(
+            self.argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=self.cwd,
+            env=self.env,
+            start_new_session=True,
+        )
+        threading.Thread(target=self._read, args=(self.process, self._chunks), daemon=True).start()
+        self._wait_until_ready()
+
+    def _wait_until_ready(self) -> None:
+        """Discard everything the shell prints on startup (e.g., from profile files)."""
+        assert self.process is not None and self.process.stdin is not None
+        marker = f"MSWEA_{uuid.uuid4().hex}"
+        buffer = bytearray()
+        try:
+            self.process.stdin.write(f"printf '%s\\n' '{marker}'\n".encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            pass
+        while (marker.encode() + b"\n") not in buffer:
+            if (chunk := self._chunks.get()) is None:
+                output = buffer.decode("utf-8", errors="replace")
+                raise RuntimeError(f"Shell {shlex.join(self.argv)} exited on startup: {output}")
+            buffer += chunk
+
+    @staticmethod
+    def _read(process: subprocess.Popen, chunks: "queue.Queue[bytes | None]") -> None:
+        assert process.stdout is not None
+        try:
+            while chunk := os.read(process.stdout.fileno(), 65536):
+                chunks.put(chunk)
+        except (OSError, ValueError):
+            pass  # closed by `close` while we were reading
+        chunks.put(None)
+
+    def close(self) -> None:
+        """Kill the shell (and everything it started on the host)."""
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, 9)
+            except (ProcessLookupError, PermissionError):
+                self.process.kill()
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout):
+            if pipe is not None:
+                pipe.close()
+        self.process = None
+
+    def _discard(self) -> None:
+        """Kill the shell after a timeout or collect the dead shell. The next command starts a new one."""
+        self.close()
+        self.n_restarts += 1
+
+    @staticmethod
+    def _get_script(command: str, *, cwd: str, env: dict[str, str], subshell: bool, marker: str) -> str:
+        exports = "".join(f"export {key}={shlex.quote(value)}; " for key, value in env.items())
+        body = (
+            f'cd {shlex.quote(cwd)} && {{ {exports}eval "$__mswea_command"; }}'
+            if cwd
+            else f'{exports}eval "$__mswea_command"'
+        )
+        group = f"( {body}\n)" if subshell else f"{{ {body}\n}}"
+        return (
+            f"IFS= read -r -d '' __mswea_command <<'{marker}'\n{command}\n{marker}\n"
+            f"{group} </dev/null 2>&1\n"
+            f"printf '%s %d\\n' '{marker}' \"$?\"\n"
+        )
+
+    def run(
+        self,
+        command: str,
+        *,
+        cwd: str = "",
+        env: dict[str, str] | None = None,
+        timeout: float | None = None,
+        subshell: bool = True,
+    ) -> dict[str, str | int]:
+        """Run a command and return its output and exit code (like `subprocess.run` with merged stderr).
+
+        Args:
+            cwd: Directory to run the command in (inside the shell).
+            env: Variables to export for this command.
+            subshell: Run the command in a subshell, so that directory and variable changes don't persist.
+
+        Raises:
+            subprocess.TimeoutExpired: With the output so far. The shell is killed.
+        """
+        with self._lock:
+            if self.process is not None and not self.alive:
+                self._discard()
+            if self.process is None:
+                self.start()
+            assert self.process is not None and self.process.stdin is not None
+            marker = f"MSWEA_{uuid.uuid4().hex}"
+            script = self._get_script(command, cwd=cwd, env=env or {}, subshell=subshell, marker=marker)
+            try:
+                self.process.stdin.write(script.encode())
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                pass  # the shell died, we'll see EOF below
+            return self._collect(command, marker, timeout)
+
+    def _collect(self, command: str, marker: str, timeout: float | None) -> dict[str, str | int]:
+        pattern = re.compile(re.escape(marker.encode()) + rb" (\d+)\n")
+        buffer = bytearray()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                chunk = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                self._discard()
+                raise subprocess.TimeoutExpired(command, timeout or 0, output=bytes(buffer))
+            if chunk is None:  # the shell died
+                assert self.process is not None
+                returncode = self.process.wait()
+                self._discard()
+                return {"output": buffer.decode("utf-8", errors="replace"), "returncode": returncode}
+            buffer += chunk
+            if match := pattern.search(buffer, max(0, len(buffer) - len(chunk) - len(marker) - 8)):
+                output = buffer[: match.start()].decode("utf-8", errors="replace")
+                return {"output": output, "returncode": int(match.group(1))}
+
+
+class ShellPool:
+    def __init__(self, argv: list[str], *, size: int):
+        """Keeps up to `size` idle shells warm. Sessions are handed out exclusively, so
+        commands of different threads never share a shell at the same time.
+        """
+        self.argv = argv
+        self.size = size
+        self._idle: list[ShellSession] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self) -> Iterator[ShellSession]:
+        with self._lock:
+            session = self._idle.pop() if self._idle else None
+        if session is None:
+            session = ShellSession(self.argv)
+        try:
+            yield session
+        finally:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(session)
+                    session = None
+            if session is not None:
+                session.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+
+_SHELL_POOLS: dict[tuple[str, ...], ShellPool] = {}
+_SHELL_POOLS_LOCK = threading.Lock()
+
+
+def get_shell_pool(argv: list[str], size: int) -> ShellPool:
+    """Pools are shared by all environments with the same shell command. `size` is only used when the pool is created."""
+    with _SHELL_POOLS_LOCK:
+        if (pool := _SHELL_POOLS.get(tuple(argv))) is None:
+            pool = _SHELL_POOLS[tuple(argv)] = ShellPool(argv, size=size)
+        return pool
+
+
+def benchmark(n_commands: int = 200, command: str = "grep -c def /dev/null; sed -n 1p /dev/null") -> dict[str, float]:
+    """Mean seconds per command of `LocalEnvironment` with and without a shell pool."""
+    from minisweagent.environments.local import LocalEnvironment
+
+    results = {}
+    for name, env in [
+        ("subprocess", LocalEnvironment()),
+        ("shell_pool", LocalEnvironment(shell_pool_size=1)),
+    ]:
+        env.execute("true")  # warm up
+        start = time.perf_counter()
+        for _ in range(n_commands):
+            env.execute(command)
+        results[name] = (time.perf_counter() - start) / n_commands
+    return results
+
+
+if __name__ == "__main__":
+    for name, seconds in benchmark().items():
+        print(f"{name:>12}: {seconds * 1000:.2f}ms per command")
@@ -2,41 +2,160 @@
 You can ignore this file completely if you explicitly set your model in your run script.
 """
 
+import asyncio
 import copy
 import os
 import threading
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
 
 from minisweagent import Model
+from minisweagent.models.utils.metrics import MetricsExporter, MetricsRegistry
+from minisweagent.models.utils.usage import TokenUsage
+
+
+@dataclass
+class BudgetReservation:
+    cost: float
+    """Estimated cost that is held back from the global budget until the call is done."""
 
 
 class GlobalModelStats:
-    """Global model statistics tracker with optional limits."""
+    """Global model statistics tracker with optional limits.
+
+    Models reserve an estimated cost before each query (`reserve`/`areserve`) and the reservation
+    is released once the call is done and its real cost was added. New queries wait while the spent
+    plus the reserved cost would exceed the limit, and are refused if that is still the case once
+    all outstanding calls are done. This keeps parallel workers from overshooting the limit.
+    """
 
     def __init__(self):
         self._cost = 0.0
         self._n_calls = 0
+        self._usage = TokenUsage()
+        self._reserved_cost = 0.0
+        self._n_reserved = 0
         self._lock = threading.Lock()
+        self._budget_changed = threading.Condition(self._lock)
+        self.metrics = MetricsRegistry()
+        """Latency histograms, error/retry counts and tokens per model name, API key slot and thread."""
         self.cost_limit = float(os.getenv("MSWEA_GLOBAL_COST_LIMIT", "0"))
         self.call_limit = int(os.getenv("MSWEA_GLOBAL_CALL_LIMIT", "0"))
         if (self.cost_limit > 0 or self.call_limit > 0) and not os.getenv("MSWEA_SILENT_STARTUP"):
             print(f"Global cost/call limit: ${self.cost_limit:.4f} / {self.call_limit}")
 
-    def add(self, cost: float) -> None:
-        """Add a model call with its cost, checking limits."""
+    def add(
+        self,
+        cost: float,
+        usage: TokenUsage | None = None,
+        *,
+        model_name: str = "",
+        latency: float | None = None,
+        key_slot: str = "",
+    ) -> None:
+        """Add a model call with its cost (and token usage/latency for the metrics), checking limits."""
+        self.metrics.record_call(model_name, latency=latency, cost=cost, usage=usage, key_slot=key_slot)
         with self._lock:
             self._cost += cost
             self._n_calls += 1
-        if 0 < self.cost_limit < self._cost or 0 < self.call_limit < self._n_calls + 1:
-            raise RuntimeError(f"Global cost/call limit exceeded: ${self._cost:.4f} / {self._n_calls + 1}")
+            if usage is not None:
+                self._usage += usage
+            if 0 < self.cost_limit < self._cost or 0 < self.call_limit < self._n_calls + 1:
+                raise RuntimeError(f"Global cost/call limit exceeded: ${self._cost:.4f} / {self._n_calls + 1}")
+
+    @property
+    def expected_completion_tokens(self) -> int:
+        """Average number of completion tokens per call so far (used to estimate the cost of a query)."""
+        if not self._usage.completion_tokens:
+            return 1000
+        return self._usage.completion_tokens // max(self._n_calls, 1)
+
+    def _fits(self, estimated_cost: float) -> bool:
+        if 0 < self.cost_limit < self._cost + self._reserved_cost + estimated_cost:
+            return False
+        return not (0 < self.call_limit <= self._n_calls + self._n_reserved)
+
+    def _try_reserve(self, estimated_cost: float) -> BudgetReservation | None:
+        """Reserve the budget if it fits. Must be called with the lock held.
+        Returns None if the reservation has to wait for outstanding calls and raises if it can never fit.
+        """
+        if not self._fits(estimated_cost):
+            if self._n_reserved == 0:
+                raise RuntimeError(
+                    f"Global cost/call limit exceeded: ${self._cost:.4f} spent + ${estimated_cost:.4f} estimated"
+                    f" / {self._n_calls + 1} calls"
+                )
+            return None
+        self._reserved_cost += estimated_cost
+        self._n_reserved += 1
+        return BudgetReservation(cost=estimated_cost)
+
+    def _release(self, reservation: BudgetReservation) -> None:
+        with self._lock:
+            self._reserved_cost -= reservation.cost
+            self._n_reserved -= 1
+            self._budget_changed.notify_all()
+
+    @contextmanager
+    def reserve(self, estimated_cost: float = 0.0) -> Iterator[BudgetReservation]:
+        """Hold back the estimated cost of a model call (and the call itself) from the global limits.
+        Blocks while outstanding calls might still free up budget and raises `RuntimeError` if the
+        call doesn't fit.
+        """
+        with self._lock:
+            while (reservation := self._try_reserve(estimated_cost)) is None:
+                self._budget_changed.wait()
+        try:
+            yield reservation
+        finally:
+            self._release(reservation)
+
+    @asynccontextmanager
+    async def areserve(self, estimated_cost: float = 0.0) -> AsyncIterator[BudgetReservation]:
+        """Like `reserve`, but waits without blocking the event loop."""
+        while True:
+            with self._lock:
+                reservation = self._try_reserve(estimated_cost)
+            if reservation is not None:
+                break
+            await asyncio.sleep(0.05)
+        try:
+            yield reservation
+        finally:
+            self._release(reservation)
+
+    def add_error(self, *, model_name: str = "", retried: bool = False, key_slot: str = "") -> None:
+        """Record a failed attempt of a model call."""
+        self.metrics.record_error(model_name, retried=retried, key_slot=key_slot)
+
+    def start_metrics_export(self, output_dir: Path, interval: float | None = None) -> MetricsExporter:
+        """Periodically write `metrics.prom` and `metrics.json` to `output_dir`.
+        Call `stop()` on the returned exporter to write the final metrics.
+        """
+        if interval is None:
+            interval = float(os.getenv("MSWEA_METRICS_INTERVAL", "30"))
+        return MetricsExporter(self.metrics, output_dir, interval=interval).start()
 
     @property
     def cost(self) -> float:
         return self._cost
 
+    @property
+    def reserved_cost(self) -> float:
+        """Estimated cost of the calls that are currently in flight."""
+        return self._reserved_cost
+
     @property
     def n_calls(self) -> int:
         return self._n_calls
 
+    @property
+    def usage(self) -> dict[str, int]:
+        """Total token usage of the run."""
+        return self._usage.to_dict()
+
 
 GLOBAL_MODEL_STATS = GlobalModelStats()
 
@@ -54,7 +173,28 @@ def get_model(input_model_name: str | None = None, config: dict | None = None) -
         config["model_kwargs"] = {}
     if from_env := os.getenv("MSWEA_MODEL_API_KEY"):
         config["model_kwargs"]["api_key"] = from_env
-    return get_model_class(resolved_model_name)(**config)
+    hedging_config = config.pop("hedging", None)
+    scheduling_config = config.pop("scheduler", None)
+    caching_config = config.pop("cache", None)
+    model = get_model_class(resolved_model_name)(**config)
+    if hedging_config:
+        from minisweagent.models.hedging import HedgedModel
+
+        hedging_config = dict(hedging_config)
+        hedge_model = None
+        if (alternate_config := hedging_config.pop("alternate_model", None)) is not None:
+            alternate_config = config | alternate_config
+            hedge_model = get_model(alternate_config["model_name"], alternate_config)
+        model = HedgedModel(model, hedge_model=hedge_model, **hedging_config)
+    if scheduling_config:
+        from minisweagent.models.scheduling import ScheduledModel
+
+        model = ScheduledModel(model, **scheduling_config)
+    if caching_config:
+        from minisweagent.models.caching import CachedModel
+
+        model = CachedModel(model, **caching_config)
+    return model
 
 
 def get_model_name(input_model_name: str | None = None, config: dict | None = None) -> str:
@@ -76,19 +216,19 @@ def get_model_class(model_name: str) -> type:
         from minisweagent.models.anthropic import AnthropicModel
 
         return AnthropicModel
-    
+
     # Check for explicit OpenAI model names
     if any(s in model_name.lower() for s in ["gpt", "openai", "o1"]):
         from minisweagent.models.openai_model import OpenAIModel
 
         return OpenAIModel
-    
+
     # Check if local OpenAI-compatible server is configured
     if os.getenv("OPENAI_API_BASE") and "localhost" in os.getenv("OPENAI_API_BASE", ""):
         from minisweagent.models.openai_model import OpenAIModel
 
         return OpenAIModel
-    
+
     # Check for common local model patterns
     if any(s in model_name.lower() for s in ["qwen", "llama", "mistral", "phi", "gemma", "codestral", "deepseek"]):
         # If local server is configured, use OpenAI model
@@ -96,7 +236,7 @@ def get_model_class(model_name: str) -> type:
             from minisweagent.models.openai_model import OpenAIModel
 
             return OpenAIModel
-    
+
     from minisweagent.models.litellm_model import LitellmModel
 
     return LitellmModel
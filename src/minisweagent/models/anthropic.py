@@ -1,19 +1,28 @@
 import os
+from dataclasses import dataclass
 
-from minisweagent.models.litellm_model import LitellmModel
-from minisweagent.models.utils.cache_control import set_cache_control
-from minisweagent.models.utils.key_per_thread import get_key_per_thread
+from minisweagent.models.litellm_model import LitellmModel, LitellmModelConfig
+from minisweagent.models.utils.key_pool import APIKeyPool, get_key_pool
+from minisweagent.models.utils.prompt_caching import PromptCachingPolicy
+
+
+@dataclass
+class AnthropicModelConfig(LitellmModelConfig):
+    prompt_caching: PromptCachingPolicy = "breakpoints"
+    """Always place cache control breakpoints (also for model names that `auto` doesn't recognize)."""
 
 
 class AnthropicModel(LitellmModel):
     """For the use of anthropic models, we need to add explicit cache control marks
-    to the messages or we lose out on the benefits of the cache.
-    Because break points are limited per key, we also need to rotate between different keys
-    if running with multiple agents in parallel threads.
+    to the messages or we lose out on the benefits of the cache (see `LitellmModel.prompt_cache`).
+    Because break points are limited per key, we also need to distribute parallel agents over
+    different keys (from `api_keys` or the `ANTHROPIC_API_KEYS` environment variable, separated by `::`).
     """
 
-    def query(self, messages: list[dict], **kwargs) -> dict:
-        api_key = None
-        if rotating_keys := os.getenv("ANTHROPIC_API_KEYS"):
-            api_key = get_key_per_thread(rotating_keys.split("::"))
-        return super().query(set_cache_control(messages), api_key=api_key, **kwargs)
+    def __init__(self, *, config_class: type = AnthropicModelConfig, **kwargs):
+        super().__init__(config_class=config_class, **kwargs)
+
+    def _get_key_pool(self) -> APIKeyPool | None:
+        if not self.config.api_keys and (rotating_keys := os.getenv("ANTHROPIC_API_KEYS")):
+            return get_key_pool(rotating_keys.split("::"))
+        return super()._get_key_pool()
@@ -0,0 +1,117 @@
+"""Client for OpenAI-style batch APIs.
+
+Batch endpoints are much cheaper than regular requests, but results can take hours. The protocol:
+
+1. Upload the requests as a JSONL file (`POST /files` with `purpose=batch`), one line per request:
+   `{"custom_id": ..., "method": "POST", "url": "/v1/chat/completions", "body": {...}}`
+2. Create the batch (`POST /batches`) and poll it (`GET /batches/{id}`) until it is done.
+3. Download the output (and error) file (`GET /files/{id}/content`), one JSONL line per request:
+   `{"custom_id": ..., "response": {"status_code": 200, "body": {...}}, "error": null}`
+
+See `minisweagent.run.extra.utils.batch_runner` for running many agents with batched queries.
+"""
+
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import requests
+
+logger = logging.getLogger("batch")
+
+
+@dataclass
+class BatchClientConfig:
+    base_url: str = "https://api.openai.com/v1"
+    api_key: str = ""
+    """Defaults to `OPENAI_API_KEY`."""
+    poll_interval: float = 30.0
+    """Seconds between status requests while waiting for a batch."""
+    completion_window: str = "24h"
+    timeout: int = 120
+    """Timeout of the HTTP requests (not of the batch)."""
+
+
+class BatchError(Exception):
+    """Raised if a batch or one of its requests failed."""
+
+
+_FAILED_STATUSES = {"failed", "expired", "cancelled"}
+
+
+class BatchClient:
+    def __init__(self, **kwargs):
+        self.config = BatchClientConfig(**kwargs)
+        if not self.config.api_key:
+            self.config.api_key = os.getenv("OPENAI_API_KEY", "")
+        self.config.base_url = self.config.base_url.rstrip("/")
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = requests.request(
+            method,
+            f"{self.config.base_url}{path}",
+            headers={"Authorization": f"Bearer {self.config.api_key}"},
+            timeout=self.config.timeout,
+            **kwargs,
+        )
+        if not response.ok:
+            raise BatchError(f"{method} {path} failed with {response.status_code}: {response.text}")
+        return response
+
+    def submit(self, bodies: dict[str, dict[str, Any]]) -> str:
+        """Submit chat completion request bodies (by custom id) and return the id of the batch."""
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+            for custom_id, body in bodies.items()
+        ]
+        file = self._request(
+            "POST", "/files", files={"file": ("batch.jsonl", "\n".join(lines).encode())}, data={"purpose": "batch"}
+        ).json()
+        batch = self._request(
+            "POST",
+            "/batches",
+            json={
+                "input_file_id": file["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": self.config.completion_window,
+            },
+        ).json()
+        logger.info(f"Submitted batch {batch['id']} with {len(bodies)} requests")
+        return batch["id"]
+
+    def poll(self, batch_id: str) -> dict[str, Any]:
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def wait(self, batch_id: str) -> dict[str, Any]:
+        """Poll until the batch is done and return it."""
+        while True:
+            batch = self.poll(batch_id)
+            if batch["status"] == "completed":
+                return batch
+            if batch["status"] in _FAILED_STATUSES:
+                raise BatchError(f"Batch {batch_id} {batch['status']}: {batch.get('errors')}")
+            time.sleep(self.config.poll_interval)
+
+    def fetch(self, batch: dict[str, Any]) -> dict[str, dict[str, Any] | BatchError]:
+        """Return the response body (or a `BatchError`) for every custom id of a completed batch."""
+        results: dict[str, dict[str, Any] | BatchError] = {}
+        for file_key in ["output_file_id", "error_file_id"]:
+            if not (file_id := batch.get(file_key)):
+                continue
+            for line in self._request("GET", f"/files/{file_id}/content").text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code", 200) != 200:
+                    results[item["custom_id"]] = BatchError(str(item.get("error") or response.get("body")))
+                else:
+                    results[item["custom_id"]] = response["body"]
+        return results
+
+    def run(self, bodies: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any] | BatchError]:
+        """Submit the requests, wait for the batch and return the results."""
+        return self.fetch(self.wait(self.submit(bodies)))
@@ -0,0 +1,127 @@
+"""Persistent cache of model responses.
+
+Reruns of a config (e.g., after a crash or when sweeping an unrelated setting) send many
+byte-identical prompts. With caching enabled, responses are looked up by a hash of the model
+name, the model kwargs and the messages before querying the model. Cache hits cost nothing
+and are not counted in `GLOBAL_MODEL_STATS`. Only use this with deterministic sampling
+(e.g., temperature 0), otherwise reruns will replay the first sampled response.
+
+Enable it by adding a `cache` section to the model config, e.g.
+
+```yaml
+model:
+  model_name: ...
+  cache:
+    mode: read_write  # or read_only, record_only
+    path: /path/to/cache.sqlite  # optional
+```
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Literal
+
+from minisweagent import Model, global_config_dir
+from minisweagent.models.utils.response_cache import get_response_cache
+from minisweagent.models.utils.usage import strip_extra
+
+logger = logging.getLogger("caching")
+
+_UNCACHED_MODEL_KWARGS = {"api_key", "api_base", "base_url", "timeout"}
+"""Model kwargs that don't change the response and are excluded from the cache key."""
+
+
+@dataclass
+class CachingConfig:
+    mode: Literal["read_write", "read_only", "record_only"] = "read_write"
+    """read_write: look up and store responses. read_only: only look up (never write).
+    record_only: always query the model and store (overwrite) the responses.
+    """
+    path: str = ""
+    """Path of the SQLite database. Defaults to `response_cache.sqlite` in the global config directory."""
+    max_size_mb: float = 1024.0
+    """Least recently used responses are evicted once the cache exceeds this size."""
+
+
+def get_cache_key(model_name: str, model_kwargs: dict[str, Any], messages: list[dict], **kwargs) -> str:
+    data = {
+        "model_name": model_name,
+        "model_kwargs": {k: v for k, v in model_kwargs.items() if k not in _UNCACHED_MODEL_KWARGS},
+        "messages": strip_extra(messages),
+        "kwargs": kwargs,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class CachedModel:
+    def __init__(self, model: Model, **kwargs):
+        """Wraps a model and caches its responses on disk. See `CachingConfig` for keyword arguments."""
+        self.model = model
+        self.config = model.config
+        self.caching_config = CachingConfig(**kwargs)
+        path = Path(self.caching_config.path or global_config_dir / "response_cache.sqlite")
+        self.cache = get_response_cache(
+            path,
+            max_size_bytes=int(self.caching_config.max_size_mb * 1024**2),
+            read_only=self.caching_config.mode == "read_only",
+        )
+        self.n_calls = 0
+        """Number of queries, including cache hits (so that step limits still apply)."""
+        self.n_cache_hits = 0
+        self.n_cache_misses = 0
+
+    @property
+    def cost(self) -> float:
+        return self.model.cost
+
+    def _get_key(self, messages: list[dict], **kwargs) -> str:
+        model_kwargs = getattr(self.config, "model_kwargs", {}) or {}
+        return get_cache_key(self.config.model_name, model_kwargs, messages, **kwargs)
+
+    def _lookup(self, key: str) -> dict | None:
+        if self.caching_config.mode == "record_only" or (cached := self.cache.get(key)) is None:
+            return None
+        self.n_calls += 1
+        self.n_cache_hits += 1
+        return json.loads(cached) | {"extra": {"cache_hit": True}}
+
+    def _store(self, key: str, response: dict) -> None:
+        self.n_calls += 1
+        self.n_cache_misses += 1
+        if self.caching_config.mode != "read_only":
+            self.cache.put(key, json.dumps({k: v for k, v in response.items() if k != "extra"}))
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        key = self._get_key(messages, **kwargs)
+        if (cached := self._lookup(key)) is not None:
+            return cached
+        response = self.model.query(messages, **kwargs)
+        self._store(key, response)
+        return response
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        key = self._get_key(messages, **kwargs)
+        if (cached := self._lookup(key)) is not None:
+            return cached
+        response = await self.model.aquery(messages, **kwargs)
+        self._store(key, response)
+        return response
+
+    def get_cache_stats(self) -> dict[str, Any]:
+        n_lookups = self.n_cache_hits + self.n_cache_misses
+        return {
+            "cache_hits": self.n_cache_hits,
+            "cache_misses": self.n_cache_misses,
+            "cache_hit_rate": self.n_cache_hits / n_lookups if n_lookups else 0.0,
+        }
+
+    def get_template_vars(self) -> dict[str, Any]:
+        return (
+            self.model.get_template_vars()
+            | asdict(self.caching_config)
+            | self.get_cache_stats()
+            | {"n_model_calls": self.n_calls, "model_cost": self.cost}
+        )
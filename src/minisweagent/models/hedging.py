@@ -0,0 +1,177 @@
+"""Hedged requests to cut the latency tail of model calls.
+
+If a query has not returned after the `percentile`-th percentile of the latencies observed so far
+for this model, a duplicate request is sent (to the same model or to an alternate one, e.g.,
+with a different endpoint/key). The first successful response wins. Python cannot interrupt a
+running request, so the losing request is abandoned: its response is discarded, but its cost
+is still counted by the model that made it (and hence in `GLOBAL_MODEL_STATS`).
+With `aquery`, the losing request is cancelled instead.
+
+Enable it by adding a `hedging` section to the model config, e.g.
+
+```yaml
+model:
+  model_name: ...
+  hedging:
+    percentile: 95
+    alternate_model:  # optional, overrides for the model config of the duplicate request
+      api_keys: [...]
+```
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from minisweagent import Model
+from minisweagent.models.utils.latency import LatencyTracker
+
+logger = logging.getLogger("hedging")
+
+
+_LATENCY_TRACKERS: dict[str, LatencyTracker] = {}
+_LATENCY_TRACKERS_LOCK = threading.Lock()
+
+
+def get_latency_tracker(model_name: str, window: int = 200) -> LatencyTracker:
+    """Latencies are learned per model name and shared between all agents."""
+    with _LATENCY_TRACKERS_LOCK:
+        if (tracker := _LATENCY_TRACKERS.get(model_name)) is None:
+            tracker = _LATENCY_TRACKERS[model_name] = LatencyTracker(window)
+        return tracker
+
+
+@dataclass
+class HedgingConfig:
+    percentile: float = 95.0
+    """Send the duplicate request once the query has taken longer than this latency percentile."""
+    min_samples: int = 20
+    """Don't hedge before this many latencies have been observed for the model."""
+    min_delay: float = 1.0
+    """Never hedge earlier than this many seconds after the first request."""
+    window: int = 200
+    """Number of recent latencies to learn the percentile from."""
+
+
+class HedgedModel:
+    def __init__(self, model: Model, *, hedge_model: Model | None = None, **kwargs):
+        """Wraps a model and sends a duplicate request if a query takes unusually long.
+        See `HedgingConfig` for keyword arguments.
+
+        Args:
+            model: The model to wrap.
+            hedge_model: Model for the duplicate requests. Defaults to `model`.
+        """
+        self.model = model
+        self.hedge_model = hedge_model or model
+        self.config = model.config
+        self.hedging_config = HedgingConfig(**kwargs)
+        self.latencies = get_latency_tracker(model.config.model_name, self.hedging_config.window)
+        self.n_calls = 0
+        self.n_hedged = 0
+        """Number of queries for which a duplicate request was sent."""
+        self.n_hedge_wins = 0
+        """Number of queries that were answered by the duplicate request."""
+
+    @property
+    def cost(self) -> float:
+        """Includes the cost of abandoned requests."""
+        if self.hedge_model is self.model:
+            return self.model.cost
+        return self.model.cost + self.hedge_model.cost
+
+    def get_hedge_delay(self) -> float | None:
+        """Seconds after which to send the duplicate request or None if we shouldn't hedge."""
+        if len(self.latencies) < self.hedging_config.min_samples:
+            return None
+        return max(self.hedging_config.min_delay, self.latencies.percentile(self.hedging_config.percentile) or 0.0)
+
+    def _start(self, model: Model, label: str, results: queue.Queue, messages: list[dict], **kwargs) -> None:
+        def run():
+            start = time.perf_counter()
+            try:
+                response = model.query(messages, **kwargs)
+            except Exception as e:
+                results.put((label, None, e))
+                return
+            self.latencies.add(time.perf_counter() - start)
+            results.put((label, response, None))
+
+        threading.Thread(target=run, daemon=True, name=f"{threading.current_thread().name}-{label}").start()
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        delay = self.get_hedge_delay()
+        results: queue.Queue = queue.Queue()
+        self._start(self.model, "primary", results, messages, **kwargs)
+        n_outstanding = 1
+        try:
+            label, response, exception = results.get(timeout=delay)
+        except queue.Empty:
+            logger.debug(f"Hedging request after {delay:.1f}s")
+            self.n_hedged += 1
+            self._start(self.hedge_model, "hedge", results, messages, **kwargs)
+            n_outstanding += 1
+            label, response, exception = results.get()
+        n_outstanding -= 1
+        if exception is not None and n_outstanding:
+            # The first request failed, but the other one might still succeed
+            label, response, other_exception = results.get()
+            if other_exception is not None:
+                raise exception
+        elif exception is not None:
+            raise exception
+        if label == "hedge":
+            self.n_hedge_wins += 1
+        self.n_calls += 1
+        return response
+
+    async def _atimed_query(self, model: Model, messages: list[dict], **kwargs) -> dict:
+        start = time.perf_counter()
+        response = await model.aquery(messages, **kwargs)
+        self.latencies.add(time.perf_counter() - start)
+        return response
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        delay = self.get_hedge_delay()
+        labels = {asyncio.create_task(self._atimed_query(self.model, messages, **kwargs)): "primary"}
+        done, _ = await asyncio.wait(labels, timeout=delay)
+        if not done:
+            logger.debug(f"Hedging request after {delay:.1f}s")
+            self.n_hedged += 1
+            labels[asyncio.create_task(self._atimed_query(self.hedge_model, messages, **kwargs))] = "hedge"
+        pending = set(labels)
+        first_exception: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if (exception := task.exception()) is not None:
+                    first_exception = first_exception or exception
+                    continue
+                for other in pending:
+                    other.cancel()
+                if labels[task] == "hedge":
+                    self.n_hedge_wins += 1
+                self.n_calls += 1
+                return task.result()
+        assert first_exception is not None
+        raise first_exception
+
+    def get_hedge_stats(self) -> dict[str, Any]:
+        return {
+            "n_hedged": self.n_hedged,
+            "n_hedge_wins": self.n_hedge_wins,
+            "hedge_rate": self.n_hedged / self.n_calls if self.n_calls else 0.0,
+            "hedge_win_rate": self.n_hedge_wins / self.n_hedged if self.n_hedged else 0.0,
+        }
+
+    def get_template_vars(self) -> dict[str, Any]:
+        return (
+            self.model.get_template_vars()
+            | asdict(self.hedging_config)
+            | self.get_hedge_stats()
+            | {"n_model_calls": self.n_calls, "model_cost": self.cost}
+        )
@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import time
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from typing import Any
@@ -15,6 +16,10 @@ from tenacity import (
 )
 
 from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.utils.cache_control import CacheControlStrategy
+from minisweagent.models.utils.key_pool import APIKeyPool, get_key_pool
+from minisweagent.models.utils.prompt_caching import PromptCache, PromptCachingPolicy
+from minisweagent.models.utils.usage import TokenUsage, estimate_prompt_tokens, strip_extra
 
 logger = logging.getLogger("litellm_model")
 
@@ -24,50 +29,172 @@ class LitellmModelConfig:
     model_name: str
     model_kwargs: dict[str, Any] = field(default_factory=dict)
     litellm_model_registry: Path | str | None = os.getenv("LITELLM_MODEL_REGISTRY_PATH")
+    api_keys: list[str] = field(default_factory=list)
+    """If set, parallel agents are distributed over these keys (see `minisweagent.models.utils.key_pool`)."""
+    prompt_caching: PromptCachingPolicy = "auto"
+    """How to mark messages for the prompt cache of the provider (see `minisweagent.models.utils.prompt_caching`)."""
+    cache_control_strategy: CacheControlStrategy = "last_user"
+    """Where to place cache control breakpoints. See `CacheControlManager`."""
+    cache_control_breakpoints: int = 2
+    """Number of cache control breakpoints (anthropic allows at most 4 per request)."""
+    prompt_cache_min_tokens: int = 4096
+    """Minimum (estimated) size of a prefix that is worth caching with the `prefix` policy (e.g., Gemini)."""
+
+
+_NON_RETRYABLE_EXCEPTIONS = (
+    litellm.exceptions.UnsupportedParamsError,
+    litellm.exceptions.NotFoundError,
+    litellm.exceptions.PermissionDeniedError,
+    litellm.exceptions.ContextWindowExceededError,
+    litellm.exceptions.APIError,
+    litellm.exceptions.AuthenticationError,
+    KeyboardInterrupt,
+)
+
+_AUTHENTICATION_HINT = " You can permanently set your API key with `mini-extra config set KEY VALUE`."
+
+_RETRY_KWARGS = dict(
+    stop=stop_after_attempt(10),
+    wait=wait_exponential(multiplier=1, min=4, max=60),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    retry=retry_if_not_exception_type(_NON_RETRYABLE_EXCEPTIONS),
+)
 
 
 class LitellmModel:
-    def __init__(self, **kwargs):
-        self.config = LitellmModelConfig(**kwargs)
+    def __init__(self, *, config_class: type = LitellmModelConfig, **kwargs):
+        self.config = config_class(**kwargs)
         self.cost = 0.0
         self.n_calls = 0
+        self.prompt_cache = PromptCache(
+            self.config.prompt_caching,
+            self.config.model_name,
+            strategy=self.config.cache_control_strategy,
+            n_breakpoints=self.config.cache_control_breakpoints,
+            min_prefix_tokens=self.config.prompt_cache_min_tokens,
+        )
         if self.config.litellm_model_registry and Path(self.config.litellm_model_registry).is_file():
             litellm.utils.register_model(json.loads(Path(self.config.litellm_model_registry).read_text()))
 
-    @retry(
-        stop=stop_after_attempt(10),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
-        before_sleep=before_sleep_log(logger, logging.WARNING),
-        retry=retry_if_not_exception_type(
-            (
-                litellm.exceptions.UnsupportedParamsError,
-                litellm.exceptions.NotFoundError,
-                litellm.exceptions.PermissionDeniedError,
-                litellm.exceptions.ContextWindowExceededError,
-                litellm.exceptions.APIError,
-                litellm.exceptions.AuthenticationError,
-                KeyboardInterrupt,
-            )
-        ),
-    )
+    @retry(**_RETRY_KWARGS)
     def _query(self, messages: list[dict[str, str]], **kwargs):
+        try:
+            return self._query_with_key_pool(messages, **kwargs)
+        except Exception as e:
+            self._record_error(e)
+            raise
+
+    @retry(**_RETRY_KWARGS)
+    async def _aquery(self, messages: list[dict[str, str]], **kwargs):
+        try:
+            return await self._aquery_with_key_pool(messages, **kwargs)
+        except Exception as e:
+            self._record_error(e)
+            raise
+
+    def _record_error(self, exception: BaseException) -> None:
+        GLOBAL_MODEL_STATS.add_error(
+            model_name=self.config.model_name,
+            retried=not isinstance(exception, _NON_RETRYABLE_EXCEPTIONS),
+            key_slot=self._get_key_slot(),
+        )
+
+    def _query_with_key_pool(self, messages: list[dict[str, str]], **kwargs):
+        if (pool := self._get_key_pool()) is None:
+            return self._completion(messages, **kwargs)
+        with pool.lease(self) as api_key:
+            try:
+                return self._completion(messages, **(kwargs | {"api_key": api_key or None}))
+            except litellm.exceptions.RateLimitError:
+                pool.record_rate_limit(api_key)
+                raise
+
+    async def _aquery_with_key_pool(self, messages: list[dict[str, str]], **kwargs):
+        if (pool := self._get_key_pool()) is None:
+            return await self._acompletion(messages, **kwargs)
+        with pool.lease(self) as api_key:
+            try:
+                return await self._acompletion(messages, **(kwargs | {"api_key": api_key or None}))
+            except litellm.exceptions.RateLimitError:
+                pool.record_rate_limit(api_key)
+                raise
+
+    def _completion(self, messages: list[dict[str, str]], **kwargs):
         try:
             return litellm.completion(
                 model=self.config.model_name, messages=messages, **(self.config.model_kwargs | kwargs)
             )
         except litellm.exceptions.AuthenticationError as e:
-            e.message += " You can permanently set your API key with `mini-extra config set KEY VALUE`."
+            e.message += _AUTHENTICATION_HINT
             raise e
 
+    async def _acompletion(self, messages: list[dict[str, str]], **kwargs):
+        try:
+            return await litellm.acompletion(
+                model=self.config.model_name, messages=messages, **(self.config.model_kwargs | kwargs)
+            )
+        except litellm.exceptions.AuthenticationError as e:
+            e.message += _AUTHENTICATION_HINT
+            raise e
+
+    def _get_key_pool(self) -> APIKeyPool | None:
+        if self.config.api_keys:
+            return get_key_pool(self.config.api_keys)
+        return None
+
+    def _get_key_slot(self) -> str:
+        if (pool := self._get_key_pool()) is None:
+            return ""
+        return str(pool.get_slot(pool.get_key(self)))
+
+    def _estimate_cost(self, messages: list[dict[str, str]]) -> float:
+        """Cost to reserve from the global budget before a query (only needed if there is a global cost limit)."""
+        if GLOBAL_MODEL_STATS.cost_limit <= 0:
+            return 0.0
+        try:
+            prompt_cost, completion_cost = litellm.cost_per_token(
+                model=self.config.model_name,
+                prompt_tokens=estimate_prompt_tokens(messages),
+                completion_tokens=GLOBAL_MODEL_STATS.expected_completion_tokens,
+            )
+        except Exception:  # unknown model
+            return 0.0
+        return prompt_cost + completion_cost
+
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
-        response = self._query(messages, **kwargs)
+        messages = self.prompt_cache.apply(strip_extra(messages))
+        with GLOBAL_MODEL_STATS.reserve(self._estimate_cost(messages)):
+            start = time.perf_counter()
+            response = self._query(messages, **kwargs)
+            return self._process_response(response, latency=time.perf_counter() - start)
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Like `query`, but doesn't block a thread while waiting for the response."""
+        messages = self.prompt_cache.apply(strip_extra(messages))
+        async with GLOBAL_MODEL_STATS.areserve(self._estimate_cost(messages)):
+            start = time.perf_counter()
+            response = await self._aquery(messages, **kwargs)
+            return self._process_response(response, latency=time.perf_counter() - start)
+
+    def _process_response(self, response: Any, *, latency: float) -> dict:
+        """Update cost and statistics and convert the response to our format."""
         cost = litellm.cost_calculator.completion_cost(response)
+        usage = TokenUsage.from_litellm(response)
+        if (pool := self._get_key_pool()) is not None:
+            pool.record_cost(pool.get_key(self), cost)
         self.n_calls += 1
         self.cost += cost
-        GLOBAL_MODEL_STATS.add(cost)
+        GLOBAL_MODEL_STATS.add(
+            cost, usage, model_name=self.config.model_name, latency=latency, key_slot=self._get_key_slot()
+        )
         return {
             "content": response.choices[0].message.content or "",  # type: ignore
+            "extra": {"usage": usage.to_dict(), "cost": cost},
         }
 
     def get_template_vars(self) -> dict[str, Any]:
-        return asdict(self.config) | {"n_model_calls": self.n_calls, "model_cost": self.cost}
+        return asdict(self.config) | {
+            "n_model_calls": self.n_calls,
+            "model_cost": self.cost,
+            "prompt_caching_policy": self.prompt_cache.policy,
+        }
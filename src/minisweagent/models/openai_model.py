@@ -1,10 +1,15 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
 import time
+import uuid
+import weakref
 from dataclasses import asdict, dataclass, field
-from typing import Any
+from typing import Any, Literal
 
+import httpx
 import requests
 from tenacity import (
     before_sleep_log,
@@ -15,6 +20,10 @@ from tenacity import (
 )
 
 from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.utils.backend_router import get_backend_router
+from minisweagent.models.utils.key_pool import APIKeyPool, get_key_pool
+from minisweagent.models.utils.serialization import IncrementalRequestEncoder
+from minisweagent.models.utils.usage import TokenUsage, estimate_prompt_tokens, strip_extra
 
 logger = logging.getLogger("openai_model")
 
@@ -29,6 +38,18 @@ class OpenAIModelConfig:
     max_retries: int = 3
     cost_per_1k_input_tokens: float = 0.0
     cost_per_1k_output_tokens: float = 0.0
+    api_keys: list[str] = field(default_factory=list)
+    """If set, parallel agents are distributed over these keys instead of using `api_key`."""
+    base_urls: list[str] = field(default_factory=list)
+    """Several OpenAI-compatible backends to route requests over instead of using `base_url`.
+    Can also be set as a comma-separated list in `OPENAI_API_BASE`.
+    """
+    routing: Literal["prefix", "agent"] = "prefix"
+    """Route by a hash of the conversation prefix or by agent (model instance) when using `base_urls`."""
+    max_in_flight_per_backend: int = 0
+    """Fail over to another backend if the preferred one has this many requests in flight (0: no limit)."""
+    fast_json: bool = False
+    """Serialize request bodies with `orjson` (if installed)."""
 
 
 class OpenAIAPIError(Exception):
@@ -47,6 +68,37 @@ class OpenAIContextLengthError(OpenAIAPIError):
     """Context length exceeded."""
 
 
+class OpenAIServerError(OpenAIAPIError):
+    """Server side error (5xx)."""
+
+
+_NON_RETRYABLE_EXCEPTIONS = (
+    OpenAIAuthenticationError,
+    OpenAIRateLimitError,
+    OpenAIContextLengthError,
+    OpenAIAPIError,
+    KeyboardInterrupt,
+)
+
+_RETRY_KWARGS = dict(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    retry=retry_if_not_exception_type(_NON_RETRYABLE_EXCEPTIONS),
+)
+
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """HTTP client shared by all models in the running event loop (clients can't be shared between loops)."""
+    loop = asyncio.get_running_loop()
+    if (client := _ASYNC_CLIENTS.get(loop)) is None:
+        limits = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+        client = _ASYNC_CLIENTS[loop] = httpx.AsyncClient(limits=limits)
+    return client
+
+
 class OpenAIModel:
     def __init__(self, **kwargs):
         self.config = OpenAIModelConfig(**kwargs)
@@ -59,57 +111,121 @@ class OpenAIModel:
         
         # Override base_url from environment if set
         if base_url_env := os.getenv("OPENAI_API_BASE"):
-            self.config.base_url = base_url_env
+            if "," in base_url_env:
+                self.config.base_urls = [url.strip() for url in base_url_env.split(",") if url.strip()]
+            else:
+                self.config.base_url = base_url_env
         
         # Ensure base_url ends with /v1
-        if not self.config.base_url.endswith("/v1"):
-            self.config.base_url = self.config.base_url.rstrip("/") + "/v1"
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        before_sleep=before_sleep_log(logger, logging.WARNING),
-        retry=retry_if_not_exception_type((
-            OpenAIAuthenticationError,
-            OpenAIRateLimitError,
-            OpenAIContextLengthError,
-            OpenAIAPIError,
-            KeyboardInterrupt,
-        )),
-    )
-    def _make_request(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        self.config.base_url = self._normalize_base_url(self.config.base_url)
+        self.config.base_urls = [self._normalize_base_url(url) for url in self.config.base_urls]
+        self._agent_id = uuid.uuid4().hex
+        self._encoder = IncrementalRequestEncoder(fast=self.config.fast_json)
+
+    @staticmethod
+    def _normalize_base_url(base_url: str) -> str:
+        if not base_url.endswith("/v1"):
+            return base_url.rstrip("/") + "/v1"
+        return base_url
+
+    def _get_routing_key(self, messages: list[dict[str, str]]) -> str:
+        """The system and first user message stay fixed over the whole run of an agent."""
+        if self.config.routing == "agent":
+            return self._agent_id
+        return hashlib.sha256(json.dumps(messages[:2], sort_keys=True).encode()).hexdigest()
+
+    @retry(**_RETRY_KWARGS)
+    def _make_request(self, messages: list[dict[str, str]], *, api_key: str | None = None, **kwargs) -> dict:
         """Make HTTP request to OpenAI-compatible API."""
+        try:
+            return self._route_request(messages, api_key=api_key, **kwargs)
+        except Exception as e:
+            self._record_error(e)
+            raise
+
+    @retry(**_RETRY_KWARGS)
+    async def _amake_request(self, messages: list[dict[str, str]], *, api_key: str | None = None, **kwargs) -> dict:
+        try:
+            return await self._aroute_request(messages, api_key=api_key, **kwargs)
+        except Exception as e:
+            self._record_error(e)
+            raise
+
+    def _record_error(self, exception: BaseException) -> None:
+        GLOBAL_MODEL_STATS.add_error(
+            model_name=self.config.model_name,
+            retried=not isinstance(exception, _NON_RETRYABLE_EXCEPTIONS),
+            key_slot=self._get_key_slot(),
+        )
+
+    def _route_request(self, messages: list[dict[str, str]], *, api_key: str | None = None, **kwargs) -> dict:
+        if not self.config.base_urls:
+            return self._post(self.config.base_url, messages, api_key=api_key, **kwargs)
+        router = get_backend_router(self.config.base_urls, max_in_flight=self.config.max_in_flight_per_backend)
+        with router.lease(self._get_routing_key(messages)) as backend:
+            try:
+                return self._post(backend.url, messages, api_key=api_key, **kwargs)
+            except (requests.ConnectionError, requests.Timeout, OpenAIServerError):
+                router.mark_down(backend)
+                raise
+
+    async def _aroute_request(self, messages: list[dict[str, str]], *, api_key: str | None = None, **kwargs) -> dict:
+        if not self.config.base_urls:
+            return await self._apost(self.config.base_url, messages, api_key=api_key, **kwargs)
+        router = get_backend_router(self.config.base_urls, max_in_flight=self.config.max_in_flight_per_backend)
+        with router.lease(self._get_routing_key(messages)) as backend:
+            try:
+                return await self._apost(backend.url, messages, api_key=api_key, **kwargs)
+            except (httpx.TransportError, OpenAIServerError):
+                router.mark_down(backend)
+                raise
+
+    def _build_request(
+        self, base_url: str, messages: list[dict[str, str]], *, api_key: str | None = None, **kwargs
+    ) -> tuple[str, dict[str, str], bytes]:
+        """Return URL, headers and body of a chat completion request.
+        Only the messages that were added since the last request are serialized.
+        """
         headers = {
-            "Authorization": f"Bearer {self.config.api_key}",
+            "Authorization": f"Bearer {api_key or self.config.api_key}",
             "Content-Type": "application/json",
         }
-        
-        # Prepare request payload
-        payload = {
+        return f"{base_url}/chat/completions", headers, self._encoder.encode(self._get_payload(messages, **kwargs))
+
+    def _get_payload(self, messages: list[dict[str, str]], **kwargs) -> dict[str, Any]:
+        return {
             "model": self.config.model_name,
             "messages": messages,
             **self.config.model_kwargs,
             **kwargs,
         }
-        
-        # Make request
-        response = requests.post(
-            f"{self.config.base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=self.config.timeout,
-        )
-        
-        # Handle HTTP errors
+
+    def _post(self, base_url: str, messages: list[dict[str, str]], *, api_key: str | None = None, **kwargs) -> dict:
+        url, headers, body = self._build_request(base_url, messages, api_key=api_key, **kwargs)
+        response = requests.post(url, headers=headers, data=body, timeout=self.config.timeout)
+        return self._handle_response(response)
+
+    async def _apost(
+        self, base_url: str, messages: list[dict[str, str]], *, api_key: str | None = None, **kwargs
+    ) -> dict:
+        url, headers, body = self._build_request(base_url, messages, api_key=api_key, **kwargs)
+        response = await _get_async_client().post(url, headers=headers, content=body, timeout=self.config.timeout)
+        return self._handle_response(response)
+
+    @staticmethod
+    def _handle_response(response: Any) -> dict:
+        """Raise for HTTP errors and decode the body (works for `requests` and `httpx` responses)."""
         if response.status_code == 401:
             raise OpenAIAuthenticationError(f"Authentication failed: {response.text}")
         elif response.status_code == 429:
             raise OpenAIRateLimitError(f"Rate limit exceeded: {response.text}")
         elif response.status_code == 413 or "context_length_exceeded" in str(response.text):
             raise OpenAIContextLengthError(f"Context length exceeded: {response.text}")
-        elif not response.ok:
+        elif response.status_code >= 500:
+            raise OpenAIServerError(f"API error {response.status_code}: {response.text}")
+        elif response.status_code >= 400:
             raise OpenAIAPIError(f"API error {response.status_code}: {response.text}")
-        
+
         try:
             return response.json()
         except json.JSONDecodeError as e:
@@ -128,27 +244,97 @@ class OpenAIModel:
         output_cost = usage.get("completion_tokens", 0) / 1000 * self.config.cost_per_1k_output_tokens
         return input_cost + output_cost
 
+    def _get_key_pool(self) -> APIKeyPool | None:
+        if self.config.api_keys:
+            return get_key_pool(self.config.api_keys)
+        return None
+
+    def _get_key_slot(self) -> str:
+        if (pool := self._get_key_pool()) is None:
+            return ""
+        return str(pool.get_slot(pool.get_key(self)))
+
+    def _request_with_key_pool(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        if (pool := self._get_key_pool()) is None:
+            return self._make_request(messages, **kwargs)
+        with pool.lease(self) as api_key:
+            try:
+                return self._make_request(messages, api_key=api_key, **kwargs)
+            except OpenAIRateLimitError:
+                pool.record_rate_limit(api_key)
+                raise
+
+    async def _arequest_with_key_pool(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        if (pool := self._get_key_pool()) is None:
+            return await self._amake_request(messages, **kwargs)
+        with pool.lease(self) as api_key:
+            try:
+                return await self._amake_request(messages, api_key=api_key, **kwargs)
+            except OpenAIRateLimitError:
+                pool.record_rate_limit(api_key)
+                raise
+
+    def _estimate_cost(self, messages: list[dict[str, str]]) -> float:
+        """Cost to reserve from the global budget before a query."""
+        prompt_tokens = estimate_prompt_tokens(messages)
+        completion_tokens = GLOBAL_MODEL_STATS.expected_completion_tokens
+        return (
+            prompt_tokens / 1000 * self.config.cost_per_1k_input_tokens
+            + completion_tokens / 1000 * self.config.cost_per_1k_output_tokens
+        )
+
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
         """Query the OpenAI-compatible API and return response."""
-        try:
-            response = self._make_request(messages, **kwargs)
-        except OpenAIAuthenticationError as e:
-            # Add helpful message about setting API key
-            raise OpenAIAuthenticationError(f"{e}. Set OPENAI_API_KEY or use mini-extra config.")
-        
+        messages = strip_extra(messages)
+        with GLOBAL_MODEL_STATS.reserve(self._estimate_cost(messages)):
+            start = time.perf_counter()
+            try:
+                response = self._request_with_key_pool(messages, **kwargs)
+            except OpenAIAuthenticationError as e:
+                # Add helpful message about setting API key
+                raise OpenAIAuthenticationError(f"{e}. Set OPENAI_API_KEY or use mini-extra config.")
+            return self._process_response(response, start=start)
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Like `query`, but doesn't block a thread while waiting for the response."""
+        messages = strip_extra(messages)
+        async with GLOBAL_MODEL_STATS.areserve(self._estimate_cost(messages)):
+            start = time.perf_counter()
+            try:
+                response = await self._arequest_with_key_pool(messages, **kwargs)
+            except OpenAIAuthenticationError as e:
+                raise OpenAIAuthenticationError(f"{e}. Set OPENAI_API_KEY or use mini-extra config.")
+            return self._process_response(response, start=start)
+
+    def _process_response(self, response: dict, *, start: float) -> dict:
+        """Update cost and statistics and convert the response to our format."""
         # Extract content from response
         if "choices" not in response or not response["choices"]:
             raise OpenAIAPIError("No choices in API response")
         
+        latency = time.perf_counter() - start
         content = response["choices"][0].get("message", {}).get("content", "")
         
         # Update statistics
         cost = self._calculate_cost(response)
+        usage = TokenUsage.from_openai(response)
+        if (pool := self._get_key_pool()) is not None:
+            pool.record_cost(pool.get_key(self), cost)
         self.n_calls += 1
         self.cost += cost
-        GLOBAL_MODEL_STATS.add(cost)
+        GLOBAL_MODEL_STATS.add(
+            cost, usage, model_name=self.config.model_name, latency=latency, key_slot=self._get_key_slot()
+        )
         
-        return {"content": content}
+        return {"content": content, "extra": {"usage": usage.to_dict(), "cost": cost}}
+
+    def get_batch_request(self, messages: list[dict[str, str]], **kwargs) -> dict[str, Any]:
+        """Body of a chat completion request for a batch API (see `minisweagent.models.batch`)."""
+        return self._get_payload(strip_extra(messages), **kwargs)
+
+    def process_batch_response(self, response: dict) -> dict:
+        """Like the return value of `query`, for the body of a response from a batch API."""
+        return self._process_response(response, start=time.perf_counter())
 
     def get_template_vars(self) -> dict[str, Any]:
         """Return template variables for configuration."""
@@ -0,0 +1,142 @@
+"""Priority scheduling of model requests across all agents of a run.
+
+When many agents share a limited number of concurrent model requests (rate limits, a local
+inference server), the order in which they are served matters: an agent that is about to submit
+holds a container and a worker, so finishing it first frees more capacity than advancing a new one.
+With scheduling enabled, every query waits for a slot of a global `RequestScheduler` and queued
+queries are served by priority. The queue wait is reported in `response["extra"]["queue_wait"]`
+and in the metrics (`GLOBAL_MODEL_STATS.metrics`).
+
+Enable it by adding a `scheduler` section to the model config, e.g.
+
+```yaml
+model:
+  model_name: ...
+  scheduler:
+    max_concurrent: 16
+    priority: steps  # or fifo, cost, instance_age, container_age, path.to.function
+```
+
+Priority functions take the `ScheduledModel` and return a sort key (lower values are served first).
+The priority is evaluated once, when the query enters the queue.
+"""
+
+import importlib
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from minisweagent import Model
+from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.utils.scheduler import get_request_scheduler
+
+
+@dataclass
+class SchedulingConfig:
+    max_concurrent: int = 0
+    """Maximum number of concurrent model requests of all models that share the scheduler (0: no limit)."""
+    priority: str = "steps"
+    """Name of a priority function (see `_PRIORITY_MAPPING`) or import path of a custom one."""
+    scheduler: str = "default"
+    """Models with the same scheduler name share the queue and the concurrency cap."""
+
+
+def fifo_priority(model: "ScheduledModel") -> float:
+    return 0.0
+
+
+def steps_priority(model: "ScheduledModel") -> float:
+    """Agents that have taken more steps (and are closer to submitting) first."""
+    return -model.n_calls
+
+
+def cost_priority(model: "ScheduledModel") -> float:
+    """Agents that have spent more first (so that their investment isn't wasted by running into limits)."""
+    return -model.cost
+
+
+def instance_age_priority(model: "ScheduledModel") -> float:
+    """Agents of the oldest instances first."""
+    return model.started_at
+
+
+def container_age_priority(model: "ScheduledModel") -> float:
+    """Agents whose container has been running the longest first (falls back to the instance age)."""
+    return model.container_started_at or model.started_at
+
+
+_PRIORITY_MAPPING = {
+    "fifo": "minisweagent.models.scheduling.fifo_priority",
+    "steps": "minisweagent.models.scheduling.steps_priority",
+    "cost": "minisweagent.models.scheduling.cost_priority",
+    "instance_age": "minisweagent.models.scheduling.instance_age_priority",
+    "container_age": "minisweagent.models.scheduling.container_age_priority",
+}
+
+
+def get_priority_function(spec: str) -> Callable[["ScheduledModel"], float]:
+    full_path = _PRIORITY_MAPPING.get(spec, spec)
+    try:
+        module_name, function_name = full_path.rsplit(".", 1)
+        module = importlib.import_module(module_name)
+        return getattr(module, function_name)
+    except (ValueError, ImportError, AttributeError):
+        msg = f"Unknown priority: {spec} (resolved to {full_path}, available: {_PRIORITY_MAPPING})"
+        raise ValueError(msg)
+
+
+class ScheduledModel:
+    def __init__(self, model: Model, **kwargs):
+        """Wraps a model and queues its queries in a global scheduler. See `SchedulingConfig` for keyword arguments."""
+        self.model = model
+        self.config = model.config
+        self.scheduling_config = SchedulingConfig(**kwargs)
+        self.scheduler = get_request_scheduler(
+            self.scheduling_config.scheduler, max_concurrent=self.scheduling_config.max_concurrent
+        )
+        self.priority_function = get_priority_function(self.scheduling_config.priority)
+        self.started_at = time.time()
+        """Creation time of the model (run scripts create one model per instance)."""
+        self.container_started_at: float | None = None
+        """Set by run scripts once the environment of the instance is up."""
+        self.n_calls = 0
+        self.queue_wait = 0.0
+        """Total time that queries of this model waited for a slot (seconds)."""
+
+    @property
+    def cost(self) -> float:
+        return self.model.cost
+
+    def _record_wait(self, response: dict, wait: float) -> dict:
+        self.n_calls += 1
+        self.queue_wait += wait
+        GLOBAL_MODEL_STATS.metrics.record_queue_wait(self.config.model_name, wait)
+        response.setdefault("extra", {})["queue_wait"] = wait
+        return response
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        with self.scheduler.slot(self.priority_function(self)) as wait:
+            response = self.model.query(messages, **kwargs)
+        return self._record_wait(response, wait)
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        async with self.scheduler.aslot(self.priority_function(self)) as wait:
+            response = await self.model.aquery(messages, **kwargs)
+        return self._record_wait(response, wait)
+
+    def get_template_vars(self) -> dict[str, Any]:
+        return (
+            self.model.get_template_vars()
+            | asdict(self.scheduling_config)
+            | {"n_model_calls": self.n_calls, "model_cost": self.cost, "queue_wait": self.queue_wait}
+        )
+
+
+def mark_container_started(model: Model) -> None:
+    """Record the container start for the `container_age` priority (no-op if the model isn't scheduled)."""
+    while model is not None:
+        if isinstance(model, ScheduledModel):
+            model.container_started_at = time.time()
+            return
+        model = getattr(model, "model", None)
@@ -1,6 +1,9 @@
+import asyncio
+import json
 import logging
 import time
 from dataclasses import asdict, dataclass
+from pathlib import Path
 from typing import Any
 
 from minisweagent.models import GLOBAL_MODEL_STATS
@@ -35,8 +38,76 @@ class DeterministicModel:
             return self.query(messages, **kwargs)
         self.n_calls += 1
         self.cost += self.config.cost_per_call
-        GLOBAL_MODEL_STATS.add(self.config.cost_per_call)
+        GLOBAL_MODEL_STATS.add(self.config.cost_per_call, model_name=self.config.model_name)
         return {"content": output}
 
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        output = self.config.outputs[self.current_index + 1]
+        if "/sleep" in output:
+            self.current_index += 1
+            await asyncio.sleep(float(output.split("/sleep")[1]))
+            return await self.aquery(messages, **kwargs)
+        return self.query(messages, **kwargs)
+
+    def get_template_vars(self) -> dict[str, Any]:
+        return asdict(self.config) | {"n_model_calls": self.n_calls, "model_cost": self.cost}
+
+
+@dataclass
+class ReplayModelConfig:
+    trajectory_path: str
+    """Trajectory as written by `save_traj` (or a plain list of messages)."""
+    model_name: str = "replay"
+    check_prefix: bool = False
+    """Raise `ReplayMismatchError` if the messages of a query differ from the recorded ones."""
+
+
+class ReplayMismatchError(Exception):
+    """Raised if a query doesn't match the recorded trajectory."""
+
+
+def _get_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "\n".join(item.get("text", "") for item in content)
+    return content
+
+
+class ReplayModel:
+    def __init__(self, **kwargs):
+        """Returns the assistant messages of a saved trajectory in order (at zero cost)."""
+        self.config = ReplayModelConfig(**kwargs)
+        data = json.loads(Path(self.config.trajectory_path).read_text())
+        self.messages: list[dict] = data["messages"] if isinstance(data, dict) else data
+        self._assistant_indices = [i for i, message in enumerate(self.messages) if message["role"] == "assistant"]
+        self.current_index = -1
+        self.cost = 0.0
+        self.n_calls = 0
+
+    def _check_prefix(self, messages: list[dict], recorded: list[dict]) -> None:
+        for i, (message, recorded_message) in enumerate(zip(messages, recorded)):
+            if (message["role"], _get_text(message["content"])) != (
+                recorded_message["role"],
+                _get_text(recorded_message["content"]),
+            ):
+                raise ReplayMismatchError(f"Message {i} differs from the recorded trajectory")
+        if len(messages) != len(recorded):
+            raise ReplayMismatchError(f"Got {len(messages)} messages, but the recording has {len(recorded)}")
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        self.current_index += 1
+        if self.current_index >= len(self._assistant_indices):
+            raise ReplayMismatchError(
+                f"{self.config.trajectory_path} only has {len(self._assistant_indices)} assistant messages"
+            )
+        idx = self._assistant_indices[self.current_index]
+        if self.config.check_prefix:
+            self._check_prefix(messages, self.messages[:idx])
+        self.n_calls += 1
+        GLOBAL_MODEL_STATS.add(0.0, model_name=self.config.model_name)
+        return {"content": self.messages[idx]["content"]}
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        return self.query(messages, **kwargs)
+
     def get_template_vars(self) -> dict[str, Any]:
         return asdict(self.config) | {"n_model_calls": self.n_calls, "model_cost": self.cost}
@@ -0,0 +1,110 @@
+"""Route requests of many agents over several OpenAI-compatible backends.
+
+Every agent should keep hitting the same backend so that the prefix/KV cache of the server stays
+warm. We use rendezvous hashing on a routing key (a hash of the conversation prefix or an agent id):
+each key has a stable preference order over the backends, and if the preferred backend is down or
+saturated, the request fails over to the least loaded of the remaining backends.
+"""
+
+import hashlib
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from minisweagent.models.utils.latency import LatencyTracker
+
+
+@dataclass
+class BackendState:
+    url: str
+    in_flight: int = 0
+    """Number of requests that are currently waiting for this backend (queue depth)."""
+    n_requests: int = 0
+    n_errors: int = 0
+    down_until: float = 0.0
+    latencies: LatencyTracker = field(default_factory=LatencyTracker)
+
+
+def _score(routing_key: str, url: str) -> int:
+    return int.from_bytes(hashlib.sha256(f"{routing_key}|{url}".encode()).digest()[:8], "big")
+
+
+class BackendRouter:
+    def __init__(self, urls: list[str], *, max_in_flight: int = 0, down_cooldown: float = 30.0):
+        """Args:
+        urls: Base URLs of the backends.
+        max_in_flight: A backend with this many requests in flight counts as saturated (0: no limit).
+        down_cooldown: Seconds for which a backend is avoided after a connection or server error.
+        """
+        if not urls:
+            raise ValueError("BackendRouter needs at least one backend")
+        self.max_in_flight = max_in_flight
+        self.down_cooldown = down_cooldown
+        self._backends = [BackendState(url=url) for url in urls]
+        self._lock = threading.Lock()
+
+    def _is_available(self, backend: BackendState, now: float) -> bool:
+        if backend.down_until > now:
+            return False
+        return not (0 < self.max_in_flight <= backend.in_flight)
+
+    def select(self, routing_key: str) -> BackendState:
+        """Return the preferred backend for the key or the least loaded available one."""
+        now = time.time()
+        with self._lock:
+            preferred = max(self._backends, key=lambda b: _score(routing_key, b.url))
+            if self._is_available(preferred, now):
+                return preferred
+            return min(self._backends, key=lambda b: (not self._is_available(b, now), b.in_flight, b.down_until))
+
+    @contextmanager
+    def lease(self, routing_key: str) -> Iterator[BackendState]:
+        """Context manager that selects a backend and tracks the request."""
+        backend = self.select(routing_key)
+        with self._lock:
+            backend.in_flight += 1
+            backend.n_requests += 1
+        start = time.perf_counter()
+        try:
+            yield backend
+            backend.latencies.add(time.perf_counter() - start)
+        finally:
+            with self._lock:
+                backend.in_flight -= 1
+
+    def mark_down(self, backend: BackendState) -> None:
+        """Avoid the backend for a while (after a connection or server error)."""
+        with self._lock:
+            backend.n_errors += 1
+            backend.down_until = time.time() + self.down_cooldown
+
+    def stats(self) -> list[dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "url": b.url,
+                    "in_flight": b.in_flight,
+                    "n_requests": b.n_requests,
+                    "n_errors": b.n_errors,
+                    "down": b.down_until > now,
+                    "latency_p50": b.latencies.percentile(50),
+                    "latency_p95": b.latencies.percentile(95),
+                }
+                for b in self._backends
+            ]
+
+
+_ROUTERS: dict[tuple[str, ...], BackendRouter] = {}
+_ROUTERS_LOCK = threading.Lock()
+
+
+def get_backend_router(urls: list[str], **kwargs) -> BackendRouter:
+    """Get the router for a list of backends. All models that use the same backends share one router."""
+    with _ROUTERS_LOCK:
+        if (router := _ROUTERS.get(tuple(urls))) is None:
+            router = _ROUTERS[tuple(urls)] = BackendRouter(urls, **kwargs)
+        return router
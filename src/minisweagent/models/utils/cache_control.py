@@ -1,3 +1,6 @@
+from typing import Literal
+
+
 def _get_content_text(entry: dict) -> str:
     if isinstance(entry["content"], str):
         return entry["content"]
@@ -40,3 +43,105 @@ def set_cache_control(messages: list[dict], last_n_messages_offset: int = 0) ->
             n_tagged += 1
         new_messages.append(entry)
     return list(reversed(new_messages))
+
+
+def _with_cache_control(entry: dict) -> dict:
+    """Return a marked copy of the entry. The entry itself is not modified."""
+    if isinstance(entry["content"], list):
+        content = [dict(block) for block in entry["content"]]
+    else:
+        content = [{"type": "text", "text": entry["content"]}]
+    marked = entry | {"content": content}
+    if entry["role"] == "tool":
+        # Same workaround as in `_set_cache_control`
+        marked["cache_control"] = {"type": "ephemeral"}
+    else:
+        content[-1]["cache_control"] = {"type": "ephemeral"}
+    return marked
+
+
+CacheControlStrategy = Literal["last_user", "system_and_last_user", "prefix", "none"]
+
+
+class CacheControlManager:
+    """Incremental alternative to `set_cache_control`.
+
+    Instead of rewriting the whole history on every call, the manager remembers the positions of
+    the user messages it has already seen and only scans the messages that were appended since the
+    last call. The returned list is a shallow copy of the input in which only the (few) marked
+    entries are replaced by marked copies, so the agent's own messages are never modified.
+
+    Strategies:
+
+    - `last_user`: Mark the last `n_breakpoints` user messages (same placement as `set_cache_control`)
+    - `system_and_last_user`: Mark the system message and the last `n_breakpoints - 1` user messages
+    - `prefix`: Mark the first `n_breakpoints` messages (a stable prefix, e.g., system message and task)
+    - `none`: Don't mark anything (useful as a baseline when measuring cache hit rates)
+    """
+
+    def __init__(
+        self, strategy: CacheControlStrategy = "last_user", n_breakpoints: int = 2, last_n_messages_offset: int = 0
+    ):
+        if strategy not in ("last_user", "system_and_last_user", "prefix", "none"):
+            raise ValueError(f"Unknown cache control strategy: {strategy}")
+        self.strategy = strategy
+        self.n_breakpoints = n_breakpoints
+        self.last_n_messages_offset = last_n_messages_offset
+        self.marked_indices: list[int] = []
+        """Indices of the messages that carried cache control marks in the last view."""
+        self._user_indices: list[int] = []
+        self._n_seen = 0
+        self._first: dict | None = None
+        self._last: dict | None = None
+
+    def reset(self) -> None:
+        self.marked_indices = []
+        self._user_indices = []
+        self._n_seen = 0
+        self._first = None
+        self._last = None
+
+    def _is_continuation(self, messages: list[dict]) -> bool:
+        """Check (in O(1)) that `messages` extends the history we have seen before."""
+        if not self._n_seen:
+            return True
+        return len(messages) >= self._n_seen and messages[0] is self._first and messages[self._n_seen - 1] is self._last
+
+    def _update(self, messages: list[dict]) -> None:
+        if not self._is_continuation(messages):
+            self.reset()
+        for i in range(self._n_seen, len(messages)):
+            if messages[i]["role"] == "user":
+                self._user_indices.append(i)
+        self._n_seen = len(messages)
+        if messages:
+            self._first, self._last = messages[0], messages[-1]
+
+    def _select(self, messages: list[dict]) -> list[int]:
+        if self.strategy == "none" or self.n_breakpoints <= 0:
+            return []
+        if self.strategy == "prefix":
+            return list(range(min(self.n_breakpoints, len(messages))))
+        selected = []
+        n_user_breakpoints = self.n_breakpoints
+        if self.strategy == "system_and_last_user":
+            if messages and messages[0]["role"] == "system":
+                selected.append(0)
+            n_user_breakpoints -= 1
+        max_index = len(messages) - 1 - self.last_n_messages_offset
+        user_selected = []
+        for i in reversed(self._user_indices):
+            if len(user_selected) >= n_user_breakpoints:
+                break
+            if i <= max_index:
+                user_selected.append(i)
+        return selected + user_selected[::-1]
+
+    def apply(self, messages: list[dict]) -> list[dict]:
+        """Return a view of `messages` with cache control marks on the selected entries."""
+        self._update(messages)
+        self.marked_indices = self._select(messages)
+        view = list(messages)
+        for i in self.marked_indices:
+            view[i] = _with_cache_control(messages[i])
+        return view
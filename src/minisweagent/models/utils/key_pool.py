@@ -0,0 +1,147 @@
+"""Pool of API keys shared between parallel agents.
+
+Every agent (usually a model instance) sticks to one key so that prompt caching keeps working
+(caches are per key). New agents are assigned to the least loaded healthy key, where a key is
+unhealthy if it was rate limited recently. Agents are released automatically once they are
+garbage collected, so finished workers free up their key.
+"""
+
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class KeyState:
+    key: str
+    n_agents: int = 0
+    """Number of agents that currently have affinity to this key."""
+    in_flight: int = 0
+    """Number of requests that are currently running with this key."""
+    n_requests: int = 0
+    n_rate_limited: int = 0
+    cost: float = 0.0
+    rate_limited_at: deque[float] = field(default_factory=deque)
+    """Timestamps of recent 429 responses."""
+
+
+class APIKeyPool:
+    def __init__(self, keys: list[str], *, rate_limit_cooldown: float = 60.0):
+        """Args:
+        keys: API keys to distribute. Empty strings are kept (they select the default key).
+        rate_limit_cooldown: Seconds for which a key is considered unhealthy after a 429.
+        """
+        if not keys:
+            raise ValueError("APIKeyPool needs at least one key")
+        self.rate_limit_cooldown = rate_limit_cooldown
+        self._states = [KeyState(key=key) for key in keys]
+        self._affinity: dict[int, KeyState] = {}
+        """Maps `id(agent)` to the key state of the agent."""
+        self._lock = threading.Lock()
+
+    def _n_recent_rate_limits(self, state: KeyState, now: float) -> int:
+        while state.rate_limited_at and state.rate_limited_at[0] < now - self.rate_limit_cooldown:
+            state.rate_limited_at.popleft()
+        return len(state.rate_limited_at)
+
+    def _least_loaded(self, now: float) -> KeyState:
+        return min(
+            self._states,
+            key=lambda s: (self._n_recent_rate_limits(s, now) > 0, s.n_agents, s.in_flight, s.cost),
+        )
+
+    def _forget(self, agent_id: int) -> None:
+        with self._lock:
+            if (state := self._affinity.pop(agent_id, None)) is not None:
+                state.n_agents -= 1
+
+    def get_key(self, agent: Any) -> str:
+        """Return the key of the agent, assigning (or reassigning, if its key is rate limited) one if needed.
+
+        The agent must support weak references; it is released when it is garbage collected.
+        """
+        now = time.time()
+        agent_id = id(agent)
+        with self._lock:
+            state = self._affinity.get(agent_id)
+            if state is not None and self._n_recent_rate_limits(state, now) > 0:
+                candidate = self._least_loaded(now)
+                if self._n_recent_rate_limits(candidate, now) == 0:
+                    state.n_agents -= 1
+                    state = None
+            if state is None:
+                if agent_id not in self._affinity:
+                    weakref.finalize(agent, self._forget, agent_id)
+                state = self._least_loaded(now)
+                state.n_agents += 1
+                self._affinity[agent_id] = state
+            return state.key
+
+    def release_agent(self, agent: Any) -> None:
+        """Explicitly drop the affinity of an agent (e.g., when it is done)."""
+        self._forget(id(agent))
+
+    def _get_state(self, key: str) -> KeyState:
+        return next(s for s in self._states if s.key == key)
+
+    def get_slot(self, key: str) -> int:
+        """Index of the key in the pool (to label metrics without exposing the key)."""
+        return next(i for i, s in enumerate(self._states) if s.key == key)
+
+    @contextmanager
+    def lease(self, agent: Any) -> Iterator[str]:
+        """Context manager that yields the key of the agent and counts the request as in flight."""
+        key = self.get_key(agent)
+        state = self._get_state(key)
+        with self._lock:
+            state.in_flight += 1
+            state.n_requests += 1
+        try:
+            yield key
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+
+    def record_rate_limit(self, key: str) -> None:
+        with self._lock:
+            state = self._get_state(key)
+            state.n_rate_limited += 1
+            state.rate_limited_at.append(time.time())
+
+    def record_cost(self, key: str, cost: float) -> None:
+        with self._lock:
+            self._get_state(key).cost += cost
+
+    def stats(self) -> list[dict[str, Any]]:
+        """Per-key statistics. Keys are shortened so that the output can be logged."""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "key": f"...{s.key[-4:]}" if s.key else "",
+                    "n_agents": s.n_agents,
+                    "in_flight": s.in_flight,
+                    "n_requests": s.n_requests,
+                    "n_rate_limited": s.n_rate_limited,
+                    "recent_rate_limits": self._n_recent_rate_limits(s, now),
+                    "cost": s.cost,
+                }
+                for s in self._states
+            ]
+
+
+_POOLS: dict[tuple[str, ...], APIKeyPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_key_pool(keys: list[str]) -> APIKeyPool:
+    """Get the pool for a list of keys. All models that use the same keys share one pool."""
+    with _POOLS_LOCK:
+        if (pool := _POOLS.get(tuple(keys))) is None:
+            pool = _POOLS[tuple(keys)] = APIKeyPool(keys)
+        return pool
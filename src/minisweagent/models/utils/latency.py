@@ -0,0 +1,26 @@
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """Thread-safe sliding window of request latencies."""
+
+    def __init__(self, window: int = 200):
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, percentile: float) -> float | None:
+        """Return the percentile (0-100) of the recorded latencies or None if nothing was recorded."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        idx = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[idx]
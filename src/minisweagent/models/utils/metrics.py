@@ -0,0 +1,266 @@
+"""Metrics of model calls, broken down by model name, API key slot and worker thread.
+
+The registry can be rendered as OpenMetrics/Prometheus text (to be picked up by a local
+scraper, e.g., node_exporter's textfile collector) or as a JSON snapshot.
+`MetricsExporter` writes both files periodically into the output directory of a run.
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, float("inf"))
+"""Upper bounds (in seconds) of the latency histogram buckets."""
+
+
+class Histogram:
+    """Histogram with fixed buckets. Recording a value is a bisect plus a few additions under a short lock."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+            self.sum += other.sum
+            self.count += other.count
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate the quantile (0-1) by linear interpolation within the bucket."""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= target:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return self.buckets[-2]
+
+
+@dataclass
+class CallMetrics:
+    latency: Histogram = field(default_factory=Histogram)
+    queue_wait: Histogram = field(default_factory=Histogram)
+    """Time that calls spent waiting for a slot of the request scheduler."""
+    n_calls: int = 0
+    n_errors: int = 0
+    """Failed attempts (including the ones that were retried)."""
+    n_retries: int = 0
+    cost: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def merge(self, other: "CallMetrics") -> None:
+        self.latency.merge(other.latency)
+        self.queue_wait.merge(other.queue_wait)
+        self.n_calls += other.n_calls
+        self.n_errors += other.n_errors
+        self.n_retries += other.n_retries
+        self.cost += other.cost
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cache_read_tokens += other.cache_read_tokens
+        self.cache_creation_tokens += other.cache_creation_tokens
+
+    def summary(self) -> dict[str, Any]:
+        n_attempts = self.n_calls + self.n_errors
+        return {
+            "n_calls": self.n_calls,
+            "n_errors": self.n_errors,
+            "n_retries": self.n_retries,
+            "error_rate": self.n_errors / n_attempts if n_attempts else 0.0,
+            "retry_rate": self.n_retries / n_attempts if n_attempts else 0.0,
+            "cost": self.cost,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_creation_tokens": self.cache_creation_tokens,
+            "cache_read_rate": self.cache_read_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            "tokens_per_second": self.completion_tokens / self.latency.sum if self.latency.sum else 0.0,
+            "latency_mean": self.latency.sum / self.latency.count if self.latency.count else None,
+            "latency_p50": self.latency.quantile(0.5),
+            "latency_p95": self.latency.quantile(0.95),
+            "latency_p99": self.latency.quantile(0.99),
+            "queue_wait_mean": self.queue_wait.sum / self.queue_wait.count if self.queue_wait.count else None,
+            "queue_wait_p95": self.queue_wait.quantile(0.95),
+        }
+
+
+LABEL_NAMES = ("model", "key_slot", "thread")
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._series: dict[tuple[str, str, str], CallMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str, key_slot: str) -> CallMetrics:
+        labels = (model or "unknown", key_slot, threading.current_thread().name)
+        # Fast path without lock: dict reads are atomic
+        if (series := self._series.get(labels)) is None:
+            with self._lock:
+                series = self._series.setdefault(labels, CallMetrics())
+        return series
+
+    def record_call(
+        self,
+        model: str,
+        *,
+        latency: float | None = None,
+        cost: float = 0.0,
+        usage: Any = None,
+        key_slot: str = "",
+    ) -> None:
+        series = self._get(model, key_slot)
+        if latency is not None:
+            series.latency.observe(latency)
+        with series.lock:
+            series.n_calls += 1
+            series.cost += cost
+            if usage is not None:
+                series.prompt_tokens += usage.prompt_tokens
+                series.completion_tokens += usage.completion_tokens
+                series.cache_read_tokens += usage.cache_read_tokens
+                series.cache_creation_tokens += usage.cache_creation_tokens
+
+    def record_queue_wait(self, model: str, wait: float) -> None:
+        self._get(model, "").queue_wait.observe(wait)
+
+    def record_error(self, model: str, *, retried: bool, key_slot: str = "") -> None:
+        series = self._get(model, key_slot)
+        with series.lock:
+            series.n_errors += 1
+            series.n_retries += int(retried)
+
+    def _aggregate(self, label_idx: int) -> dict[str, CallMetrics]:
+        result: dict[str, CallMetrics] = {}
+        for labels, series in list(self._series.items()):
+            result.setdefault(labels[label_idx], CallMetrics()).merge(series)
+        return result
+
+    def snapshot(self) -> dict[str, Any]:
+        series = list(self._series.items())
+        total = CallMetrics()
+        for _, s in series:
+            total.merge(s)
+        return {
+            "timestamp": time.time(),
+            "total": total.summary(),
+            **{
+                f"by_{name}": {value: s.summary() for value, s in self._aggregate(i).items()}
+                for i, name in enumerate(LABEL_NAMES)
+            },
+            "series": [dict(zip(LABEL_NAMES, labels)) | s.summary() for labels, s in series],
+        }
+
+    def to_openmetrics(self) -> str:
+        lines: list[str] = []
+        series = list(self._series.items())
+
+        def add_counter(name: str, help_text: str, attr: str) -> None:
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"# HELP {name} {help_text}")
+            for labels, s in series:
+                lines.append(f"{name}_total{_format_labels(zip(LABEL_NAMES, labels))} {getattr(s, attr)}")
+
+        add_counter("mswea_model_calls", "Successful model calls.", "n_calls")
+        add_counter("mswea_model_errors", "Failed model call attempts.", "n_errors")
+        add_counter("mswea_model_retries", "Retried model call attempts.", "n_retries")
+        add_counter("mswea_model_cost_dollars", "Cost of model calls.", "cost")
+        add_counter("mswea_model_prompt_tokens", "Prompt tokens.", "prompt_tokens")
+        add_counter("mswea_model_completion_tokens", "Completion tokens.", "completion_tokens")
+        add_counter("mswea_model_cache_read_tokens", "Prompt tokens read from cache.", "cache_read_tokens")
+        add_counter("mswea_model_cache_creation_tokens", "Prompt tokens written to cache.", "cache_creation_tokens")
+
+        def add_histogram(name: str, help_text: str, attr: str) -> None:
+            lines.append(f"# TYPE {name} histogram")
+            lines.append(f"# HELP {name} {help_text}")
+            for labels, s in series:
+                histogram = getattr(s, attr)
+                base = list(zip(LABEL_NAMES, labels))
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f"{name}_bucket{_format_labels(base + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_count{_format_labels(base)} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(base)} {histogram.sum}")
+
+        add_histogram("mswea_model_latency_seconds", "Latency of model calls.", "latency")
+        add_histogram("mswea_model_queue_wait_seconds", "Time model calls waited for a scheduler slot.", "queue_wait")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir: Path) -> None:
+        """Write `metrics.prom` and `metrics.json` atomically (so that a scraper never sees partial files)."""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for filename, text in [
+            ("metrics.prom", self.to_openmetrics()),
+            ("metrics.json", json.dumps(self.snapshot(), indent=2)),
+        ]:
+            tmp_path = output_dir / f".{filename}.tmp"
+            tmp_path.write_text(text)
+            tmp_path.replace(output_dir / filename)
+
+
+class MetricsExporter:
+    def __init__(self, registry: MetricsRegistry, output_dir: Path, *, interval: float = 30.0):
+        """Periodically writes the metrics of the registry to `output_dir` in a background thread."""
+        self.registry = registry
+        self.output_dir = output_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="metrics-exporter")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.registry.write(self.output_dir)
+
+    def start(self) -> "MetricsExporter":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the exporter and write the final metrics."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.registry.write(self.output_dir)
+
+    def __enter__(self) -> "MetricsExporter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,75 @@
+"""Provider-specific prompt caching.
+
+The history of an agent only grows at the end, so consecutive queries share long prefixes.
+How to benefit from that depends on the provider:
+
+- `breakpoints`: Explicit `cache_control` marks that move with the history (Anthropic, and Claude
+  on Bedrock or Vertex AI). Reads are cheap, writes cost extra, breakpoints are limited to 4.
+- `prefix`: Mark a stable prefix (system message and task) once (Gemini context caching).
+  litellm creates a cached content object for the marked messages and reuses it by hash
+  for later queries, so all steps (and all agents with the same prefix) share the cache handle.
+  Prefixes below the provider's minimum size can't be cached and are left unmarked.
+- `automatic`: The provider caches prefixes by itself (OpenAI, DeepSeek, vLLM/SGLang servers
+  with prefix caching). Nothing is marked; the append-only history keeps the prefix stable.
+- `none`: Never mark anything.
+
+`auto` picks the policy from the model name. Cache reads and writes are reported in the token
+usage of every response (`cache_read_tokens`, `cache_creation_tokens`) and in the metrics.
+"""
+
+from typing import Literal
+
+from minisweagent.models.utils.cache_control import CacheControlManager, CacheControlStrategy
+from minisweagent.models.utils.usage import estimate_prompt_tokens
+
+PromptCachingPolicy = Literal["auto", "breakpoints", "prefix", "automatic", "none"]
+
+_BREAKPOINT_PROVIDERS = ("anthropic", "bedrock", "vertex_ai", "openrouter")
+"""Providers that accept anthropic-style cache control marks for Claude models."""
+
+
+def resolve_prompt_caching_policy(policy: PromptCachingPolicy, model_name: str) -> PromptCachingPolicy:
+    """Resolve `auto` to the policy that fits the provider of the model (litellm model name)."""
+    if policy != "auto":
+        return policy
+    name = model_name.lower()
+    provider = name.split("/", 1)[0] if "/" in name else ""
+    if provider == "anthropic" or (provider in ("", *_BREAKPOINT_PROVIDERS) and "claude" in name):
+        return "breakpoints"
+    if "gemini" in name and provider in ("", "gemini", "vertex_ai"):
+        return "prefix"
+    return "automatic"
+
+
+class PromptCache:
+    def __init__(
+        self,
+        policy: PromptCachingPolicy,
+        model_name: str,
+        *,
+        strategy: CacheControlStrategy = "last_user",
+        n_breakpoints: int = 2,
+        min_prefix_tokens: int = 4096,
+    ):
+        """Args:
+        policy: See module docstring.
+        model_name: Used to resolve the `auto` policy.
+        strategy: Placement of the breakpoints for the `breakpoints` policy (see `CacheControlManager`).
+        n_breakpoints: Number of breakpoints for the `breakpoints` policy.
+        min_prefix_tokens: Don't mark prefixes that are shorter than this (estimated) for the `prefix` policy.
+        """
+        self.policy = resolve_prompt_caching_policy(policy, model_name)
+        self.min_prefix_tokens = min_prefix_tokens
+        self.cache_control: CacheControlManager | None = None
+        if self.policy == "breakpoints":
+            self.cache_control = CacheControlManager(strategy=strategy, n_breakpoints=n_breakpoints)
+        elif self.policy == "prefix":
+            self.cache_control = CacheControlManager(strategy="prefix", n_breakpoints=2)
+
+    def apply(self, messages: list[dict]) -> list[dict]:
+        """Return the messages with the cache annotations of the policy. `messages` is not modified."""
+        if self.cache_control is None:
+            return messages
+        if self.policy == "prefix" and estimate_prompt_tokens(messages[:2]) < self.min_prefix_tokens:
+            return messages
+        return self.cache_control.apply(messages)
@@ -0,0 +1,115 @@
+"""On-disk store of model responses with size-based LRU eviction.
+
+The store is a SQLite database in WAL mode, so that it can be shared between the threads of
+a process (one connection per thread) and between processes (SQLite file locking).
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("response_cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+_EVICT = """
+DELETE FROM responses WHERE key IN (
+    SELECT key FROM (
+        SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS cumulative_size FROM responses
+    ) WHERE cumulative_size > ?
+)
+"""
+
+
+class ResponseCache:
+    def __init__(self, path: Path, *, max_size_bytes: int = 1024**3, read_only: bool = False):
+        """Args:
+        path: Path of the SQLite database (created if needed, unless `read_only`).
+        max_size_bytes: Least recently used entries are evicted once the stored responses exceed this size.
+        read_only: Never write to the database (not even access times).
+        """
+        self.path = Path(path)
+        self.max_size_bytes = max_size_bytes
+        self.read_only = read_only
+        self._local = threading.local()
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        else:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection | None:
+        """Connection of the current thread (SQLite connections must not be shared between threads)."""
+        if not hasattr(self._local, "conn"):
+            try:
+                self._local.conn = self._connect()
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Cannot open response cache {self.path}: {e}")
+                self._local.conn = None
+        return self._local.conn
+
+    def get(self, key: str) -> str | None:
+        if (conn := self._conn) is None:
+            return None
+        try:
+            row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError as e:  # e.g., read only and the table doesn't exist
+            logger.warning(f"Cannot read from response cache {self.path}: {e}")
+            return None
+        if row is None:
+            return None
+        if not self.read_only:
+            with conn:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        if self.read_only:
+            raise RuntimeError("Cannot write to a read only response cache")
+        conn = self._conn
+        assert conn is not None
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value.encode()), time.time()),
+            )
+            conn.execute(_EVICT, (self.max_size_bytes,))
+
+    def stats(self) -> dict[str, Any]:
+        if (conn := self._conn) is None:
+            return {"n_entries": 0, "size_bytes": 0}
+        n_entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"n_entries": n_entries, "size_bytes": size}
+
+
+_CACHES: dict[tuple[Path, bool], ResponseCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_response_cache(path: Path, *, max_size_bytes: int = 1024**3, read_only: bool = False) -> ResponseCache:
+    """Get the cache for a path. All models that use the same path share one instance."""
+    key = (Path(path).resolve(), read_only)
+    with _CACHES_LOCK:
+        if (cache := _CACHES.get(key)) is None:
+            cache = _CACHES[key] = ResponseCache(path, max_size_bytes=max_size_bytes, read_only=read_only)
+        cache.max_size_bytes = max_size_bytes
+        return cache
@@ -0,0 +1,136 @@
+"""Global priority queue for model requests.
+
+A `RequestScheduler` caps the number of concurrent model requests. Requests beyond the cap wait
+in a priority queue (lower values are served first, ties in arrival order). Both threads (`slot`)
+and coroutines (`aslot`) can wait for the same scheduler.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: float
+    seq: int
+    wake: Callable[[], None] = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class RequestScheduler:
+    def __init__(self, max_concurrent: int = 0):
+        """Args:
+        max_concurrent: Maximum number of requests that run at the same time (0: no limit).
+        """
+        self.max_concurrent = max_concurrent
+        self._queue: list[_Waiter] = []
+        self._n_running = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _has_capacity(self) -> bool:
+        return self.max_concurrent <= 0 or self._n_running < self.max_concurrent
+
+    def _enqueue(self, priority: float, wake: Callable[[], None]) -> _Waiter | None:
+        """Take a slot right away (returns None) or queue up. Must be called with the lock held."""
+        if self._has_capacity() and not self._queue:
+            self._n_running += 1
+            return None
+        waiter = _Waiter(priority, next(self._seq), wake)
+        heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _grant_next(self) -> None:
+        """Hand free slots to the waiters with the highest priority. Must be called with the lock held."""
+        while self._queue and self._has_capacity():
+            waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self._n_running += 1
+            waiter.wake()
+
+    def _release(self) -> None:
+        with self._lock:
+            self._n_running -= 1
+            self._grant_next()
+
+    def _cancel(self, waiter: _Waiter) -> None:
+        """Give up waiting. If the slot was granted in the meantime, pass it on."""
+        with self._lock:
+            if waiter.granted:
+                self._n_running -= 1
+                self._grant_next()
+            else:
+                waiter.cancelled = True
+
+    @contextmanager
+    def slot(self, priority: float = 0.0) -> Iterator[float]:
+        """Block until a slot is free and hold it. Yields the time spent waiting in the queue (seconds)."""
+        start = time.perf_counter()
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(priority, event.set)
+        if waiter is not None:
+            try:
+                event.wait()
+            except BaseException:
+                self._cancel(waiter)
+                raise
+        try:
+            yield time.perf_counter() - start
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: float = 0.0) -> AsyncIterator[float]:
+        """Like `slot`, but waits without blocking the event loop."""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            waiter = self._enqueue(priority, wake)
+        if waiter is not None:
+            try:
+                await future
+            except BaseException:
+                self._cancel(waiter)
+                raise
+        try:
+            yield time.perf_counter() - start
+        finally:
+            self._release()
+
+    @property
+    def n_running(self) -> int:
+        return self._n_running
+
+    @property
+    def n_waiting(self) -> int:
+        with self._lock:
+            return sum(not waiter.cancelled for waiter in self._queue)
+
+
+_SCHEDULERS: dict[str, RequestScheduler] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_request_scheduler(name: str = "default", max_concurrent: int = 0) -> RequestScheduler:
+    """Schedulers are shared by name between all models, so that the cap applies to the whole run.
+    `max_concurrent` is only used when the scheduler is created.
+    """
+    with _SCHEDULERS_LOCK:
+        if (scheduler := _SCHEDULERS.get(name)) is None:
+            scheduler = _SCHEDULERS[name] = RequestScheduler(max_concurrent)
+        return scheduler
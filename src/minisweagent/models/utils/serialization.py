@@ -0,0 +1,91 @@
+"""Incremental JSON serialization of chat completion request bodies.
+
+The history of an agent only grows at the end, but a naive client re-serializes all messages
+on every step, which is quadratic over a run. `IncrementalRequestEncoder` caches the serialized
+messages and only encodes the ones that are new (or changed) since the previous request.
+
+Run `python -m minisweagent.models.utils.serialization` for a benchmark on synthetic histories.
+"""
+
+import json
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode()
+
+
+def get_json_encoder(fast: bool = False) -> Callable[[Any], bytes]:
+    """Return `orjson.dumps` if `fast` is set and `orjson` is installed, else an encoder based on the standard library."""
+    if fast:
+        try:
+            import orjson
+        except ImportError:
+            return _json_dumps
+        return orjson.dumps
+    return _json_dumps
+
+
+class IncrementalRequestEncoder:
+    def __init__(self, *, fast: bool = False):
+        """Args:
+        fast: Use `orjson` (if installed) to encode messages.
+        """
+        self._dumps = get_json_encoder(fast)
+        self._messages: list[dict] = []
+        self._encoded: list[bytes] = []
+        self._lock = threading.Lock()
+
+    def _encode_messages(self, messages: list[dict]) -> list[bytes]:
+        with self._lock:
+            n_reused = 0
+            for cached, message in zip(self._messages, messages):
+                # Identical string objects are compared by identity, so this is cheap for an unchanged history
+                if cached is not message and cached != message:
+                    break
+                n_reused += 1
+            self._messages = self._messages[:n_reused] + [dict(m) for m in messages[n_reused:]]
+            self._encoded = self._encoded[:n_reused] + [self._dumps(m) for m in messages[n_reused:]]
+            return self._encoded
+
+    def encode(self, payload: dict[str, Any]) -> bytes:
+        """Serialize a request body. Equivalent to `json.dumps(payload)` (up to whitespace)."""
+        rest = {k: v for k, v in payload.items() if k != "messages"}
+        if "messages" not in payload:
+            return self._dumps(rest)
+        head = self._dumps(rest)[:-1] + (b"," if rest else b"") + b'"messages":['
+        return head + b",".join(self._encode_messages(payload["messages"])) + b"]}"
+
+
+def _synthetic_history(n_steps: int, observation_size: int) -> list[dict]:
+    messages = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": "Task"}]
+    for i in range(n_steps):
+        messages.append({"role": "assistant", "content": f"Step {i}\n```bash\nls -la\n```"})
+        messages.append({"role": "user", "content": f'<output>{"x" * observation_size}\n"quoted"</output>'})
+    return messages
+
+
+def benchmark(n_steps: int = 200, observation_size: int = 10_000) -> dict[str, float]:
+    """Seconds to serialize the request bodies of all steps of a synthetic run."""
+    history = _synthetic_history(n_steps, observation_size)
+    steps = [history[: 2 + 2 * i] for i in range(1, n_steps + 1)]
+    encoders: dict[str, Callable[[dict], Any]] = {
+        "json": lambda payload: json.dumps(payload).encode(),
+        "incremental": IncrementalRequestEncoder().encode,
+        "incremental_fast": IncrementalRequestEncoder(fast=True).encode,
+    }
+    results = {}
+    for name, encode in encoders.items():
+        start = time.perf_counter()
+        for messages in steps:
+            encode({"model": "benchmark", "messages": messages, "temperature": 0.0})
+        results[name] = time.perf_counter() - start
+    return results
+
+
+if __name__ == "__main__":
+    for name, seconds in benchmark().items():
+        print(f"{name:>20}: {seconds:.3f}s")
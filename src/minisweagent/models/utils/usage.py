@@ -0,0 +1,84 @@
+"""Token usage of model calls.
+
+Models return the usage of every call as `response["extra"]["usage"]`, which the agent stores on the
+assistant message. The `extra` field is not part of the chat completion format and is removed with
+`strip_extra` before messages are sent to an API.
+"""
+
+from dataclasses import asdict, dataclass, fields
+from typing import Any
+
+
+def _as_int(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+@dataclass
+class TokenUsage:
+    prompt_tokens: int = 0
+    """All input tokens, including cached ones."""
+    completion_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+
+    def __add__(self, other: "TokenUsage") -> "TokenUsage":
+        return TokenUsage(**{f.name: getattr(self, f.name) + getattr(other, f.name) for f in fields(self)})
+
+    def to_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TokenUsage":
+        return cls(**{f.name: _as_int(data.get(f.name)) for f in fields(cls)})
+
+    @classmethod
+    def from_litellm(cls, response: Any) -> "TokenUsage":
+        """Extract usage from a litellm `ModelResponse`.
+        Cache reads are reported as `prompt_tokens_details.cached_tokens` (openai style)
+        or `cache_read_input_tokens` (anthropic style).
+        """
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return cls()
+        details = getattr(usage, "prompt_tokens_details", None)
+        return cls(
+            prompt_tokens=_as_int(getattr(usage, "prompt_tokens", 0)),
+            completion_tokens=_as_int(getattr(usage, "completion_tokens", 0)),
+            cache_read_tokens=_as_int(getattr(details, "cached_tokens", 0))
+            or _as_int(getattr(usage, "cache_read_input_tokens", 0)),
+            cache_creation_tokens=_as_int(getattr(usage, "cache_creation_input_tokens", 0)),
+        )
+
+    @classmethod
+    def from_openai(cls, response: dict) -> "TokenUsage":
+        """Extract usage from the JSON body of a chat completion response."""
+        usage = response.get("usage") or {}
+        return cls(
+            prompt_tokens=_as_int(usage.get("prompt_tokens")),
+            completion_tokens=_as_int(usage.get("completion_tokens")),
+            cache_read_tokens=_as_int((usage.get("prompt_tokens_details") or {}).get("cached_tokens")),
+            cache_creation_tokens=_as_int(usage.get("cache_creation_input_tokens")),
+        )
+
+
+def strip_extra(messages: list[dict]) -> list[dict]:
+    """Remove the `extra` field that we store on messages. Messages without it are passed through."""
+    if not any("extra" in message for message in messages):
+        return messages
+    return [
+        {k: v for k, v in message.items() if k != "extra"} if "extra" in message else message for message in messages
+    ]
+
+
+def estimate_prompt_tokens(messages: list[dict]) -> int:
+    """Rough number of prompt tokens (4 characters per token), cheap enough to compute before every query."""
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4
+
+
+def get_usage_totals(messages: list[dict]) -> dict[str, int]:
+    """Sum up the usage stored on the (assistant) messages of a trajectory."""
+    total = TokenUsage()
+    for message in messages:
+        if usage := message.get("extra", {}).get("usage"):
+            total += TokenUsage.from_dict(usage)
+    return total.to_dict()
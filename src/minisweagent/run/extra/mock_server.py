@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+"""Run a local OpenAI-compatible mock server for load tests (no network access or API key needed).
+
+The server speaks `POST /v1/chat/completions` (including `"stream": true`) and answers with
+scripted outputs or replays the assistant messages of saved trajectories.
+Latency and failures (429 bursts, 5xx errors) can be injected to test the runner under realistic conditions.
+
+Point [bold green]OpenAIModel[/bold green] at it, e.g., with [bold green]OPENAI_API_BASE=http://localhost:8000[/bold green].
+"""
+
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+import typer
+
+from minisweagent.models.utils.usage import estimate_prompt_tokens
+
+logger = logging.getLogger("mock_server")
+
+app = typer.Typer(rich_markup_mode="rich", add_completion=False)
+
+_SUBMIT_OUTPUT = "Done.\n\n```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"
+
+
+@dataclass
+class MockServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8000
+    """Use 0 to pick a free port (see `MockServer.base_url`)."""
+    outputs: list[str] = field(default_factory=lambda: [_SUBMIT_OUTPUT])
+    """Scripted outputs: the n-th assistant turn of every conversation gets the n-th output (the last one repeats)."""
+    trajectories: list[str] = field(default_factory=list)
+    """Trajectory files (or directories with `*.traj.json` files) to replay instead of the scripted outputs.
+    Conversations are matched to a trajectory by their task (first user message), otherwise by a hash of it.
+    """
+    latency: float = 0.0
+    """Median latency of a response (seconds)."""
+    latency_sigma: float = 0.0
+    """Shape of the log-normal latency distribution (0: constant latency). 1.0 gives a heavy tail."""
+    rate_limit_probability: float = 0.0
+    """Probability that a request starts a burst of 429 responses."""
+    rate_limit_burst: int = 1
+    """Number of consecutive requests that are rate limited in a burst."""
+    server_error_probability: float = 0.0
+    """Probability of a 500 response."""
+    stream_chunk_size: int = 16
+    """Characters per chunk of streamed responses."""
+    stream_chunk_delay: float = 0.0
+    """Seconds between chunks of streamed responses (slow streams)."""
+    seed: int | None = None
+
+
+def _get_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "\n".join(item.get("text", "") for item in content)
+    return content or ""
+
+
+def _load_trajectories(paths: list[str]) -> list[list[dict]]:
+    files: list[Path] = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.rglob("*.traj.json")) if path.is_dir() else [path])
+    trajectories = []
+    for file in files:
+        data = json.loads(file.read_text())
+        trajectories.append(data["messages"] if isinstance(data, dict) else data)
+    return trajectories
+
+
+def _get_task(messages: list[dict]) -> str:
+    return next((_get_text(m["content"]) for m in messages if m["role"] == "user"), "")
+
+
+class MockServer:
+    def __init__(self, **kwargs):
+        """See `MockServerConfig` for keyword arguments."""
+        self.config = MockServerConfig(**kwargs)
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._n_rate_limited_left = 0
+        self.trajectories = _load_trajectories(self.config.trajectories)
+        self._trajectory_by_task = {_get_task(t): t for t in self.trajectories}
+        self.stats = {"n_requests": 0, "n_completions": 0, "n_rate_limited": 0, "n_server_errors": 0}
+        self.httpd = ThreadingHTTPServer((self.config.host, self.config.port), self._get_handler())
+        self.httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def get_output(self, messages: list[dict]) -> str:
+        """Return the assistant message for the next turn of the conversation."""
+        n_turn = sum(m["role"] == "assistant" for m in messages)
+        if not self.trajectories:
+            return self.config.outputs[min(n_turn, len(self.config.outputs) - 1)]
+        task = _get_task(messages)
+        if (trajectory := self._trajectory_by_task.get(task)) is None:
+            trajectory = self.trajectories[int(hashlib.sha256(task.encode()).hexdigest(), 16) % len(self.trajectories)]
+        recorded = [m for m in trajectory if m["role"] == "assistant"]
+        return _get_text(recorded[n_turn]["content"]) if n_turn < len(recorded) else _SUBMIT_OUTPUT
+
+    def _sample_failure(self) -> int | None:
+        """Return the status code of an injected failure, if any."""
+        with self._lock:
+            self.stats["n_requests"] += 1
+            if self._n_rate_limited_left == 0 and self._random.random() < self.config.rate_limit_probability:
+                self._n_rate_limited_left = self.config.rate_limit_burst
+            if self._n_rate_limited_left > 0:
+                self._n_rate_limited_left -= 1
+                self.stats["n_rate_limited"] += 1
+                return 429
+            if self._random.random() < self.config.server_error_probability:
+                self.stats["n_server_errors"] += 1
+                return 500
+            return None
+
+    def _sample_latency(self) -> float:
+        if self.config.latency <= 0:
+            return 0.0
+        with self._lock:
+            return self.config.latency * math.exp(self._random.gauss(0, self.config.latency_sigma))
+
+    def _get_handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                logger.debug(format, *args)
+
+            def _send_json(self, status: int, data: dict) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") == "/v1/models":
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+                elif self.path.rstrip("/") == "/stats":
+                    self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def do_POST(self) -> None:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                time.sleep(server._sample_latency())
+                if (status := server._sample_failure()) is not None:
+                    message = "Rate limit exceeded" if status == 429 else "Internal server error"
+                    self._send_json(status, {"error": {"message": message, "code": status}})
+                    return
+                messages = request.get("messages", [])
+                content = server.get_output(messages)
+                with server._lock:
+                    server.stats["n_completions"] += 1
+                usage = {
+                    "prompt_tokens": estimate_prompt_tokens(messages),
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": estimate_prompt_tokens(messages) + len(content) // 4,
+                }
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                model = request.get("model", "mock")
+                if request.get("stream"):
+                    self._stream(completion_id, model, content, usage)
+                    return
+                self._send_json(
+                    200,
+                    {
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [
+                            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                        ],
+                        "usage": usage,
+                    },
+                )
+
+            def _stream(self, completion_id: str, model: str, content: str, usage: dict) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                size = max(server.config.stream_chunk_size, 1)
+                deltas = [{"role": "assistant", "content": ""}]
+                deltas += [{"content": content[i : i + size]} for i in range(0, len(content), size)]
+                for i, delta in enumerate(deltas):
+                    last = i == len(deltas) - 1
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": "stop" if last else None}],
+                    }
+                    if last:
+                        chunk["usage"] = usage
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    if not last:
+                        time.sleep(server.config.stream_chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self) -> "MockServer":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+# fmt: off
+@app.command(help=__doc__)
+def main(
+    host: str = typer.Option("127.0.0.1", "--host", help="Host to bind to"),
+    port: int = typer.Option(8000, "-p", "--port", help="Port to bind to"),
+    trajectories: list[str] = typer.Option([], "-t", "--trajectories", help="Trajectory files or directories to replay (can be given multiple times)"),
+    output: list[str] = typer.Option([], "--output", help="Scripted outputs in order (can be given multiple times)"),
+    latency: float = typer.Option(0.0, "--latency", help="Median latency in seconds"),
+    latency_sigma: float = typer.Option(0.0, "--latency-sigma", help="Shape of the log-normal latency distribution"),
+    rate_limit_probability: float = typer.Option(0.0, "--rate-limit-probability", help="Probability that a request starts a burst of 429s"),
+    rate_limit_burst: int = typer.Option(1, "--rate-limit-burst", help="Number of requests per 429 burst"),
+    server_error_probability: float = typer.Option(0.0, "--server-error-probability", help="Probability of a 500 response"),
+    stream_chunk_delay: float = typer.Option(0.0, "--stream-chunk-delay", help="Seconds between chunks of streamed responses"),
+    seed: int | None = typer.Option(None, "--seed", help="Random seed for latency and failures"),
+) -> None:
+    # fmt: on
+    kwargs = dict(
+        host=host,
+        port=port,
+        trajectories=trajectories,
+        latency=latency,
+        latency_sigma=latency_sigma,
+        rate_limit_probability=rate_limit_probability,
+        rate_limit_burst=rate_limit_burst,
+        server_error_probability=server_error_probability,
+        stream_chunk_delay=stream_chunk_delay,
+        seed=seed,
+    )
+    if output:
+        kwargs["outputs"] = output
+    server = MockServer(**kwargs)
+    print(f"Mock server listening on {server.base_url} ({len(server.trajectories)} trajectories)")
+    print(json.dumps({k: v for k, v in asdict(server.config).items() if k not in ["outputs"]}, indent=2))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    app()
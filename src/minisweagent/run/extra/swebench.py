@@ -21,8 +21,14 @@ from minisweagent import Environment
 from minisweagent.agents.default import DefaultAgent
 from minisweagent.config import builtin_config_dir, get_config_path
 from minisweagent.environments import get_environment
-from minisweagent.models import get_model
+from minisweagent.models import GLOBAL_MODEL_STATS, get_model
+from minisweagent.models.batch import BatchClient
+from minisweagent.models.scheduling import mark_container_started
+from minisweagent.models.utils.metrics import MetricsExporter
 from minisweagent.run.extra.utils.batch_progress import RunBatchProgressManager
+from minisweagent.run.extra.utils.batch_runner import BatchRunner
+from minisweagent.run.extra.utils.environment_pool import EnvironmentMetrics, EnvironmentPool
+from minisweagent.run.extra.utils.image_manager import ImageManager
 from minisweagent.run.utils.save import save_traj
 from minisweagent.utils.log import add_file_handlers, logger
 
@@ -115,8 +121,10 @@ def process_instance(
     output_dir: Path,
     config: dict,
     progress_manager: RunBatchProgressManager,
+    environment_pool: EnvironmentPool | None = None,
 ) -> None:
     """Process a single SWEBench instance."""
+    started_at = time.perf_counter()
     instance_id = instance["instance_id"]
     instance_dir = output_dir / instance_id
     # avoid inconsistent state if something here fails and there's leftover previous files
@@ -129,10 +137,12 @@ def process_instance(
     progress_manager.update_instance_status(instance_id, "Pulling/starting docker")
 
     agent = None
+    env = None
     extra_info = None
 
     try:
-        env = get_sb_environment(config, instance)
+        env = environment_pool.get(instance) if environment_pool else get_sb_environment(config, instance)
+        mark_container_started(model)
         agent = ProgressTrackingAgent(
             model,
             env,
@@ -140,6 +150,8 @@ def process_instance(
             instance_id=instance_id,
             **config.get("agent", {}),
         )
+        if environment_pool:
+            environment_pool.record_first_step(started_at)
         exit_status, result = agent.run(task)
     except Exception as e:
         logger.error(f"Error processing instance {instance_id}: {e}", exc_info=True)
@@ -157,6 +169,63 @@ def process_instance(
         )
         update_preds_file(output_dir / "preds.json", instance_id, model.config.model_name, result)
         progress_manager.on_instance_end(instance_id, exit_status)
+        if env is not None and hasattr(env, "cleanup"):
+            env.cleanup()  # recycling environments hand their container to the next instance
+        if environment_pool:
+            environment_pool.release(instance)
+
+
+def process_instances_batched(
+    instances: list[dict],
+    output_dir: Path,
+    config: dict,
+    progress_manager: RunBatchProgressManager,
+    *,
+    max_active: int,
+    environment_pool: EnvironmentPool | None = None,
+) -> None:
+    """Run the instances in lock step, sending the queries of all active agents as one batch."""
+    instances_by_id = {instance["instance_id"]: instance for instance in instances}
+    model_names: dict[str, str] = {}
+
+    def start_job(instance_id: str) -> tuple[DefaultAgent, str]:
+        instance = instances_by_id[instance_id]
+        remove_from_preds_file(output_dir / "preds.json", instance_id)
+        (output_dir / instance_id / f"{instance_id}.traj.json").unlink(missing_ok=True)
+        progress_manager.on_instance_start(instance_id)
+        model = get_model(config=config.get("model", {}))
+        model_names[instance_id] = model.config.model_name
+        if not hasattr(model, "get_batch_request"):
+            raise TypeError(f"Batch mode needs a model with batch support (e.g., OpenAIModel), not {type(model)}")
+        progress_manager.update_instance_status(instance_id, "Pulling/starting docker")
+        env = environment_pool.get(instance) if environment_pool else get_sb_environment(config, instance)
+        agent = ProgressTrackingAgent(
+            model, env, progress_manager=progress_manager, instance_id=instance_id, **config.get("agent", {})
+        )
+        progress_manager.update_instance_status(instance_id, "Waiting for batch")
+        return agent, instance["problem_statement"]
+
+    def on_finished(
+        instance_id: str, agent: DefaultAgent | None, exit_status: str, result: str, extra_info: dict | None
+    ) -> None:
+        save_traj(
+            agent,
+            output_dir / instance_id / f"{instance_id}.traj.json",
+            exit_status=exit_status,
+            result=result,
+            extra_info=extra_info,
+            instance_id=instance_id,
+            print_fct=logger.info,
+        )
+        update_preds_file(output_dir / "preds.json", instance_id, model_names.get(instance_id, ""), result)
+        progress_manager.on_instance_end(instance_id, exit_status)
+        if agent is not None and hasattr(agent.env, "cleanup"):
+            agent.env.cleanup()
+        if environment_pool:
+            environment_pool.release(instances_by_id[instance_id])
+
+    runner = BatchRunner(BatchClient(**config.get("batch", {})), max_active=max_active)
+    runner.run(instances_by_id, start_job, on_finished)
 
 
 def filter_instances(
@@ -193,6 +262,11 @@ def main(
     redo_existing: bool = typer.Option(False, "--redo-existing", help="Redo existing instances", rich_help_panel="Data selection"),
     config_spec: Path = typer.Option( builtin_config_dir / "extra" / "swebench.yaml", "-c", "--config", help="Path to a config file", rich_help_panel="Basic"),
     environment_class: str | None = typer.Option( None, "--environment-class", help="Environment type to use. Recommended are docker or singularity", rich_help_panel="Advanced"),
+    batch: bool = typer.Option(False, "--batch", help="Send the queries of all active agents as one request to a (cheaper, but slow) batch API. Configure it in the `batch` section of the config.", rich_help_panel="Advanced"),
+    prefetch: int = typer.Option(0, "--prefetch", help="Pull images and start the environments of this many upcoming instances in the background", rich_help_panel="Advanced"),
+    prefetch_workers: int = typer.Option(2, "--prefetch-workers", help="Maximum number of environments that are prefetched at the same time", rich_help_panel="Advanced"),
+    pull_ahead: int = typer.Option(0, "--pull-ahead", help="Pull the images of upcoming instances ahead of time (at most this many unused images) and remove images that are no longer needed when the disk fills up. Docker/podman only.", rich_help_panel="Advanced"),
+    max_disk_usage: float = typer.Option(0.85, "--max-disk-usage", help="Fraction of the disk above which unneeded images are removed (with --pull-ahead)", rich_help_panel="Advanced"),
 ) -> None:
     # fmt: on
     output_path = Path(output)
@@ -231,12 +305,56 @@ def main(
                 logger.error(f"Error in future for instance {instance_id}: {e}", exc_info=True)
                 progress_manager.on_uncaught_exception(instance_id, e)
 
-    with Live(progress_manager.render_group, refresh_per_second=4):
+    metrics_exporter = GLOBAL_MODEL_STATS.start_metrics_export(output_path)
+    environment_metrics = EnvironmentMetrics()
+    image_manager = None
+    if pull_ahead > 0 and config.get("environment", {}).get("environment_class", "docker") not in ["docker", "docker_api"]:
+        logger.warning("--pull-ahead only works with docker/podman environments, ignoring it")
+    elif pull_ahead > 0:
+        image_manager = ImageManager(
+            instances,
+            get_swebench_docker_image_name,
+            metrics=environment_metrics,
+            lookahead=pull_ahead,
+            max_disk_usage=max_disk_usage,
+        )
+    environment_pool = EnvironmentPool(
+        lambda instance: get_sb_environment(config, instance),
+        instances,
+        lookahead=prefetch,
+        max_concurrent=prefetch_workers,
+        metrics=environment_metrics,
+        image_manager=image_manager,
+    )
+    environment_metrics_exporter = MetricsExporter(environment_pool.metrics, output_path).start()  # type: ignore[arg-type]
+    if batch:
+        with (
+            Live(progress_manager.render_group, refresh_per_second=4),
+            metrics_exporter,
+            environment_metrics_exporter,
+            environment_pool,
+        ):
+            process_instances_batched(
+                instances,
+                output_path,
+                config,
+                progress_manager,
+                max_active=workers,
+                environment_pool=environment_pool,
+            )
+        return
+
+    with (
+        Live(progress_manager.render_group, refresh_per_second=4),
+        metrics_exporter,
+        environment_metrics_exporter,
+        environment_pool,
+    ):
         with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
             futures = {
-                executor.submit(process_instance, instance, output_path, config, progress_manager): instance[
-                    "instance_id"
-                ]
+                executor.submit(
+                    process_instance, instance, output_path, config, progress_manager, environment_pool
+                ): instance["instance_id"]
                 for instance in instances
             }
             try:
@@ -0,0 +1,126 @@
+"""Run many agents in lock step, sending the queries of all agents as one batch (see `minisweagent.models.batch`).
+
+Every agent is driven through `DefaultAgent.run_steps`: it is suspended while its query is part of
+a batch and resumed (in a thread pool, so that actions are executed in parallel) once the
+results have been fetched. The models of the agents need to support `get_batch_request` and
+`process_batch_response` (e.g., `OpenAIModel`).
+"""
+
+import concurrent.futures
+import logging
+import traceback
+from collections.abc import Callable, Generator, Iterable
+from dataclasses import dataclass, field
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.models.batch import BatchClient, BatchError
+
+logger = logging.getLogger("batch_runner")
+
+
+@dataclass
+class _Job:
+    job_id: str
+    agent: DefaultAgent
+    steps: Generator[list[dict], dict, tuple[str, str]]
+    messages: list[dict] = field(default_factory=list)
+    n_failed_requests: int = 0
+
+
+class BatchRunner:
+    def __init__(self, client: BatchClient, *, max_active: int = 0, n_threads: int = 8, max_request_retries: int = 3):
+        """Args:
+        client: Batch API client.
+        max_active: Maximum number of agents that are run at the same time (0: no limit).
+        n_threads: Threads to execute the actions of the agents between batches.
+        max_request_retries: Resubmit failed requests this many times before the agent fails.
+        """
+        self.client = client
+        self.max_active = max_active
+        self.n_threads = n_threads
+        self.max_request_retries = max_request_retries
+        self.n_batches = 0
+
+    def _advance(self, job: _Job, response: dict | Exception | None) -> tuple[str, str] | None:
+        """Resume the agent until it needs the next query. Returns the exit status if it is done."""
+        try:
+            if response is None:
+                job.messages = next(job.steps)
+            elif isinstance(response, Exception):
+                job.messages = job.steps.throw(response)
+            else:
+                job.messages = job.steps.send(job.agent.model.process_batch_response(response))  # type: ignore
+        except StopIteration as e:
+            return e.value
+        return None
+
+    def run(
+        self,
+        job_ids: Iterable[str],
+        start_job: Callable[[str], tuple[DefaultAgent, str]],
+        on_finished: Callable[[str, DefaultAgent | None, str, str, dict | None], None],
+    ) -> None:
+        """Run all jobs.
+
+        Args:
+            job_ids: Ids of the jobs (e.g., instance ids).
+            start_job: Returns the agent and task of a job (called once the job is started).
+            on_finished: Called with job id, agent, exit status, result and extra info (e.g., a traceback).
+        """
+        queue = list(job_ids)
+        active: dict[str, _Job] = {}
+
+        def finish(job_id: str, agent: DefaultAgent | None, exception: Exception) -> None:
+            logger.error(f"Error in job {job_id}: {exception}", exc_info=True)
+            on_finished(job_id, agent, type(exception).__name__, str(exception), {"traceback": traceback.format_exc()})
+
+        def step(job: _Job, response: dict | Exception | None) -> None:
+            try:
+                exit_status = self._advance(job, response)
+            except Exception as e:
+                active.pop(job.job_id)
+                finish(job.job_id, job.agent, e)
+                return
+            if exit_status is not None:
+                active.pop(job.job_id)
+                on_finished(job.job_id, job.agent, *exit_status, None)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+
+            def advance_all(responses: dict[str, dict | Exception | None]) -> None:
+                futures = [executor.submit(step, active[job_id], response) for job_id, response in responses.items()]
+                for future in futures:
+                    future.result()
+
+            while queue or active:
+                new_jobs: dict[str, dict | Exception | None] = {}
+                while queue and (self.max_active <= 0 or len(active) < self.max_active):
+                    job_id = queue.pop(0)
+                    try:
+                        agent, task = start_job(job_id)
+                    except Exception as e:
+                        finish(job_id, None, e)
+                        continue
+                    active[job_id] = _Job(job_id=job_id, agent=agent, steps=agent.run_steps(task))
+                    new_jobs[job_id] = None
+                advance_all(new_jobs)
+                if not active:
+                    continue
+                bodies = {job_id: job.agent.model.get_batch_request(job.messages) for job_id, job in active.items()}  # type: ignore
+                try:
+                    results = self.client.run(bodies)
+                except BatchError as e:
+                    logger.error(f"Batch failed, resubmitting: {e}")
+                    results = {job_id: e for job_id in bodies}
+                self.n_batches += 1
+                responses: dict[str, dict | Exception | None] = {}
+                for job_id, job in list(active.items()):
+                    result = results.get(job_id, BatchError(f"No result for {job_id}"))
+                    if isinstance(result, BatchError):
+                        job.n_failed_requests += 1
+                        if job.n_failed_requests <= self.max_request_retries:
+                            continue  # the same messages are resubmitted with the next batch
+                    else:
+                        job.n_failed_requests = 0
+                    responses[job_id] = result
+                advance_all(responses)
@@ -0,0 +1,241 @@
+"""Prepare the environments of upcoming instances while the agents of the current instances run.
+
+Without prefetching, every worker pulls the image and starts the container right before its agent
+runs, so that time is on the critical path of every instance. `EnvironmentPool` keeps a look-ahead
+pipeline instead: while agents are running, the environments of the next `lookahead` instances (in
+the order of the instance list) are started in the background with at most `max_concurrent` at a
+time. A worker then (usually) gets an environment that is already running.
+
+Pool hits, the time that workers waited for their environment, environment startup time,
+time-to-first-step and image pulls (see `ImageManager`) are recorded in `EnvironmentMetrics` (written to `environment_metrics.{json,prom}`
+next to the model metrics).
+"""
+
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from minisweagent import Environment
+from minisweagent.models.utils.metrics import Histogram
+
+if TYPE_CHECKING:
+    from minisweagent.run.extra.utils.image_manager import ImageManager
+
+logger = logging.getLogger("environment_pool")
+
+STARTUP_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, float("inf"))
+"""Upper bounds (in seconds) of the histogram buckets (pulling an image can take minutes)."""
+
+
+class EnvironmentMetrics:
+    def __init__(self):
+        self.startup = Histogram(STARTUP_BUCKETS)
+        """Time to create an environment (pull image, start container)."""
+        self.wait = Histogram(STARTUP_BUCKETS)
+        """Time that workers waited for their environment."""
+        self.time_to_first_step = Histogram(STARTUP_BUCKETS)
+        """Time from the start of an instance to the first step of its agent."""
+        self.n_hits = 0
+        """The environment was ready when the worker asked for it."""
+        self.n_partial_hits = 0
+        """The environment was still being prepared when the worker asked for it."""
+        self.n_misses = 0
+        """The environment was created on demand."""
+        self.n_prefetch_errors = 0
+        """Prefetching failed (the environment was then created on demand)."""
+        self.n_discarded = 0
+        """Prepared environments that were never used (e.g., because the run was cancelled)."""
+        self.pull = Histogram(STARTUP_BUCKETS)
+        """Time to pull an image (see `ImageManager`)."""
+        self.pull_wait = Histogram(STARTUP_BUCKETS)
+        """Time that environments waited for their image to be pulled."""
+        self.n_pulls = 0
+        self.n_pull_errors = 0
+        self.n_evictions = 0
+        """Images that were removed to free disk space."""
+        self._lock = threading.Lock()
+
+    def count(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def snapshot(self) -> dict[str, Any]:
+        n_requests = self.n_hits + self.n_partial_hits + self.n_misses
+        summary: dict[str, Any] = {
+            "timestamp": time.time(),
+            "n_hits": self.n_hits,
+            "n_partial_hits": self.n_partial_hits,
+            "n_misses": self.n_misses,
+            "n_prefetch_errors": self.n_prefetch_errors,
+            "n_discarded": self.n_discarded,
+            "hit_rate": (self.n_hits + self.n_partial_hits) / n_requests if n_requests else 0.0,
+            "n_pulls": self.n_pulls,
+            "n_pull_errors": self.n_pull_errors,
+            "n_evictions": self.n_evictions,
+        }
+        for name in ["startup", "wait", "time_to_first_step", "pull", "pull_wait"]:
+            histogram: Histogram = getattr(self, name)
+            summary[f"{name}_mean"] = histogram.sum / histogram.count if histogram.count else None
+            summary[f"{name}_p50"] = histogram.quantile(0.5)
+            summary[f"{name}_p95"] = histogram.quantile(0.95)
+        return summary
+
+    def to_openmetrics(self) -> str:
+        lines: list[str] = []
+        for name, help_text, attr in [
+            ("mswea_environment_pool_hits", "Environments that were ready when requested.", "n_hits"),
+            ("mswea_environment_pool_partial_hits", "Environments that were still starting.", "n_partial_hits"),
+            ("mswea_environment_pool_misses", "Environments created on demand.", "n_misses"),
+            ("mswea_environment_prefetch_errors", "Failed prefetches.", "n_prefetch_errors"),
+            ("mswea_environment_discarded", "Prepared environments that were never used.", "n_discarded"),
+            ("mswea_image_pulls", "Images pulled.", "n_pulls"),
+            ("mswea_image_pull_errors", "Failed image pulls.", "n_pull_errors"),
+            ("mswea_image_evictions", "Images removed to free disk space.", "n_evictions"),
+        ]:
+            lines += [f"# TYPE {name} counter", f"# HELP {name} {help_text}", f"{name}_total {getattr(self, attr)}"]
+        for name, help_text, attr in [
+            ("mswea_environment_startup_seconds", "Time to create an environment.", "startup"),
+            ("mswea_environment_wait_seconds", "Time workers waited for their environment.", "wait"),
+            ("mswea_time_to_first_step_seconds", "Time from instance start to the first step.", "time_to_first_step"),
+            ("mswea_image_pull_seconds", "Time to pull an image.", "pull"),
+            ("mswea_image_pull_wait_seconds", "Time environments waited for their image.", "pull_wait"),
+        ]:
+            histogram: Histogram = getattr(self, attr)
+            lines += [f"# TYPE {name} histogram", f"# HELP {name} {help_text}"]
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+            lines += [f"{name}_count {histogram.count}", f"{name}_sum {histogram.sum}"]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir: Path) -> None:
+        """Write `environment_metrics.prom` and `environment_metrics.json` atomically."""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for filename, text in [
+            ("environment_metrics.prom", self.to_openmetrics()),
+            ("environment_metrics.json", json.dumps(self.snapshot(), indent=2)),
+        ]:
+            tmp_path = output_dir / f".{filename}.tmp"
+            tmp_path.write_text(text)
+            tmp_path.replace(output_dir / filename)
+
+
+class EnvironmentPool:
+    def __init__(
+        self,
+        factory: Callable[[dict], Environment],
+        instances: list[dict],
+        *,
+        lookahead: int = 0,
+        max_concurrent: int = 2,
+        metrics: EnvironmentMetrics | None = None,
+        image_manager: "ImageManager | None" = None,
+    ):
+        """Args:
+        factory: Creates the environment of an instance.
+        instances: All instances of the run, in the order in which they will be processed.
+        lookahead: Number of environments to prepare ahead of time (0: create all environments on demand).
+        max_concurrent: Maximum number of environments that are prepared at the same time.
+        image_manager: Makes sure that the image is available before an environment is created
+            (and is told when an instance is done with it, see `release`).
+        """
+        self.factory = factory
+        self.lookahead = lookahead
+        self.metrics = metrics or EnvironmentMetrics()
+        self.image_manager = image_manager
+        self._queue = deque(instances)
+        """Instances that are neither prefetched nor claimed yet."""
+        self._prefetched: dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(max_concurrent, 1), thread_name_prefix="environment-prefetch"
+        )
+        with self._lock:
+            self._fill()
+
+    def _fill(self) -> None:
+        """Start preparing the next environments. Must be called with the lock held."""
+        while not self._closed and len(self._prefetched) < self.lookahead and self._queue:
+            instance = self._queue.popleft()
+            self._prefetched[instance["instance_id"]] = self._executor.submit(self._create, instance)
+
+    def _unqueue(self, instance_id: str) -> None:
+        for i, queued in enumerate(self._queue):
+            if queued["instance_id"] == instance_id:
+                del self._queue[i]
+                return
+
+    def _create(self, instance: dict) -> Environment:
+        if self.image_manager is not None:
+            self.image_manager.ensure(instance)
+        start = time.perf_counter()
+        env = self.factory(instance)
+        self.metrics.startup.observe(time.perf_counter() - start)
+        return env
+
+    def get(self, instance: dict) -> Environment:
+        """Return the environment of the instance (waiting for it if it is still being prepared)."""
+        start = time.perf_counter()
+        with self._lock:
+            future = self._prefetched.pop(instance["instance_id"], None)
+            if future is None:
+                self._unqueue(instance["instance_id"])
+            self._fill()
+        env = None
+        if future is not None:
+            self.metrics.count("n_hits" if future.done() else "n_partial_hits")
+            try:
+                env = future.result()
+            except Exception as e:
+                logger.warning(f"Prefetching the environment of {instance['instance_id']} failed, retrying: {e}")
+                self.metrics.count("n_prefetch_errors")
+        else:
+            self.metrics.count("n_misses")
+        if env is None:
+            env = self._create(instance)
+        self.metrics.wait.observe(time.perf_counter() - start)
+        return env
+
+    def release(self, instance: dict) -> None:
+        """The instance is done (its image can be removed if no other instance needs it)."""
+        if self.image_manager is not None:
+            self.image_manager.release(instance)
+
+    def record_first_step(self, started_at: float) -> None:
+        """Record the time-to-first-step of an instance that was started at `started_at` (`time.perf_counter`)."""
+        self.metrics.time_to_first_step.observe(time.perf_counter() - started_at)
+
+    def close(self) -> None:
+        """Stop prefetching and clean up environments that were prepared but never used."""
+        with self._lock:
+            self._closed = True
+            prefetched, self._prefetched = list(self._prefetched.values()), {}
+        for future in prefetched:
+            if not future.cancel():
+                future.add_done_callback(self._discard)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.image_manager is not None:
+            self.image_manager.close()
+
+    def _discard(self, future: concurrent.futures.Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.metrics.count("n_discarded")
+        if hasattr(env := future.result(), "cleanup"):
+            env.cleanup()
+
+    def __enter__(self) -> "EnvironmentPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
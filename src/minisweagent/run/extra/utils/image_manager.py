@@ -0,0 +1,241 @@
+"""Pull the images of a batch run ahead of time and remove images that are no longer needed.
+
+SWE-bench has an image per instance, and they usually don't all fit on the disk of a node.
+`ImageManager` pulls the images in the order of the instances (with bounded parallelism and
+at most `lookahead` images that have been pulled but not used yet). It tracks how many queued
+instances still need each image. When the disk usage of the docker root directory crosses
+`max_disk_usage`, the least recently used images that no queued instance needs are removed.
+Only images of the run are ever removed.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Literal
+
+from minisweagent.run.extra.utils.environment_pool import EnvironmentMetrics
+
+logger = logging.getLogger("image_manager")
+
+
+@dataclass
+class ImageManagerConfig:
+    executable: str = os.getenv("MSWEA_DOCKER_EXECUTABLE", "docker")
+    """Path to the docker/podman executable."""
+    lookahead: int = 8
+    """Maximum number of images that have been pulled ahead of time but not used yet."""
+    max_concurrent_pulls: int = 2
+    max_disk_usage: float = 0.85
+    """Fraction of the disk (of `disk_path`) above which unneeded images are removed (and pulling ahead pauses).
+    Pulls that are already running aren't accounted for, so leave room for `max_concurrent_pulls` images.
+    """
+    disk_path: str = ""
+    """Directory whose disk is monitored. Defaults to the root directory of the docker daemon."""
+    pull_timeout: int = 1800
+
+
+@dataclass
+class _Image:
+    n_needed: int
+    """Number of instances that need this image and haven't finished yet."""
+    status: Literal["missing", "pulling", "present", "failed", "removed"] = "missing"
+    used: bool = False
+    last_used: float = 0.0
+    pulled: threading.Event | None = None
+
+
+class ImageManager:
+    def __init__(
+        self,
+        instances: list[dict],
+        get_image_name: Callable[[dict], str],
+        *,
+        metrics: EnvironmentMetrics | None = None,
+        config_class: type = ImageManagerConfig,
+        **kwargs,
+    ):
+        """Args:
+        instances: All instances of the run, in the order in which they will be processed.
+        get_image_name: Returns the image of an instance.
+        metrics: Pull times, waits for pulls and evictions are recorded here.
+
+        See `ImageManagerConfig` for keyword arguments.
+        """
+        self.config = config_class(**kwargs)
+        self.get_image_name = get_image_name
+        self.metrics = metrics or EnvironmentMetrics()
+        self._images: dict[str, _Image] = {}
+        self._order: list[str] = []
+        for instance in instances:
+            if (name := get_image_name(instance)) not in self._images:
+                self._images[name] = _Image(n_needed=0)
+                self._order.append(name)
+            self._images[name].n_needed += 1
+        for name in self._list_local_images() & self._images.keys():
+            self._images[name].status = "present"
+        self._cond = threading.Condition()
+        self._evict_lock = threading.Lock()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(self.config.max_concurrent_pulls, 1), thread_name_prefix="image-pull"
+        )
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True, name="image-dispatcher")
+        self._dispatcher.start()
+
+    # ---- docker ----
+
+    def _run(self, *args: str, timeout: float = 60) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [self.config.executable, *args], capture_output=True, text=True, timeout=timeout, check=True
+        )
+
+    def _list_local_images(self) -> set[str]:
+        try:
+            output = self._run("images", "--format", "{{.Repository}}:{{.Tag}}").stdout
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"Could not list local images: {e}")
+            return set()
+        return {line.strip() for line in output.splitlines() if line.strip()}
+
+    def _get_disk_path(self) -> str:
+        if not self.config.disk_path:
+            try:
+                self.config.disk_path = self._run("info", "--format", "{{.DockerRootDir}}").stdout.strip() or "/"
+            except (subprocess.SubprocessError, OSError):
+                self.config.disk_path = "/"
+        return self.config.disk_path
+
+    def disk_usage(self) -> float:
+        """Used fraction of the disk that holds the images."""
+        usage = shutil.disk_usage(self._get_disk_path())
+        return usage.used / usage.total
+
+    def _pull(self, name: str) -> None:
+        start = time.perf_counter()
+        try:
+            if self._closed:
+                raise RuntimeError("Image manager was closed")
+            self._run("pull", name, timeout=self.config.pull_timeout)
+        except (subprocess.SubprocessError, OSError, RuntimeError) as e:
+            stderr = getattr(e, "stderr", "") or ""
+            logger.warning(f"Failed to pull {name}: {e} {stderr.strip()}")
+            self.metrics.count("n_pull_errors")
+            status = "failed"
+        else:
+            self.metrics.pull.observe(time.perf_counter() - start)
+            self.metrics.count("n_pulls")
+            status = "present"
+        with self._cond:
+            image = self._images[name]
+            image.status = status  # type: ignore[assignment]
+            assert image.pulled is not None
+            image.pulled.set()
+            self._cond.notify_all()
+
+    def _remove(self, name: str) -> bool:
+        try:
+            self._run("image", "rm", name)
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"Failed to remove {name}: {e}")
+            return False
+        logger.info(f"Removed image {name}")
+        self.metrics.count("n_evictions")
+        return True
+
+    # ---- scheduling ----
+
+    def _start_pull(self, name: str) -> None:
+        """Must be called with the lock held."""
+        image = self._images[name]
+        image.status = "pulling"
+        image.pulled = threading.Event()
+        self._executor.submit(self._pull, name)
+
+    def _n_ahead(self) -> int:
+        return sum(
+            not i.used and i.status in ["pulling", "present"] and i.pulled is not None for i in self._images.values()
+        )
+
+    def evict(self) -> None:
+        """Remove the least recently used unneeded images until the disk usage is below `max_disk_usage`."""
+        with self._evict_lock:
+            with self._cond:
+                candidates = sorted(
+                    (i.last_used, name) for name, i in self._images.items() if i.status == "present" and i.n_needed == 0
+                )
+            for _, name in candidates:
+                if self.disk_usage() < self.config.max_disk_usage:
+                    return
+                with self._cond:
+                    if self._images[name].status != "present" or self._images[name].n_needed > 0:
+                        continue
+                    self._images[name].status = "removed"
+                if not self._remove(name):  # e.g., still used by a container
+                    with self._cond:
+                        self._images[name].status = "present"
+
+    def _dispatch(self) -> None:
+        """Start pulling the next missing images whenever there's room (in the pipeline and on disk)."""
+        for name in self._order:
+            with self._cond:
+                while not self._closed and self._n_ahead() >= self.config.lookahead:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if self._images[name].status != "missing" or self._images[name].n_needed == 0:
+                    continue
+            while self.disk_usage() >= self.config.max_disk_usage:
+                self.evict()
+                if self.disk_usage() < self.config.max_disk_usage:
+                    break
+                with self._cond:  # wait until an instance finishes and its image can be removed
+                    if self._closed:
+                        return
+                    self._cond.wait(timeout=30)
+            with self._cond:
+                if self._images[name].status == "missing" and not self._closed:
+                    self._start_pull(name)
+
+    def ensure(self, instance: dict) -> float:
+        """Make sure the image of the instance is available (pulling it now if it hasn't been pulled ahead).
+        Returns the time that we waited for it.
+        """
+        name = self.get_image_name(instance)
+        start = time.perf_counter()
+        with self._cond:
+            image = self._images.setdefault(name, _Image(n_needed=1))
+            if image.status in ["missing", "removed", "failed"]:
+                self._start_pull(name)
+            pulled = image.pulled
+        if pulled is not None:
+            pulled.wait()
+        with self._cond:
+            image.used = True
+            image.last_used = time.monotonic()
+            self._cond.notify_all()
+        wait = time.perf_counter() - start
+        self.metrics.pull_wait.observe(wait)
+        return wait
+
+    def release(self, instance: dict) -> None:
+        """The instance is done with its image. Images that no queued instance needs can be removed."""
+        name = self.get_image_name(instance)
+        with self._cond:
+            image = self._images[name]
+            image.n_needed = max(image.n_needed - 1, 0)
+            image.last_used = time.monotonic()
+            self._cond.notify_all()
+        if image.n_needed == 0 and self.disk_usage() >= self.config.max_disk_usage:
+            self.evict()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._executor.shutdown(wait=False)  # pulls that haven't started yet fail right away
@@ -11,6 +11,7 @@ subcommands = [
     ("minisweagent.run.github_issue", ["github-issue", "gh"], "Run on a GitHub issue"),
     ("minisweagent.run.extra.swebench", ["swebench"], "Evaluate on SWE-bench (batch mode)"),
     ("minisweagent.run.extra.swebench_single", ["swebench-single"], "Evaluate on SWE-bench (single instance)"),
+    ("minisweagent.run.extra.mock_server", ["mock-server"], "Run a local mock OpenAI-compatible server (load tests)"),
 ]
 
 
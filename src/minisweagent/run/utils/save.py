@@ -3,6 +3,7 @@ from collections.abc import Callable
 from pathlib import Path
 
 from minisweagent import Agent, __version__
+from minisweagent.models.utils.usage import get_usage_totals
 
 
 def save_traj(
@@ -44,6 +45,9 @@ def save_traj(
     if agent is not None:
         data["info"]["model_stats"]["instance_cost"] = agent.model.cost
         data["info"]["model_stats"]["api_calls"] = agent.model.n_calls
+        data["info"]["model_stats"] |= get_usage_totals(agent.messages)
+        if hasattr(agent.model, "get_cache_stats"):
+            data["info"]["model_stats"] |= agent.model.get_cache_stats()
         data["messages"] = agent.messages
     if extra_info:
         data["info"].update(extra_info)
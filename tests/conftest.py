@@ -5,6 +5,8 @@ from pathlib import Path
 import pytest
 
 from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.utils.metrics import MetricsRegistry
+from minisweagent.models.utils.usage import TokenUsage
 
 # Global lock for tests that modify global state - this works across threads
 _global_stats_lock = threading.Lock()
@@ -21,10 +23,14 @@ def reset_global_stats():
         # Reset at start
         GLOBAL_MODEL_STATS._cost = 0.0  # noqa: protected-access
         GLOBAL_MODEL_STATS._n_calls = 0  # noqa: protected-access
+        GLOBAL_MODEL_STATS._usage = TokenUsage()  # noqa: protected-access
+        GLOBAL_MODEL_STATS.metrics = MetricsRegistry()
         yield
         # Reset at end to clean up
         GLOBAL_MODEL_STATS._cost = 0.0  # noqa: protected-access
         GLOBAL_MODEL_STATS._n_calls = 0  # noqa: protected-access
+        GLOBAL_MODEL_STATS._usage = TokenUsage()  # noqa: protected-access
+        GLOBAL_MODEL_STATS.metrics = MetricsRegistry()
 
 
 def get_test_data(trajectory_name: str) -> dict[str, list[str]]:
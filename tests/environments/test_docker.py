@@ -228,3 +228,76 @@ def test_docker_environment_custom_container_timeout(executable):
             )
     finally:
         env.cleanup()
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("executable", environment_params)
+def test_docker_environment_session(executable):
+    """Test that the session mode has the same semantics as a new exec per command."""
+    env = DockerEnvironment(
+        image="python:3.11", executable=executable, session=True, env={"A": "1"}, cwd="/tmp", timeout=2
+    )
+    try:
+        assert env.execute("echo $A; pwd; exit 42") == {"output": "1\n/tmp\n", "returncode": 42}
+        assert env.execute("cd /; export B=2")["returncode"] == 0
+        assert env.execute("pwd; echo B=$B") == {"output": "/tmp\nB=\n", "returncode": 0}
+        with pytest.raises(subprocess.TimeoutExpired):
+            env.execute("sleep 10")
+        assert env.execute("echo recovered")["output"] == "recovered\n"
+    finally:
+        env.cleanup()
+
+
+_FAKE_DOCKER = """#!/bin/bash
+# Stand-in for the docker CLI: `run` prints a container id, `exec` runs the command on the host
+case "$1" in
+    run) echo fake-container ;;
+    exec)
+        shift
+        while [ "$1" != fake-container ]; do
+            case "$1" in
+                -e) export "$2"; shift 2 ;;
+                -w) cd "$2"; shift 2 ;;
+                *) shift ;;
+            esac
+        done
+        shift
+        echo "exec" >> "$(dirname "$0")/exec.log"
+        exec "$@"
+        ;;
+esac
+"""
+
+
+def test_docker_environment_session_with_fake_executable(tmp_path):
+    """One `docker exec` for all commands of the session, with exact exit codes and timeouts."""
+    executable = tmp_path / "docker"
+    executable.write_text(_FAKE_DOCKER)
+    executable.chmod(0o755)
+    env = DockerEnvironment(
+        image="any", executable=str(executable), session=True, cwd=str(tmp_path), env={"A": "1"}, timeout=1
+    )
+    try:
+        assert env.execute("echo $A; pwd; exit 42") == {"output": f"1\n{tmp_path}\n", "returncode": 42}
+        assert env.execute("cd /; export B=2") == {"output": "", "returncode": 0}
+        assert env.execute("pwd; echo B=$B") == {"output": f"{tmp_path}\nB=\n", "returncode": 0}
+        assert env.execute("pwd", cwd="/")["output"] == "/\n"
+        assert (tmp_path / "exec.log").read_text().count("exec") == 1
+        with pytest.raises(subprocess.TimeoutExpired):
+            env.execute("sleep 10")
+        assert env.execute("echo recovered")["output"] == "recovered\n"
+        assert (tmp_path / "exec.log").read_text().count("exec") == 2
+    finally:
+        env.cleanup()
+
+
+def test_docker_environment_session_without_subshell(tmp_path):
+    executable = tmp_path / "docker"
+    executable.write_text(_FAKE_DOCKER)
+    executable.chmod(0o755)
+    env = DockerEnvironment(image="any", executable=str(executable), session=True, session_subshell=False)
+    try:
+        env.execute("export B=2")
+        assert env.execute("echo B=$B")["output"] == "B=2\n"
+    finally:
+        env.cleanup()
@@ -0,0 +1,264 @@
+import json
+import os
+import socketserver
+import subprocess
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from minisweagent.environments import get_environment
+from minisweagent.environments.docker_api import DockerAPIEnvironment
+from minisweagent.environments.utils.docker_client import DockerAPIError, DockerClient, demux, translate_run_args
+
+
+def _frame(stream: int, payload: bytes) -> bytes:
+    return bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+
+class FakeDockerDaemon(socketserver.ThreadingUnixStreamServer):
+    """Implements the endpoints used by `DockerClient`. Execs run on the host."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        self.images = {"local:latest"}
+        self.containers: dict[str, dict] = {}
+        self.execs: dict[str, dict] = {}
+        self.requests: list[tuple[str, str]] = []
+        super().__init__(socket_path, _FakeDockerHandler)
+
+
+class _FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeDockerDaemon
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method: str) -> None:
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"null")
+        parts = url.path.strip("/").split("/")
+        daemon = self.server
+        daemon.requests.append((method, url.path))
+        match method, parts:
+            case "GET", ["_ping"]:
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"OK")
+            case "POST", ["images", "create"]:
+                image = f"{query['fromImage']}:{query['tag']}"
+                if query["fromImage"] == "missing":
+                    self._send_json(404, {"message": f"pull access denied for {image}"})
+                    return
+                daemon.images.add(image)
+                self._send_json(200, {"status": f"Downloaded newer image for {image}"})
+            case "POST", ["containers", "create"]:
+                image = body["Image"] if ":" in body["Image"] else f"{body['Image']}:latest"
+                if image not in daemon.images:
+                    self._send_json(404, {"message": f"No such image: {image}"})
+                    return
+                container_id = uuid.uuid4().hex
+                daemon.containers[container_id] = {"Id": container_id, "Name": query["name"], "Body": body}
+                self._send_json(201, {"Id": container_id})
+            case "POST", ["containers", container_id, "start"]:
+                daemon.containers[container_id]["State"] = "running"
+                self.send_response(204)
+                self.end_headers()
+            case "DELETE", ["containers", container_id]:
+                if daemon.containers.pop(container_id, None) is None:
+                    self._send_json(404, {"message": f"No such container: {container_id}"})
+                    return
+                self.send_response(204)
+                self.end_headers()
+            case "GET", ["containers", "json"]:
+                self._send_json(200, list(daemon.containers.values()))
+            case "POST", ["containers", container_id, "exec"]:
+                exec_id = uuid.uuid4().hex
+                daemon.execs[exec_id] = {"Container": container_id, **body}
+                self._send_json(201, {"Id": exec_id})
+            case "POST", ["exec", exec_id, "start"]:
+                self._start_exec(daemon.execs[exec_id])
+            case "GET", ["exec", exec_id, "json"]:
+                self._send_json(200, {"ExitCode": daemon.execs[exec_id]["ExitCode"], "Running": False})
+            case _:
+                self._send_json(404, {"message": f"page not found: {method} {url.path}"})
+
+    def _start_exec(self, exec_config: dict) -> None:
+        """Like the real daemon: hijack the connection and send a multiplexed stream until the process exits."""
+        home = str(Path(self.server.server_address).parent)  # no profile files that print stuff
+        env = {"PATH": os.environ["PATH"], "HOME": home, **dict(e.split("=", 1) for e in exec_config.get("Env", []))}
+        process = subprocess.Popen(
+            exec_config["Cmd"],
+            cwd=exec_config.get("WorkingDir") or None,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.multiplexed-stream")
+        self.end_headers()
+        lock = threading.Lock()
+
+        def forward(pipe, stream: int) -> None:
+            while chunk := os.read(pipe.fileno(), 65536):
+                with lock:
+                    self.wfile.write(_frame(stream, chunk))
+                    self.wfile.flush()
+
+        threads = [
+            threading.Thread(target=forward, args=(process.stdout, 1)),
+            threading.Thread(target=forward, args=(process.stderr, 2)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        exec_config["ExitCode"] = process.wait()
+        self.close_connection = True
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+@pytest.fixture
+def docker_daemon(tmp_path):
+    socket_path = str(tmp_path / "docker.sock")
+    daemon = FakeDockerDaemon(socket_path)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    daemon.server_close()
+
+
+def _environment(daemon: FakeDockerDaemon, **kwargs) -> DockerAPIEnvironment:
+    return DockerAPIEnvironment(**{"image": "local", "socket": daemon.server_address, **kwargs})
+
+
+def test_demux_frames_split_across_chunks():
+    stream = _frame(1, b"out\n") + _frame(2, b"err\n") + _frame(1, b"")
+    chunks = [stream[i : i + 3] for i in range(0, len(stream), 3)]
+    assert list(demux(chunks)) == [(1, b"out\n"), (2, b"err\n"), (1, b"")]
+    with pytest.raises(DockerAPIError, match="Truncated"):
+        list(demux([stream[:-1]]))
+
+
+def test_translate_run_args():
+    body = translate_run_args(
+        ["--rm", "-e", "A=1", "--env=B=2", "-v", "/a:/b:ro", "--network", "none", "-m", "2g", "--cpus=1.5"]
+        + ["--label", "run=x", "--platform", "linux/amd64", "--tmpfs", "/tmp:size=64m", "-u", "1000"]
+    )
+    assert body["Env"] == ["A=1", "B=2"]
+    assert body["Labels"] == {"run": "x"}
+    assert body["User"] == "1000"
+    assert body["_platform"] == "linux/amd64"
+    assert body["HostConfig"] == {
+        "AutoRemove": True,
+        "Binds": ["/a:/b:ro"],
+        "NetworkMode": "none",
+        "Memory": 2 * 1024**3,
+        "NanoCpus": 1_500_000_000,
+        "Tmpfs": {"/tmp": "size=64m"},
+    }
+
+
+@pytest.mark.parametrize("run_args", [["--gpus", "all"], ["-it"], ["--env"]])
+def test_translate_run_args_rejects_unsupported(run_args):
+    with pytest.raises(ValueError, match="docker run option"):
+        translate_run_args(run_args)
+
+
+def test_docker_api_environment_execute(docker_daemon, tmp_path):
+    env = _environment(docker_daemon, cwd=str(tmp_path), env={"TEST_VAR": "test value"}, run_args=["--rm"])
+    try:
+        container = docker_daemon.containers[env.container_id]
+        assert container["Name"].startswith("minisweagent-")
+        assert container["Body"]["Cmd"] == ["sleep", "2h"]
+        assert container["Body"]["HostConfig"] == {"AutoRemove": True}
+        assert env.execute("echo $TEST_VAR; pwd") == {"output": f"test value\n{tmp_path}\n", "returncode": 0}
+        assert env.execute("echo err >&2; exit 3") == {"output": "err\n", "returncode": 3}
+        assert env.execute("pwd", cwd="/")["output"] == "/\n"
+        assert env.execute("head -c 200000 /dev/zero | tr '\\0' x")["output"] == "x" * 200000
+    finally:
+        env.cleanup()
+    assert docker_daemon.containers == {}
+    env.cleanup()  # idempotent
+
+
+def test_docker_api_environment_forward_env(docker_daemon, monkeypatch):
+    monkeypatch.setenv("HOST_VAR", "from host")
+    monkeypatch.setenv("OVERRIDDEN", "from host")
+    env = _environment(docker_daemon, forward_env=["HOST_VAR", "OVERRIDDEN", "UNSET_VAR"], env={"OVERRIDDEN": "env"})
+    try:
+        assert env.execute("echo $HOST_VAR/$OVERRIDDEN/${UNSET_VAR-unset}")["output"] == "from host/env/unset\n"
+    finally:
+        env.cleanup()
+
+
+def test_docker_api_environment_timeout(docker_daemon):
+    env = _environment(docker_daemon, timeout=1)
+    try:
+        with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+            env.execute("echo partial; sleep 5")
+        assert exc_info.value.output == b"partial\n"
+        assert env.execute("echo recovered")["output"] == "recovered\n"
+    finally:
+        env.cleanup()
+
+
+def test_docker_api_environment_pulls_missing_image(docker_daemon):
+    env = get_environment({"image": "python:3.11", "socket": docker_daemon.server_address}, default_type="docker_api")
+    env.cleanup()
+    assert "python:3.11" in docker_daemon.images
+    assert [r for r in docker_daemon.requests if r[1] == "/containers/create"] == [("POST", "/containers/create")] * 2
+    with pytest.raises(DockerAPIError, match="pull access denied"):
+        _environment(docker_daemon, image="missing")
+    assert docker_daemon.containers == {}
+
+
+def test_docker_client_shares_connections(docker_daemon):
+    client = DockerClient(docker_daemon.server_address)
+    assert client.ping()
+    for _ in range(5):
+        client.list_containers(labels={"run": ""})
+    assert not DockerClient(str(docker_daemon.server_address) + ".missing").ping()
+    client.close()
+
+
+def test_docker_api_environment_unsupported_run_args(docker_daemon):
+    with pytest.raises(ValueError, match="environment_class: docker"):
+        _environment(docker_daemon, run_args=["--gpus", "all"])
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not Path("/var/run/docker.sock").exists(), reason="Docker socket not available")
+def test_docker_api_environment_real_docker():
+    env = DockerAPIEnvironment(image="python:3.11", run_args=["--label", "test=minisweagent"], env={"A": "1"})
+    try:
+        assert env.execute("echo $A; pwd") == {"output": "1\n/\n", "returncode": 0}
+        assert env.execute("echo err >&2; exit 3") == {"output": "err\n", "returncode": 3}
+        assert env.client.list_containers(labels={"test": "minisweagent"})
+    finally:
+        env.cleanup()
@@ -199,3 +199,51 @@ def test_local_environment_shell_features():
     result = env.execute("echo $(echo 'nested')")
     assert result["returncode"] == 0
     assert "nested" in result["output"]
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "echo 'hello world'",
+        "printf 'no newline'",
+        "echo out; echo err >&2; exit 3",
+        "ls /nonexistent_directory_12345",
+        "echo $TEST_VAR; pwd",
+        "cat",
+        "cd / && pwd",
+    ],
+)
+def test_local_environment_shell_pool_matches_subprocess(command, tmp_path):
+    """The shell pool gives the same results as a new shell per command."""
+    kwargs = {"cwd": str(tmp_path), "env": {"TEST_VAR": "test value"}}
+    expected = LocalEnvironment(**kwargs).execute(command)
+    assert LocalEnvironment(shell_pool_size=2, **kwargs).execute(command) == expected
+
+
+def test_local_environment_shell_pool_isolation(tmp_path):
+    """Commands don't see the directory or variable changes of previous commands."""
+    env = LocalEnvironment(shell_pool_size=1, cwd=str(tmp_path))
+    env.execute("cd /; export LEAKED=1")
+    assert env.execute("pwd; echo LEAKED=$LEAKED")["output"] == f"{tmp_path}\nLEAKED=\n"
+    other = LocalEnvironment(shell_pool_size=1, env={"OTHER": "1"})
+    assert other.execute("echo $OTHER $TEST_VAR", cwd="/")["output"] == "1\n"
+
+
+def test_local_environment_shell_pool_timeout():
+    env = LocalEnvironment(shell_pool_size=1, timeout=1)
+    with pytest.raises(subprocess.TimeoutExpired):
+        env.execute("echo partial; sleep 5")
+    assert env.execute("echo recovered")["output"] == "recovered\n"
+
+
+def test_local_environment_shell_pool_threads(tmp_path):
+    """Parallel environments never share a shell at the same time."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    env = LocalEnvironment(shell_pool_size=2)
+
+    def run(i: int) -> str:
+        return env.execute(f"echo {i}; sleep 0.05; echo {i}", cwd=str(tmp_path))["output"]
+
+    with ThreadPoolExecutor(8) as executor:
+        assert list(executor.map(run, range(16))) == [f"{i}\n{i}\n" for i in range(16)]
@@ -0,0 +1,154 @@
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from minisweagent.environments.docker import DockerEnvironment
+from minisweagent.environments.utils import recycling
+from minisweagent.environments.utils.recycling import (
+    PristineState,
+    RecycledContainer,
+    get_new_changes,
+    get_remove_added_script,
+    parse_changes,
+    parse_duration,
+    put_recycled_container,
+    take_recycled_container,
+)
+
+
+@pytest.fixture(autouse=True)
+def _clear_recycled_containers():
+    recycling.remove_recycled_containers()
+    yield
+    recycling.remove_recycled_containers()
+
+
+def test_parse_changes():
+    assert parse_changes("C /etc\nA /etc/foo\nD /tmp/x\nnoise\n") == {"C /etc", "A /etc/foo", "D /tmp/x"}
+
+
+def test_get_new_changes_ignores_cwd_and_original_changes():
+    pristine = PristineState(head="", fingerprint="", changes={"C /root", "A /root/.cache"})
+    changes = {"C /root", "A /root/.cache", "A /testbed/new.py", "A /tmp/a", "A /tmp/a/b", "D /etc/hosts", "C /usr"}
+    assert get_new_changes(changes, pristine, "/testbed") == {
+        "A": ["/tmp/a", "/tmp/a/b"],
+        "C": ["/usr"],
+        "D": ["/etc/hosts"],
+    }
+    assert get_remove_added_script(["/tmp/a", "/tmp/a/b", "/tmpx"]) == "rm -rf -- /tmp/a /tmpx"
+
+
+def test_parse_duration():
+    assert parse_duration("2h") == 7200
+    assert parse_duration("90") == 90
+    assert parse_duration("1.5m") == 90
+    with pytest.raises(ValueError):
+        parse_duration("forever")
+
+
+def _container(container_id: str, removed: list[str], started_at: float | None = None) -> RecycledContainer:
+    return RecycledContainer(
+        container_id=container_id,
+        pristine=PristineState(head="", fingerprint=""),
+        started_at=time.time() if started_at is None else started_at,
+        cleanup=lambda: removed.append(container_id),
+    )
+
+
+def test_registry_limits_and_expiry():
+    removed: list[str] = []
+    assert put_recycled_container(("a",), _container("c1", removed), max_idle=1)
+    assert not put_recycled_container(("a",), _container("c2", removed), max_idle=1)
+    assert take_recycled_container(("b",)) is None
+    assert take_recycled_container(("a",)).container_id == "c1"  # type: ignore[union-attr]
+    put_recycled_container(("a",), _container("old", removed, started_at=time.time() - 100), max_idle=2)
+    assert take_recycled_container(("a",), lifetime=120, min_remaining=60) is None
+    assert removed == ["old"]
+    put_recycled_container(("a",), _container("c3", removed), max_idle=2)
+    recycling.remove_recycled_containers()
+    assert removed == ["old", "c3"]
+
+
+class _HostDockerEnvironment(DockerEnvironment):
+    """Runs commands on the host. The "writable layer" is the directory `layer` (outside of cwd)."""
+
+    def __init__(self, layer: Path, **kwargs):
+        self.layer = layer
+        self.removed: list[str] = []
+        super().__init__(**kwargs)
+
+    def _start_container(self):
+        self.container_id = f"container-{time.monotonic_ns()}"
+
+    def _exec(self, command: str, cwd: str) -> dict:
+        result = subprocess.run(["bash", "-c", command], cwd=cwd, capture_output=True, text=True)
+        return {"output": result.stdout + result.stderr, "returncode": result.returncode}
+
+    def _get_changes(self) -> set[str]:
+        return {f"A {p}" for p in self.layer.rglob("*")}
+
+    def _remove_container(self, container_id: str) -> None:
+        self.removed.append(container_id)
+
+
+@pytest.fixture
+def repo(tmp_path) -> Path:
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / ".gitignore").write_text("*.pyc\n")
+    (repo / "a.py").write_text("print(1)\n")
+    (repo / "cached.pyc").write_text("original ignored file\n")
+    for cmd in [
+        "git init -q",
+        "git -c user.name=t -c user.email=t@t add -A",
+        "git -c user.name=t -c user.email=t@t commit -qm init",
+    ]:
+        subprocess.run(cmd, shell=True, cwd=repo, check=True)
+    return repo
+
+
+def _make_env(tmp_path: Path, repo: Path) -> _HostDockerEnvironment:
+    (tmp_path / "layer").mkdir(exist_ok=True)
+    return _HostDockerEnvironment(tmp_path / "layer", image="img", cwd=str(repo), recycle=True)
+
+
+def test_container_is_reset_and_reused(tmp_path, repo):
+    env = _make_env(tmp_path, repo)
+    container_id = env.container_id
+    env.execute(
+        "echo changed > a.py && echo new > b.py && mkdir -p build && touch x.pyc build/y.pyc"
+        " && git stash -q -u 2>/dev/null; git checkout -qb feature"
+    )
+    (tmp_path / "layer" / "scratch").mkdir()
+    (tmp_path / "layer" / "scratch" / "file").write_text("outside of cwd")
+    env.cleanup()
+    assert env.removed == []
+    assert env.container_id is None
+
+    env2 = _make_env(tmp_path, repo)
+    assert env2.container_id == container_id
+    assert (repo / "a.py").read_text() == "print(1)\n"
+    assert sorted(p.name for p in repo.iterdir() if p.name != ".git") == [".gitignore", "a.py", "cached.pyc"]
+    assert env2.execute("git stash list && git rev-parse --abbrev-ref HEAD")["output"].strip() in ["master", "main"]
+    assert list((tmp_path / "layer").iterdir()) == []
+    env2.cleanup()
+
+
+def test_container_that_fails_verification_is_removed(tmp_path, repo):
+    env = _make_env(tmp_path, repo)
+    container_id = env.container_id
+    env.layer.joinpath("kept").mkdir()
+    env.pristine.changes = {f"A {env.layer / 'kept'}"}  # type: ignore[union-attr]
+    env.layer.joinpath("kept").rmdir()  # an original file was deleted
+    env.cleanup()
+    assert env.removed == [container_id]
+    assert _make_env(tmp_path, repo).container_id != container_id
+
+
+def test_no_git_repository_disables_recycling(tmp_path):
+    env = _make_env(tmp_path, tmp_path / "layer")
+    assert env.pristine is None
+    env.cleanup()
+    assert len(env.removed) == 1
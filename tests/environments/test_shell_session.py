@@ -0,0 +1,68 @@
+import os
+import subprocess
+
+import pytest
+
+from minisweagent.environments.utils.shell_session import ShellSession
+
+
+@pytest.fixture
+def session():
+    session = ShellSession(["bash", "--noprofile", "--norc"])
+    yield session
+    session.close()
+
+
+def test_exact_output_and_exit_codes(session):
+    assert session.run("echo out; echo err >&2; exit 3") == {"output": "out\nerr\n", "returncode": 3}
+    assert session.run("printf 'no newline'") == {"output": "no newline", "returncode": 0}
+    assert session.run("false")["returncode"] == 1
+    assert session.run("true") == {"output": "", "returncode": 0}
+
+
+def test_arbitrary_command_text(session):
+    command = "cat <<'EOF'\n$HOME `not executed` 'quotes\" \\\nEOF\necho done"
+    assert session.run(command)["output"] == "$HOME `not executed` 'quotes\" \\\ndone\n"
+    assert session.run("echo MSWEA_DONE 0")["output"] == "MSWEA_DONE 0\n"
+    assert session.run("cat")["output"] == ""  # stdin is not the protocol stream
+
+
+def test_subshell_isolation(session, tmp_path):
+    assert session.run("cd /; export A=1; pwd") == {"output": "/\n", "returncode": 0}
+    assert session.run("pwd; echo A=$A", cwd=str(tmp_path))["output"] == f"{tmp_path}\nA=\n"
+    session.run(f"cd {tmp_path}; export A=1", subshell=False)
+    assert session.run("pwd; echo A=$A", subshell=False)["output"] == f"{tmp_path}\nA=1\n"
+    assert session.run("echo $B", env={"B": "x y"})["output"] == "x y\n"
+    assert session.run("true", cwd="/nonexistent")["returncode"] != 0
+
+
+def test_timeout_kills_and_restarts_shell(session):
+    session.run("true")
+    pid = session.process.pid  # type: ignore
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        session.run("echo partial; sleep 10", timeout=0.3)
+    assert exc_info.value.output == b"partial\n"
+    assert session.run("echo back") == {"output": "back\n", "returncode": 0}
+    assert session.process.pid != pid  # type: ignore
+    assert session.n_restarts == 1
+
+
+def test_recovers_from_killed_shell(session):
+    assert session.run("kill -9 $$")["returncode"] == -9
+    assert session.run("exit 4", subshell=False)["returncode"] == 4
+    assert session.run("echo alive") == {"output": "alive\n", "returncode": 0}
+    assert session.n_restarts == 2
+
+
+def test_startup_output_is_discarded(tmp_path):
+    (tmp_path / ".bash_profile").write_text("echo noisy profile\nexport FROM_PROFILE=1\n")
+    session = ShellSession(["bash", "-l"], env={"HOME": str(tmp_path), "PATH": os.environ["PATH"]})
+    try:
+        assert session.run("echo $FROM_PROFILE") == {"output": "1\n", "returncode": 0}
+    finally:
+        session.close()
+
+
+def test_failing_startup():
+    with pytest.raises(RuntimeError, match="exited on startup"):
+        ShellSession(["bash", "-c", "echo broken; exit 1"]).start()
@@ -7,15 +7,15 @@ from minisweagent.models.utils.key_per_thread import get_key_per_thread
 
 def test_anthropic_model_single_key():
     with patch.dict(os.environ, {"ANTHROPIC_API_KEYS": "test-key"}):
-        with patch("minisweagent.models.litellm_model.LitellmModel.query") as mock_query:
-            mock_query.return_value = "response"
+        with patch("minisweagent.models.litellm_model.LitellmModel._completion") as mock_completion:
+            mock_completion.return_value = "response"
 
             model = AnthropicModel(model_name="tardis")
-            result = model.query(messages=[])
+            result = model._query(messages=[])
 
             assert result == "response"
-            assert mock_query.call_count == 1
-            assert mock_query.call_args.kwargs["api_key"] == "test-key"
+            assert mock_completion.call_count == 1
+            assert mock_completion.call_args.kwargs["api_key"] == "test-key"
 
 
 def test_get_key_per_thread_returns_same_key():
@@ -26,9 +26,39 @@ def test_get_key_per_thread_returns_same_key():
 
 def test_anthropic_model_with_empty_api_keys():
     with patch.dict(os.environ, {"ANTHROPIC_API_KEYS": ""}):
-        with patch("minisweagent.models.litellm_model.LitellmModel.query") as mock_query:
-            mock_query.return_value = "response"
+        with patch("minisweagent.models.litellm_model.LitellmModel._completion") as mock_completion:
+            mock_completion.return_value = "response"
 
-            AnthropicModel(model_name="tardis").query(messages=[])
+            AnthropicModel(model_name="tardis")._query(messages=[])
 
-            assert mock_query.call_args.kwargs["api_key"] is None
+            assert mock_completion.call_args.kwargs.get("api_key") is None
+
+
+def test_anthropic_model_keys_from_config_take_precedence():
+    with patch.dict(os.environ, {"ANTHROPIC_API_KEYS": "env-key"}):
+        with patch("minisweagent.models.litellm_model.LitellmModel._completion") as mock_completion:
+            AnthropicModel(model_name="tardis", api_keys=["config-key"])._query(messages=[])
+
+            assert mock_completion.call_args.kwargs["api_key"] == "config-key"
+
+
+def test_anthropic_model_does_not_modify_messages():
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    with patch.dict(os.environ, {"ANTHROPIC_API_KEYS": ""}):
+        with patch("minisweagent.models.litellm_model.LitellmModel._query") as mock_query:
+            model = AnthropicModel(model_name="tardis")
+            with patch.object(model, "_process_response"):
+                model.query(messages=messages)
+            sent = mock_query.call_args.args[0]
+
+    assert messages[1]["content"] == "task"
+    assert sent[1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_anthropic_model_cache_control_strategy():
+    with patch("minisweagent.models.litellm_model.LitellmModel._query") as mock_query:
+        model = AnthropicModel(model_name="tardis", cache_control_strategy="none")
+        with patch.object(model, "_process_response"):
+            model.query(messages=[{"role": "user", "content": "task"}])
+        assert mock_query.call_args.args[0] == [{"role": "user", "content": "task"}]
+    assert model.get_template_vars()["cache_control_strategy"] == "none"
@@ -0,0 +1,157 @@
+import asyncio
+import tracemalloc
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import litellm
+import pytest
+
+from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.anthropic import AnthropicModel
+from minisweagent.models.caching import CachedModel
+from minisweagent.models.hedging import HedgedModel, get_latency_tracker
+from minisweagent.models.litellm_model import LitellmModel
+from minisweagent.models.openai_model import OpenAIAuthenticationError, OpenAIModel
+from minisweagent.models.test_models import DeterministicModel
+
+
+def _litellm_response(content: str = "hi") -> litellm.ModelResponse:
+    return litellm.ModelResponse(
+        choices=[{"message": {"content": content, "role": "assistant"}}],
+        usage={"prompt_tokens": 10, "completion_tokens": 2},
+    )
+
+
+def _openai_body(content: str = "hi") -> dict:
+    return {"choices": [{"message": {"content": content}}], "usage": {"prompt_tokens": 1000, "completion_tokens": 10}}
+
+
+def _mock_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def test_litellm_aquery_retries_and_tracks_cost(reset_global_stats):
+    model = LitellmModel(model_name="gpt-4")
+    acompletion = AsyncMock(side_effect=[litellm.exceptions.Timeout("t", "m", "p"), _litellm_response()])
+    with (
+        patch("litellm.acompletion", acompletion),
+        patch("litellm.cost_calculator.completion_cost", return_value=0.5),
+        patch("asyncio.sleep", AsyncMock()),
+    ):
+        result = await model.aquery([{"role": "user", "content": "hello", "extra": {}}])
+    assert result["content"] == "hi"
+    assert result["extra"]["cost"] == 0.5
+    assert acompletion.call_count == 2
+    assert acompletion.call_args.kwargs["messages"] == [{"role": "user", "content": "hello"}]
+    assert model.n_calls == 1
+    assert GLOBAL_MODEL_STATS.cost == 0.5
+    assert GLOBAL_MODEL_STATS.metrics.snapshot()["total"]["n_retries"] == 1
+
+
+async def test_litellm_aquery_does_not_retry_auth_errors():
+    model = LitellmModel(model_name="gpt-4")
+    error = litellm.exceptions.AuthenticationError("bad key", "openai", "gpt-4")
+    with patch("litellm.acompletion", AsyncMock(side_effect=error)) as acompletion:
+        with pytest.raises(litellm.exceptions.AuthenticationError, match="mini-extra config set"):
+            await model.aquery([{"role": "user", "content": "hello"}])
+    assert acompletion.call_count == 1
+
+
+async def test_anthropic_aquery_sets_cache_control():
+    model = AnthropicModel(model_name="claude-sonnet-4")
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    with (
+        patch.object(LitellmModel, "_acompletion", AsyncMock(return_value=_litellm_response())) as acompletion,
+        patch("litellm.cost_calculator.completion_cost", return_value=0.0),
+    ):
+        await model.aquery(messages)
+    sent = acompletion.call_args.args[0]
+    assert sent[1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert messages[1]["content"] == "task"
+
+
+async def test_openai_aquery(reset_global_stats):
+    model = OpenAIModel(model_name="gpt-4", api_key="key", cost_per_1k_input_tokens=1.0)
+    n_requests = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal n_requests
+        n_requests += 1
+        assert request.headers["Authorization"] == "Bearer key"
+        if n_requests == 1:
+            raise httpx.ConnectError("connection refused")
+        return httpx.Response(200, json=_openai_body())
+
+    with (
+        patch("minisweagent.models.openai_model._get_async_client", return_value=_mock_client(handler)),
+        patch("asyncio.sleep", AsyncMock()),
+    ):
+        result = await model.aquery([{"role": "user", "content": "hello"}])
+    assert result["content"] == "hi"
+    assert n_requests == 2
+    assert result["extra"]["usage"]["prompt_tokens"] == 1000
+    assert model.cost == 1.0
+    assert GLOBAL_MODEL_STATS.cost == 1.0
+
+
+async def test_openai_aquery_auth_error():
+    model = OpenAIModel(model_name="gpt-4", api_key="key")
+    client = _mock_client(lambda request: httpx.Response(401, text="unauthorized"))
+    with patch("minisweagent.models.openai_model._get_async_client", return_value=client):
+        with pytest.raises(OpenAIAuthenticationError, match="OPENAI_API_KEY"):
+            await model.aquery([{"role": "user", "content": "hello"}])
+
+
+async def test_openai_thousands_of_outstanding_requests():
+    """All requests are in flight at the same time (without a thread each) and memory stays bounded."""
+    n_requests = 2000
+    release = asyncio.Event()
+    n_waiting = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal n_waiting
+        n_waiting += 1
+        await release.wait()
+        return httpx.Response(200, json=_openai_body())
+
+    models = [OpenAIModel(model_name="gpt-4", api_key="key") for _ in range(n_requests)]
+    with patch("minisweagent.models.openai_model._get_async_client", return_value=_mock_client(handler)):
+        tracemalloc.start()
+        try:
+            tasks = [asyncio.create_task(m.aquery([{"role": "user", "content": "hello"}])) for m in models]
+            while n_waiting < n_requests:
+                await asyncio.sleep(0.01)
+            _, peak = tracemalloc.get_traced_memory()
+            release.set()
+            results = await asyncio.gather(*tasks)
+        finally:
+            tracemalloc.stop()
+    assert all(r["content"] == "hi" for r in results)
+    assert peak / n_requests < 50_000
+
+
+async def test_deterministic_aquery():
+    model = DeterministicModel(outputs=["/sleep0.01", "a"])
+    assert (await model.aquery([]))["content"] == "a"
+    assert model.n_calls == 1
+
+
+async def test_cached_aquery(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    assert (await CachedModel(DeterministicModel(outputs=["a"]), path=path).aquery([]))["content"] == "a"
+    model = CachedModel(DeterministicModel(outputs=["b"]), path=path)
+    assert (await model.aquery([]))["extra"] == {"cache_hit": True}
+    assert model.model.n_calls == 0
+
+
+async def test_hedged_aquery_cancels_loser():
+    _warm_model = "hedge-async-test"
+    tracker = get_latency_tracker(_warm_model)
+    for _ in range(20):
+        tracker.add(0.01)
+    primary = DeterministicModel(outputs=["/sleep10", "slow"], model_name=_warm_model)
+    hedge = DeterministicModel(outputs=["fast"], model_name=_warm_model)
+    model = HedgedModel(primary, hedge_model=hedge, min_delay=0.01)
+    assert (await model.aquery([]))["content"] == "fast"
+    assert model.get_hedge_stats()["n_hedge_wins"] == 1
+    assert primary.n_calls == 0
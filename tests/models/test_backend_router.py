@@ -0,0 +1,116 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from minisweagent.models.openai_model import OpenAIModel, OpenAIServerError
+from minisweagent.models.utils.backend_router import BackendRouter, get_backend_router
+
+URLS = ["http://backend-a/v1", "http://backend-b/v1", "http://backend-c/v1"]
+
+
+def _ok_response(content: str = "hi") -> MagicMock:
+    response = MagicMock(status_code=200, ok=True, text="")
+    response.json.return_value = {"choices": [{"message": {"content": content}}]}
+    return response
+
+
+def test_router_is_stable_per_key():
+    router = BackendRouter(URLS)
+    for key in ["a", "b", "c", "d"]:
+        backend = router.select(key)
+        for _ in range(10):
+            assert router.select(key) is backend
+
+
+def test_router_spreads_keys():
+    router = BackendRouter(URLS)
+    assert len({router.select(str(i)).url for i in range(100)}) == 3
+
+
+def test_router_fails_over_when_down():
+    router = BackendRouter(URLS)
+    preferred = router.select("key")
+    router.mark_down(preferred)
+    assert router.select("key") is not preferred
+    assert [s["down"] for s in router.stats()].count(True) == 1
+    router.down_cooldown = 0.0
+    router.mark_down(preferred)
+    assert router.select("key") is preferred
+
+
+def test_router_fails_over_to_least_loaded_when_saturated():
+    router = BackendRouter(URLS, max_in_flight=1)
+    preferred = router.select("key")
+    with router.lease("key") as backend:
+        assert backend is preferred
+        others = [b for b in router._backends if b is not preferred]
+        others[0].in_flight = 5
+        assert router.select("key") is others[1]
+        others[0].in_flight = 0
+    assert router.select("key") is preferred
+
+
+def test_router_stats():
+    router = BackendRouter(URLS[:1])
+    with router.lease("key"):
+        assert router.stats()[0]["in_flight"] == 1
+    stats = router.stats()[0]
+    assert stats["in_flight"] == 0
+    assert stats["n_requests"] == 1
+    assert stats["latency_p50"] is not None
+
+
+def test_router_requires_backends():
+    with pytest.raises(ValueError):
+        BackendRouter([])
+
+
+def test_openai_model_base_urls_from_env():
+    with patch.dict(os.environ, {"OPENAI_API_BASE": "http://x:1, http://y:2/v1"}):
+        model = OpenAIModel(model_name="local")
+    assert model.config.base_urls == ["http://x:1/v1", "http://y:2/v1"]
+
+
+def test_openai_model_routes_by_prefix():
+    urls = ["http://prefix-a/v1", "http://prefix-b/v1"]
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    model1 = OpenAIModel(model_name="local", base_urls=urls)
+    model2 = OpenAIModel(model_name="local", base_urls=urls)
+    with patch.dict(os.environ, {}, clear=True), patch("requests.post", return_value=_ok_response()) as mock_post:
+        model1.query(messages)
+        model1.query(messages + [{"role": "assistant", "content": "a"}, {"role": "user", "content": "o"}])
+        model2.query(messages)
+    used = {call.args[0] for call in mock_post.call_args_list}
+    assert len(used) == 1
+
+
+def test_openai_model_routes_by_agent():
+    urls = [f"http://agent-{i}/v1" for i in range(4)]
+    messages = [{"role": "user", "content": "same task"}]
+    with patch("requests.post", return_value=_ok_response()) as mock_post:
+        for _ in range(20):
+            OpenAIModel(model_name="local", base_urls=urls, routing="agent").query(messages)
+    assert len({call.args[0] for call in mock_post.call_args_list}) > 1
+
+
+def test_openai_model_fails_over_on_connection_error():
+    urls = ["http://failover-a/v1", "http://failover-b/v1"]
+    model = OpenAIModel(model_name="local", base_urls=urls)
+    messages = [{"role": "user", "content": "task"}]
+    responses = [requests.ConnectionError("down"), _ok_response("from other backend")]
+    with patch("requests.post", side_effect=responses) as mock_post, patch("time.sleep"):
+        assert model.query(messages)["content"] == "from other backend"
+    assert mock_post.call_args_list[0].args[0] != mock_post.call_args_list[1].args[0]
+    stats = get_backend_router(urls).stats()
+    assert sum(s["n_errors"] for s in stats) == 1
+
+
+def test_openai_model_marks_backend_down_on_server_error():
+    urls = ["http://server-error-a/v1", "http://server-error-b/v1"]
+    model = OpenAIModel(model_name="local", base_urls=urls)
+    with patch("requests.post", return_value=MagicMock(status_code=503, ok=False, text="busy")):
+        with pytest.raises(OpenAIServerError):
+            model.query([{"role": "user", "content": "task"}])
+    assert [s["down"] for s in get_backend_router(urls).stats()].count(True) == 1
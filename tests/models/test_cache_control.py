@@ -1,4 +1,8 @@
-from minisweagent.models.utils.cache_control import set_cache_control
+import copy
+
+import pytest
+
+from minisweagent.models.utils.cache_control import CacheControlManager, set_cache_control
 
 
 def test_set_cache_control_basic():
@@ -49,3 +53,64 @@ def test_set_cache_control_with_offset():
     assert "cache_control" not in result[2].get("content", {})  # Third message should not have cache control
     assert isinstance(result[0]["content"], list)  # First message should have cache control
     assert isinstance(result[1]["content"], list)  # Second message should have cache control
+
+
+def _conversation(n_turns: int) -> list[dict]:
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    for i in range(n_turns):
+        messages.append({"role": "assistant", "content": f"action {i}"})
+        messages.append({"role": "user", "content": f"observation {i}"})
+    return messages
+
+
+def _marked(view: list[dict]) -> list[int]:
+    return [i for i, entry in enumerate(view) if isinstance(entry["content"], list)]
+
+
+def test_cache_control_manager_matches_set_cache_control():
+    messages = _conversation(3)
+    expected = set_cache_control(copy.deepcopy(messages))
+    assert CacheControlManager().apply(messages) == expected
+
+
+def test_cache_control_manager_does_not_modify_messages():
+    messages = _conversation(3)
+    original = copy.deepcopy(messages)
+    view = CacheControlManager().apply(messages)
+    assert messages == original
+    assert view is not messages
+    assert view[0] is messages[0]
+
+
+def test_cache_control_manager_moves_breakpoints_incrementally():
+    manager = CacheControlManager()
+    messages = _conversation(1)
+    assert _marked(manager.apply(messages)) == [1, 3]
+    messages.extend([{"role": "assistant", "content": "action"}, {"role": "user", "content": "observation"}])
+    assert _marked(manager.apply(messages)) == [3, 5]
+    assert manager.marked_indices == [3, 5]
+
+
+def test_cache_control_manager_resets_on_new_history():
+    manager = CacheControlManager()
+    manager.apply(_conversation(5))
+    assert _marked(manager.apply(_conversation(1))) == [1, 3]
+
+
+def test_cache_control_manager_strategies():
+    messages = _conversation(3)
+    assert _marked(CacheControlManager(strategy="none").apply(messages)) == []
+    assert _marked(CacheControlManager(strategy="system_and_last_user").apply(messages)) == [0, 7]
+    assert _marked(CacheControlManager(strategy="system_and_last_user", n_breakpoints=3).apply(messages)) == [0, 5, 7]
+    assert _marked(CacheControlManager(last_n_messages_offset=1).apply(messages)) == [3, 5]
+    assert _marked(CacheControlManager(last_n_messages_offset=3).apply(messages)) == [1, 3]
+    assert _marked(CacheControlManager(strategy="prefix").apply(messages)) == [0, 1]
+    with pytest.raises(ValueError):
+        CacheControlManager(strategy="unknown")  # type: ignore
+
+
+def test_cache_control_manager_tool_messages():
+    messages = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+    view = CacheControlManager().apply(messages)
+    assert view[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in messages[0]["content"][0]
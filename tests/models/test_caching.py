@@ -0,0 +1,85 @@
+import json
+from unittest.mock import patch
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models import GLOBAL_MODEL_STATS, get_model
+from minisweagent.models.caching import CachedModel, get_cache_key
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.run.utils.save import save_traj
+
+
+def _messages(content: str = "task") -> list[dict]:
+    return [{"role": "system", "content": "system"}, {"role": "user", "content": content}]
+
+
+def test_cache_key():
+    key = get_cache_key("m", {"temperature": 0}, _messages())
+    assert key == get_cache_key("m", {"temperature": 0, "api_key": "secret"}, _messages())
+    assert key == get_cache_key("m", {"temperature": 0}, _messages() + [])
+    assert key != get_cache_key("m", {"temperature": 1}, _messages())
+    assert key != get_cache_key("other", {"temperature": 0}, _messages())
+    assert key != get_cache_key("m", {"temperature": 0}, _messages("other task"))
+    messages_with_extra = [_messages()[0], _messages()[1] | {"extra": {"usage": {}}}]
+    assert key == get_cache_key("m", {"temperature": 0}, messages_with_extra)
+
+
+def test_hits_are_free(tmp_path, reset_global_stats):
+    path = str(tmp_path / "cache.sqlite")
+    first = CachedModel(DeterministicModel(outputs=["a", "b"]), path=path)
+    assert first.query(_messages("1"))["content"] == "a"
+    assert first.query(_messages("2"))["content"] == "b"
+    assert GLOBAL_MODEL_STATS.cost == 2.0
+
+    second = CachedModel(DeterministicModel(outputs=["c"]), path=path)
+    response = second.query(_messages("1"))
+    assert response == {"content": "a", "extra": {"cache_hit": True}}
+    assert second.query(_messages("2"))["content"] == "b"
+    assert second.query(_messages("3"))["content"] == "c"
+    assert GLOBAL_MODEL_STATS.cost == 3.0
+    assert second.cost == 1.0
+    assert second.n_calls == 3
+    assert second.get_cache_stats() == {"cache_hits": 2, "cache_misses": 1, "cache_hit_rate": 2 / 3}
+
+
+def test_modes(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    CachedModel(DeterministicModel(outputs=["a"]), path=path).query(_messages())
+
+    record_only = CachedModel(DeterministicModel(outputs=["b"]), path=path, mode="record_only")
+    assert record_only.query(_messages())["content"] == "b"
+    assert record_only.n_cache_hits == 0
+
+    read_only = CachedModel(DeterministicModel(outputs=["c"]), path=path, mode="read_only")
+    assert read_only.query(_messages())["content"] == "b"
+    assert read_only.query(_messages("new"))["content"] == "c"
+    assert CachedModel(DeterministicModel(outputs=["d"]), path=path).query(_messages("new"))["content"] == "d"
+
+
+def test_get_model_with_cache(tmp_path):
+    config = {"outputs": ["a"], "cache": {"path": str(tmp_path / "cache.sqlite")}}
+    with patch("minisweagent.models.get_model_class", return_value=_deterministic_model):
+        model = get_model("deterministic", config)
+    assert isinstance(model, CachedModel)
+    assert isinstance(model.model, DeterministicModel)
+    assert model.get_template_vars()["cache_hit_rate"] == 0.0
+
+
+def _deterministic_model(**kwargs):
+    kwargs.pop("model_kwargs")
+    return DeterministicModel(**kwargs)
+
+
+def test_hit_rate_in_trajectory(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    outputs = ["```bash\necho hi\n```", "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```"]
+    for _ in range(2):
+        agent = DefaultAgent(CachedModel(DeterministicModel(outputs=list(outputs)), path=path), LocalEnvironment())
+        exit_status, _ = agent.run("task")
+        assert exit_status == "Submitted"
+    save_traj(agent, tmp_path / "traj.json", print_path=False)
+    model_stats = json.loads((tmp_path / "traj.json").read_text())["info"]["model_stats"]
+    assert model_stats["cache_hits"] == 2
+    assert model_stats["cache_hit_rate"] == 1.0
+    assert model_stats["instance_cost"] == 0.0
+    assert model_stats["api_calls"] == 2
@@ -0,0 +1,120 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from minisweagent.models import GLOBAL_MODEL_STATS, get_model
+from minisweagent.models.hedging import HedgedModel, get_latency_tracker
+from minisweagent.models.test_models import DeterministicModel
+from minisweagent.models.utils.latency import LatencyTracker
+
+
+class SlowModel(DeterministicModel):
+    """Model where every call takes a configurable amount of time. Delays of `None` raise an error."""
+
+    def __init__(self, *, delays: list[float | None], **kwargs):
+        super().__init__(outputs=[], **kwargs)
+        self.delays = delays
+        self._lock = threading.Lock()
+        self._i_delay = -1
+
+    def query(self, messages, **kwargs):
+        with self._lock:
+            self._i_delay += 1
+            delay = self.delays[self._i_delay]
+        if delay is None:
+            raise ValueError("failed")
+        time.sleep(delay)
+        return {"content": f"slept {delay}"}
+
+
+def _warm_tracker(model_name: str, latency: float, n: int = 20):
+    tracker = get_latency_tracker(model_name)
+    for _ in range(n):
+        tracker.add(latency)
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(50) is None
+    for i in range(100):
+        tracker.add(float(i))
+    assert tracker.percentile(50) == 50.0
+    assert tracker.percentile(95) == 95.0
+    assert tracker.percentile(100) == 99.0
+    tracker.add(1000.0)
+    assert len(tracker) == 100
+
+
+def test_no_hedging_without_samples():
+    model = HedgedModel(SlowModel(delays=[0.0], model_name="hedge-test-no-samples"))
+    assert model.get_hedge_delay() is None
+    assert model.query([])["content"] == "slept 0.0"
+    assert model.n_hedged == 0
+    assert model.n_calls == 1
+
+
+def test_hedge_wins_on_slow_primary():
+    _warm_tracker("hedge-test-slow-primary", 0.01)
+    inner = SlowModel(delays=[2.0, 0.0], model_name="hedge-test-slow-primary")
+    model = HedgedModel(inner, min_delay=0.05)
+    start = time.perf_counter()
+    assert model.query([])["content"] == "slept 0.0"
+    assert time.perf_counter() - start < 1.0
+    assert model.get_hedge_stats() == {"n_hedged": 1, "n_hedge_wins": 1, "hedge_rate": 1.0, "hedge_win_rate": 1.0}
+    assert model.n_calls == 1
+
+
+def test_primary_wins_on_slow_hedge():
+    _warm_tracker("hedge-test-slow-hedge", 0.01)
+    inner = SlowModel(delays=[0.2], model_name="hedge-test-slow-hedge")
+    hedge = SlowModel(delays=[2.0], model_name="hedge-test-slow-hedge")
+    model = HedgedModel(inner, hedge_model=hedge, min_delay=0.05)
+    assert model.query([])["content"] == "slept 0.2"
+    assert model.n_hedged == 1
+    assert model.n_hedge_wins == 0
+
+
+def test_failed_request_falls_back_to_other():
+    _warm_tracker("hedge-test-failure", 0.01)
+    # Primary is slow but succeeds, the hedge fails immediately
+    inner = SlowModel(delays=[0.2, None], model_name="hedge-test-failure")
+    model = HedgedModel(inner, min_delay=0.05)
+    assert model.query([])["content"] == "slept 0.2"
+
+
+def test_both_requests_fail():
+    _warm_tracker("hedge-test-both-fail", 0.01)
+    inner = SlowModel(delays=[None], model_name="hedge-test-both-fail")
+    hedge = SlowModel(delays=[None], model_name="hedge-test-both-fail")
+    with pytest.raises(ValueError):
+        HedgedModel(inner, hedge_model=hedge, min_delay=0.05).query([])
+
+
+def test_cost_counts_both_requests(reset_global_stats):
+    _warm_tracker("hedge-test-cost", 0.01)
+    inner = DeterministicModel(outputs=["/sleep0.5", "first", "second"], model_name="hedge-test-cost")
+    model = HedgedModel(inner, hedge_model=DeterministicModel(outputs=["hedge"], model_name="x"), min_delay=0.05)
+    assert model.query([])["content"] == "hedge"
+    time.sleep(1.0)
+    assert model.cost == 2.0
+    assert GLOBAL_MODEL_STATS.cost == 2.0
+    assert model.n_calls == 1
+    assert model.get_template_vars()["n_model_calls"] == 1
+
+
+def test_get_model_with_hedging():
+    config = {"outputs": ["a"], "hedging": {"percentile": 90, "alternate_model": {"outputs": ["b"]}}}
+    with patch("minisweagent.models.get_model_class", return_value=_deterministic_model):
+        model = get_model("hedge-test-get-model", config)
+    assert isinstance(model, HedgedModel)
+    assert model.hedging_config.percentile == 90
+    assert model.hedge_model.config.outputs == ["b"]
+    assert model.config.model_name == "hedge-test-get-model"
+    assert "hedging" in config
+
+
+def _deterministic_model(**kwargs):
+    kwargs.pop("model_kwargs")
+    return DeterministicModel(**kwargs)
@@ -1,9 +1,14 @@
+import asyncio
 import os
+import threading
+import time
 from unittest.mock import patch
 
+import litellm
 import pytest
 
 from minisweagent.models import GlobalModelStats, get_model, get_model_class, get_model_name
+from minisweagent.models.litellm_model import LitellmModel
 from minisweagent.models.test_models import DeterministicModel
 
 
@@ -249,3 +254,116 @@ class TestGlobalModelStats:
             GlobalModelStats()
             captured = capsys.readouterr()
             assert "Global cost/call limit" not in captured.out
+
+
+def _stats_with_limits(cost_limit: float = 0.0, call_limit: int = 0) -> GlobalModelStats:
+    env = {"MSWEA_GLOBAL_COST_LIMIT": str(cost_limit), "MSWEA_GLOBAL_CALL_LIMIT": str(call_limit)}
+    with patch.dict(os.environ, env | {"MSWEA_SILENT_STARTUP": "1"}):
+        return GlobalModelStats()
+
+
+class TestBudgetReservation:
+    def test_reserve_refuses_call_that_cannot_fit(self):
+        stats = _stats_with_limits(cost_limit=1.0)
+        with pytest.raises(RuntimeError, match="Global cost/call limit exceeded"):
+            with stats.reserve(1.5):
+                pass
+        with stats.reserve(0.5):
+            assert stats.reserved_cost == 0.5
+            stats.add(0.4)
+        assert stats.reserved_cost == 0.0
+        assert stats.cost == 0.4
+
+    def test_reservation_is_released_on_error(self):
+        stats = _stats_with_limits(cost_limit=1.0)
+        with pytest.raises(ValueError):
+            with stats.reserve(0.9):
+                raise ValueError
+        with stats.reserve(0.9):
+            pass
+
+    def test_no_overshoot_under_concurrency(self):
+        """With 20 parallel workers, only the calls that fit into the limit are made."""
+        stats = _stats_with_limits(cost_limit=1.0)
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                with stats.reserve(0.3):
+                    time.sleep(0.05)
+                    stats.add(0.3)
+                outcome = "ok"
+            except RuntimeError:
+                outcome = "refused"
+            with lock:
+                results.append(outcome)
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results.count("ok") == 3
+        assert stats.cost == pytest.approx(0.9)
+
+    def test_waiting_call_proceeds_when_reservation_settles_lower(self):
+        stats = _stats_with_limits(cost_limit=1.0)
+        done = threading.Event()
+
+        def other_call():
+            with stats.reserve(0.8):
+                time.sleep(0.1)
+                stats.add(0.1)
+
+        thread = threading.Thread(target=other_call)
+        thread.start()
+        time.sleep(0.02)
+        with stats.reserve(0.5):
+            done.set()
+        thread.join()
+        assert done.is_set()
+
+    def test_call_limit(self):
+        stats = _stats_with_limits(call_limit=2)
+        with stats.reserve():
+            stats.add(0.0)
+        with pytest.raises(RuntimeError), stats.reserve():
+            stats.add(0.0)
+        assert stats.n_calls == 2
+        with pytest.raises(RuntimeError, match="estimated"), stats.reserve():
+            pass
+
+    async def test_areserve(self):
+        stats = _stats_with_limits(cost_limit=1.0)
+
+        async def call(cost: float):
+            async with stats.areserve(0.6):
+                await asyncio.sleep(0.05)
+                stats.add(cost)
+
+        await asyncio.gather(call(0.1), call(0.1))
+        assert stats.cost == pytest.approx(0.2)
+        with pytest.raises(RuntimeError):
+            async with stats.areserve(0.9):
+                pass
+
+    def test_litellm_model_reserves_estimated_cost(self):
+        stats = _stats_with_limits(cost_limit=100.0)
+        model = LitellmModel(model_name="gpt-4")
+        reserved = []
+
+        def completion(*args, **kwargs):
+            reserved.append(stats.reserved_cost)
+            return litellm.ModelResponse(choices=[{"message": {"content": "hi", "role": "assistant"}}])
+
+        with (
+            patch("minisweagent.models.litellm_model.GLOBAL_MODEL_STATS", stats),
+            patch.object(LitellmModel, "_completion", side_effect=completion),
+            patch("litellm.cost_calculator.completion_cost", return_value=0.01),
+        ):
+            model.query([{"role": "user", "content": "x" * 4000}])
+        # 1000 prompt tokens and 1000 expected completion tokens at gpt-4 prices
+        assert reserved[0] == pytest.approx(0.03 + 0.06)
+        assert stats.reserved_cost == 0.0
+        assert stats.cost == 0.01
@@ -0,0 +1,137 @@
+import gc
+import threading
+from unittest.mock import patch
+
+import litellm
+import pytest
+from tenacity import stop_after_attempt
+
+from minisweagent.models.litellm_model import LitellmModel
+from minisweagent.models.openai_model import OpenAIModel, OpenAIRateLimitError
+from minisweagent.models.utils.key_pool import APIKeyPool, get_key_pool
+
+
+class _Agent:
+    pass
+
+
+def test_key_pool_affinity():
+    pool = APIKeyPool(["a", "b"])
+    agent = _Agent()
+    key = pool.get_key(agent)
+    for _ in range(10):
+        assert pool.get_key(agent) == key
+
+
+def test_key_pool_assigns_new_agents_to_least_loaded_key():
+    pool = APIKeyPool(["a", "b", "c"])
+    agents = [_Agent() for _ in range(6)]
+    keys = [pool.get_key(agent) for agent in agents]
+    assert sorted(keys) == ["a", "a", "b", "b", "c", "c"]
+    assert [s["n_agents"] for s in pool.stats()] == [2, 2, 2]
+
+
+def test_key_pool_releases_agents():
+    pool = APIKeyPool(["a", "b"])
+    agent1, agent2 = _Agent(), _Agent()
+    assert pool.get_key(agent1) == "a"
+    assert pool.get_key(agent2) == "b"
+    del agent1
+    gc.collect()
+    agent3 = _Agent()
+    assert pool.get_key(agent3) == "a"
+    pool.release_agent(agent2)
+    assert [s["n_agents"] for s in pool.stats()] == [1, 0]
+
+
+def test_key_pool_avoids_rate_limited_keys():
+    pool = APIKeyPool(["a", "b"])
+    agent = _Agent()
+    assert pool.get_key(agent) == "a"
+    pool.record_rate_limit("a")
+    assert pool.get_key(_Agent()) == "b"
+    # The agent is moved away from the rate limited key
+    assert pool.get_key(agent) == "b"
+    assert pool.stats()[0]["recent_rate_limits"] == 1
+
+
+def test_key_pool_rate_limits_expire():
+    pool = APIKeyPool(["a", "b"], rate_limit_cooldown=0.0)
+    pool.record_rate_limit("a")
+    assert pool.get_key(_Agent()) == "a"
+    assert pool.stats()[0]["n_rate_limited"] == 1
+
+
+def test_key_pool_lease_tracks_in_flight():
+    pool = APIKeyPool(["a"])
+    agent = _Agent()
+    with pool.lease(agent) as key:
+        assert key == "a"
+        assert pool.stats()[0]["in_flight"] == 1
+    assert pool.stats()[0]["in_flight"] == 0
+    assert pool.stats()[0]["n_requests"] == 1
+
+
+def test_key_pool_requires_keys():
+    with pytest.raises(ValueError):
+        APIKeyPool([])
+
+
+def test_get_key_pool_is_shared():
+    assert get_key_pool(["shared-1", "shared-2"]) is get_key_pool(["shared-1", "shared-2"])
+
+
+def test_key_pool_thread_safety():
+    pool = APIKeyPool(["a", "b", "c", "d"])
+    agents = [_Agent() for _ in range(100)]
+
+    def worker(agent):
+        for _ in range(20):
+            with pool.lease(agent):
+                pass
+
+    threads = [threading.Thread(target=worker, args=(agent,)) for agent in agents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert [s["n_agents"] for s in stats] == [25, 25, 25, 25]
+    assert sum(s["n_requests"] for s in stats) == 2000
+    assert all(s["in_flight"] == 0 for s in stats)
+
+
+def test_litellm_model_uses_key_pool():
+    model = LitellmModel(model_name="gpt-4", api_keys=["litellm-key-1", "litellm-key-2"])
+    with (
+        patch("minisweagent.models.litellm_model.LitellmModel._completion") as mock_completion,
+        patch("litellm.cost_calculator.completion_cost", return_value=0.5),
+    ):
+        mock_completion.return_value.choices[0].message.content = "response"
+        model.query([{"role": "user", "content": "test"}])
+    key = mock_completion.call_args.kwargs["api_key"]
+    assert key in ["litellm-key-1", "litellm-key-2"]
+    stats = {s["key"]: s for s in get_key_pool(model.config.api_keys).stats()}
+    assert stats[f"...{key[-4:]}"]["cost"] == 0.5
+
+
+def test_litellm_model_records_rate_limits():
+    model = LitellmModel(model_name="gpt-4", api_keys=["litellm-rl-key"])
+    error = litellm.exceptions.RateLimitError("rate limited", llm_provider="openai", model="gpt-4")
+    with patch("minisweagent.models.litellm_model.LitellmModel._completion", side_effect=error):
+        with pytest.raises(litellm.exceptions.RateLimitError):
+            model._query.retry_with(stop=stop_after_attempt(1), reraise=True)(
+                model, [{"role": "user", "content": "test"}]
+            )
+    assert get_key_pool(["litellm-rl-key"]).stats()[0]["n_rate_limited"] == 1
+
+
+def test_openai_model_uses_key_pool():
+    model = OpenAIModel(model_name="gpt-4", api_keys=["openai-rl-key"])
+    with patch("requests.post") as mock_post:
+        mock_post.return_value.status_code = 429
+        mock_post.return_value.text = "rate limited"
+        with pytest.raises(OpenAIRateLimitError):
+            model.query([{"role": "user", "content": "test"}])
+    assert mock_post.call_args.kwargs["headers"]["Authorization"] == "Bearer openai-rl-key"
+    assert get_key_pool(["openai-rl-key"]).stats()[0]["n_rate_limited"] == 1
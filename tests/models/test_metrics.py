@@ -0,0 +1,81 @@
+import json
+import threading
+from unittest.mock import patch
+
+import litellm
+import pytest
+
+from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.litellm_model import LitellmModel
+from minisweagent.models.utils.metrics import Histogram, MetricsExporter, MetricsRegistry
+from minisweagent.models.utils.usage import TokenUsage
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(1.0, 2.0, 4.0, float("inf")))
+    assert histogram.quantile(0.5) is None
+    for value in [0.5] * 50 + [1.5] * 40 + [3.0] * 9 + [100.0]:
+        histogram.observe(value)
+    assert histogram.count == 100
+    assert histogram.counts == [50, 40, 9, 1]
+    assert histogram.quantile(0.5) == pytest.approx(1.0)
+    assert histogram.quantile(0.95) == pytest.approx(2.0 + 2.0 * 5 / 9)
+    assert histogram.quantile(1.0) == 4.0
+
+
+def test_registry_snapshot_breakdowns():
+    registry = MetricsRegistry()
+    registry.record_call("a", latency=1.0, cost=0.5, usage=TokenUsage(10, 2, 5, 0), key_slot="0")
+    registry.record_call("b", latency=3.0, cost=1.0, key_slot="1")
+    registry.record_error("a", retried=True, key_slot="0")
+    registry.record_error("a", retried=False, key_slot="0")
+    snapshot = registry.snapshot()
+    assert snapshot["total"]["n_calls"] == 2
+    assert snapshot["total"]["cost"] == 1.5
+    assert snapshot["by_model"]["a"]["n_errors"] == 2
+    assert snapshot["by_model"]["a"]["retry_rate"] == pytest.approx(1 / 3)
+    assert snapshot["by_model"]["a"]["prompt_tokens"] == 10
+    assert set(snapshot["by_key_slot"]) == {"0", "1"}
+    assert set(snapshot["by_thread"]) == {threading.current_thread().name}
+    assert snapshot["total"]["tokens_per_second"] == pytest.approx(2 / 4)
+
+
+def test_registry_openmetrics():
+    registry = MetricsRegistry()
+    registry.record_call('model "x"', latency=0.3, cost=0.1)
+    text = registry.to_openmetrics()
+    assert text.endswith("# EOF\n")
+    assert "# TYPE mswea_model_latency_seconds histogram" in text
+    assert 'model="model \\"x\\""' in text
+    assert 'le="0.5"} 1' in text
+    assert 'le="0.25"} 0' in text
+    assert 'le="+Inf"} 1' in text
+
+
+def test_exporter_writes_files(tmp_path):
+    registry = MetricsRegistry()
+    registry.record_call("a", latency=1.0)
+    with MetricsExporter(registry, tmp_path, interval=3600).start():
+        pass
+    assert json.loads((tmp_path / "metrics.json").read_text())["total"]["n_calls"] == 1
+    assert "mswea_model_calls_total" in (tmp_path / "metrics.prom").read_text()
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_litellm_model_records_latency_and_errors(reset_global_stats):
+    model = LitellmModel(model_name="metrics-test-model")
+    response = litellm.ModelResponse(
+        choices=[{"message": {"content": "hi", "role": "assistant"}}], usage={"prompt_tokens": 3}
+    )
+    with (
+        patch.object(LitellmModel, "_completion", side_effect=[litellm.exceptions.Timeout("t", "m", "p"), response]),
+        patch("litellm.cost_calculator.completion_cost", return_value=0.1),
+        patch.object(LitellmModel._query.retry, "sleep"),
+    ):
+        model.query([{"role": "user", "content": "hello"}])
+    summary = GLOBAL_MODEL_STATS.metrics.snapshot()["by_model"]["metrics-test-model"]
+    assert summary["n_calls"] == 1
+    assert summary["n_errors"] == 1
+    assert summary["n_retries"] == 1
+    assert summary["prompt_tokens"] == 3
+    assert summary["latency_p50"] is not None
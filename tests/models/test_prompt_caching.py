@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+import litellm
+import pytest
+
+from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.litellm_model import LitellmModel
+from minisweagent.models.utils.prompt_caching import PromptCache, resolve_prompt_caching_policy
+
+
+@pytest.mark.parametrize(
+    ("model_name", "policy"),
+    [
+        ("claude-sonnet-4-20250514", "breakpoints"),
+        ("anthropic/claude-3-5-haiku-latest", "breakpoints"),
+        ("bedrock/anthropic.claude-3-5-sonnet-20240620-v1:0", "breakpoints"),
+        ("vertex_ai/claude-3-5-sonnet@20240620", "breakpoints"),
+        ("openrouter/anthropic/claude-3.5-sonnet", "breakpoints"),
+        ("gemini/gemini-2.5-pro", "prefix"),
+        ("vertex_ai/gemini-2.5-flash", "prefix"),
+        ("openrouter/google/gemini-2.5-pro", "automatic"),
+        ("gpt-4o", "automatic"),
+        ("deepseek/deepseek-chat", "automatic"),
+        ("hosted_vllm/qwen3-coder", "automatic"),
+    ],
+)
+def test_resolve_policy(model_name, policy):
+    assert resolve_prompt_caching_policy("auto", model_name) == policy
+    assert resolve_prompt_caching_policy("none", model_name) == "none"
+
+
+def _conversation(task: str = "task") -> list[dict]:
+    return [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": task},
+        {"role": "assistant", "content": "action"},
+        {"role": "user", "content": "observation"},
+    ]
+
+
+def _marked(messages: list[dict]) -> list[int]:
+    return [i for i, m in enumerate(messages) if isinstance(m["content"], list)]
+
+
+def test_breakpoints():
+    assert _marked(PromptCache("auto", "claude-sonnet-4").apply(_conversation())) == [1, 3]
+    cache = PromptCache("breakpoints", "any", strategy="system_and_last_user", n_breakpoints=3)
+    assert _marked(cache.apply(_conversation())) == [0, 1, 3]
+
+
+def test_prefix_only_above_min_tokens():
+    cache = PromptCache("auto", "gemini/gemini-2.5-pro", min_prefix_tokens=100)
+    assert _marked(cache.apply(_conversation())) == []
+    messages = _conversation("x" * 1000)
+    view = cache.apply(messages)
+    assert _marked(view) == [0, 1]
+    assert view[1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert messages[1]["content"] == "x" * 1000
+
+
+def test_automatic_and_none_pass_messages_through():
+    messages = _conversation()
+    assert PromptCache("auto", "gpt-4o").apply(messages) is messages
+    assert PromptCache("none", "claude-sonnet-4").apply(messages) is messages
+
+
+def test_litellm_model_applies_policy_and_reports_cache_writes(reset_global_stats):
+    model = LitellmModel(model_name="bedrock/anthropic.claude-3-5-sonnet-20240620-v1:0")
+    response = litellm.ModelResponse(
+        choices=[{"message": {"content": "hi", "role": "assistant"}}],
+        usage={"prompt_tokens": 100, "completion_tokens": 10, "cache_creation_input_tokens": 90},
+    )
+    with (
+        patch("minisweagent.models.litellm_model.LitellmModel._query", return_value=response) as mock_query,
+        patch("litellm.cost_calculator.completion_cost", return_value=0.25),
+    ):
+        result = model.query(_conversation())
+    assert _marked(mock_query.call_args.args[0]) == [1, 3]
+    assert result["extra"]["usage"]["cache_creation_tokens"] == 90
+    assert model.get_template_vars()["prompt_caching_policy"] == "breakpoints"
+    assert GLOBAL_MODEL_STATS.metrics.snapshot()["total"]["cache_creation_tokens"] == 90
+    assert "mswea_model_cache_creation_tokens_total" in GLOBAL_MODEL_STATS.metrics.to_openmetrics()
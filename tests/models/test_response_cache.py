@@ -0,0 +1,71 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from minisweagent.models.utils.response_cache import ResponseCache
+
+
+def test_get_put(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    assert cache.get("a") is None
+    cache.put("a", "value")
+    assert cache.get("a") == "value"
+    assert cache.stats() == {"n_entries": 1, "size_bytes": 5}
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_size_bytes=25)
+    for key in "abc":
+        cache.put(key, "x" * 10)
+    # Only the two most recently used entries fit
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    cache.put("d", "x" * 10)
+    assert cache.get("b") is not None
+    assert cache.get("c") is None
+    assert cache.get("d") is not None
+
+
+def test_read_only(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    assert ResponseCache(path, read_only=True).get("a") is None
+    ResponseCache(path).put("a", "value")
+    cache = ResponseCache(path, read_only=True)
+    assert cache.get("a") == "value"
+    with pytest.raises(RuntimeError):
+        cache.put("b", "value")
+
+
+def test_threads(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+
+    def work(i: int):
+        for j in range(20):
+            cache.put(f"{i}-{j}", str(j))
+            assert cache.get(f"{i}-{j}") == str(j)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()["n_entries"] == 160
+
+
+def _put_many(path, i: int):
+    cache = ResponseCache(path)
+    for j in range(20):
+        cache.put(f"{i}-{j}", str(j))
+
+
+def test_processes(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    ResponseCache(path)
+    processes = [multiprocessing.get_context("spawn").Process(target=_put_many, args=(path, i)) for i in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert ResponseCache(path).stats()["n_entries"] == 60
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from minisweagent.models.utils.scheduler import RequestScheduler, get_request_scheduler
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Timed out"
+        time.sleep(0.001)
+
+
+def test_served_by_priority():
+    scheduler = RequestScheduler(max_concurrent=1)
+    order = []
+
+    def request(priority: float) -> None:
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    with scheduler.slot() as wait:
+        assert wait < 0.1
+        threads = []
+        for priority in [3, 1, 2, 1.5]:
+            threads.append(threading.Thread(target=request, args=(priority,)))
+            threads[-1].start()
+            _wait_for(lambda: scheduler.n_waiting == len(threads))
+    for thread in threads:
+        thread.join()
+    assert order == [1, 1.5, 2, 3]
+    assert scheduler.n_running == 0
+
+
+def test_ties_in_arrival_order():
+    scheduler = RequestScheduler(max_concurrent=1)
+    order = []
+
+    def request(name: str) -> None:
+        with scheduler.slot(0.0):
+            order.append(name)
+
+    with scheduler.slot():
+        threads = []
+        for name in "abc":
+            threads.append(threading.Thread(target=request, args=(name,)))
+            threads[-1].start()
+            _wait_for(lambda: scheduler.n_waiting == len(threads))
+    for thread in threads:
+        thread.join()
+    assert order == ["a", "b", "c"]
+
+
+def test_concurrency_cap():
+    scheduler = RequestScheduler(max_concurrent=3)
+    running, max_running, lock = [0], [0], threading.Lock()
+    waits = []
+
+    def request() -> None:
+        with scheduler.slot() as wait:
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+        waits.append(wait)
+
+    threads = [threading.Thread(target=request) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_running[0] == 3
+    assert max(waits) >= 0.05
+
+
+def test_no_limit():
+    scheduler = RequestScheduler()
+    with scheduler.slot(), scheduler.slot(), scheduler.slot():
+        assert scheduler.n_running == 3
+        assert scheduler.n_waiting == 0
+
+
+async def test_async_slots_by_priority():
+    scheduler = RequestScheduler(max_concurrent=1)
+    order = []
+
+    async def request(priority: float) -> None:
+        async with scheduler.aslot(priority) as wait:
+            order.append((priority, wait > 0))
+
+    async with scheduler.aslot():
+        tasks = [asyncio.create_task(request(priority)) for priority in [2, 0, 1]]
+        while scheduler.n_waiting < 3:
+            await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    assert order == [(0, True), (1, True), (2, True)]
+
+
+async def test_cancelled_waiter_gives_up_its_place():
+    scheduler = RequestScheduler(max_concurrent=1)
+    order = []
+
+    async def request(name: str, priority: float) -> None:
+        async with scheduler.aslot(priority):
+            order.append(name)
+
+    async with scheduler.aslot():
+        cancelled = asyncio.create_task(request("cancelled", 0))
+        other = asyncio.create_task(request("other", 1))
+        while scheduler.n_waiting < 2:
+            await asyncio.sleep(0.001)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert scheduler.n_waiting == 1
+    await other
+    assert order == ["other"]
+    assert scheduler.n_running == 0
+
+
+def test_threads_and_coroutines_share_the_queue():
+    scheduler = RequestScheduler(max_concurrent=1)
+    order = []
+
+    async def async_request() -> None:
+        async with scheduler.aslot(0):
+            order.append("async")
+
+    with scheduler.slot():
+        thread = threading.Thread(target=asyncio.run, args=(async_request(),))
+        thread.start()
+        _wait_for(lambda: scheduler.n_waiting == 1)
+        order.append("sync")
+    thread.join()
+    assert order == ["sync", "async"]
+
+
+def test_registry():
+    scheduler = get_request_scheduler("test_registry", max_concurrent=2)
+    assert get_request_scheduler("test_registry") is scheduler
+    assert scheduler.max_concurrent == 2
+    assert get_request_scheduler("test_registry_other") is not scheduler
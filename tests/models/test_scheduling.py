@@ -0,0 +1,94 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from minisweagent.models import GLOBAL_MODEL_STATS, get_model
+from minisweagent.models.scheduling import (
+    ScheduledModel,
+    get_priority_function,
+    mark_container_started,
+    steps_priority,
+)
+from minisweagent.models.test_models import DeterministicModel
+
+MESSAGES = [{"role": "user", "content": "task"}]
+
+
+def test_priority_functions():
+    assert get_priority_function("steps") is steps_priority
+    assert get_priority_function("minisweagent.models.scheduling.steps_priority") is steps_priority
+    with pytest.raises(ValueError, match="Unknown priority"):
+        get_priority_function("nonexistent")
+
+    model = ScheduledModel(DeterministicModel(outputs=["a", "b"]), scheduler="test_priority_functions")
+    assert get_priority_function("steps")(model) == 0
+    model.query(MESSAGES)
+    assert get_priority_function("steps")(model) == -1
+    assert get_priority_function("cost")(model) == -1.0
+    assert get_priority_function("fifo")(model) == 0.0
+    assert get_priority_function("container_age")(model) == model.started_at
+    mark_container_started(SimpleNamespace(model=model))  # e.g., wrapped by a CachedModel
+    assert model.container_started_at is not None
+    assert get_priority_function("container_age")(model) == model.container_started_at
+
+
+def test_queue_wait_reported(reset_global_stats):
+    model = ScheduledModel(DeterministicModel(outputs=["a"]), scheduler="test_queue_wait_reported")
+    response = model.query(MESSAGES)
+    assert response["content"] == "a"
+    assert 0 <= response["extra"]["queue_wait"] < 0.1
+    assert model.get_template_vars()["queue_wait"] == model.queue_wait
+    assert GLOBAL_MODEL_STATS.metrics.snapshot()["total"]["queue_wait_mean"] is not None
+    assert "mswea_model_queue_wait_seconds_count" in GLOBAL_MODEL_STATS.metrics.to_openmetrics()
+
+
+def test_agents_close_to_submitting_go_first():
+    """With one slot, the agent with more steps is served before agents that just started."""
+    scheduler_name = "test_agents_close_to_submitting_go_first"
+    holder = ScheduledModel(
+        DeterministicModel(outputs=["/sleep 0.3", "hold"]), scheduler=scheduler_name, max_concurrent=1
+    )
+    veteran = ScheduledModel(DeterministicModel(outputs=["1", "2", "3"]), scheduler=scheduler_name)
+    veteran.n_calls = 2
+    newcomers = [ScheduledModel(DeterministicModel(outputs=["x"]), scheduler=scheduler_name) for _ in range(3)]
+    order = []
+
+    def query(name: str, model: ScheduledModel) -> None:
+        model.query(MESSAGES)
+        order.append(name)
+
+    holding = threading.Thread(target=query, args=("holder", holder))
+    holding.start()
+    while holder.scheduler.n_running == 0:
+        time.sleep(0.001)
+    threads = [threading.Thread(target=query, args=(f"new{i}", m)) for i, m in enumerate(newcomers)]
+    threads.append(threading.Thread(target=query, args=("veteran", veteran)))
+    for thread in threads:
+        thread.start()
+        while holder.scheduler.n_waiting < threads.index(thread) + 1:
+            time.sleep(0.001)
+    for thread in [holding, *threads]:
+        thread.join()
+    assert sorted(order[:2]) == ["holder", "veteran"]
+    assert veteran.queue_wait > 0
+
+
+def test_get_model_with_scheduler():
+    config = {
+        "outputs": ["a"],
+        "scheduler": {"max_concurrent": 4, "priority": "cost", "scheduler": "test_get_model"},
+    }
+    with patch("minisweagent.models.get_model_class", return_value=_deterministic_model):
+        model = get_model("deterministic", config)
+    assert isinstance(model, ScheduledModel)
+    assert isinstance(model.model, DeterministicModel)
+    assert model.scheduler.max_concurrent == 4
+    assert model.get_template_vars()["priority"] == "cost"
+
+
+def _deterministic_model(**kwargs):
+    kwargs.pop("model_kwargs")
+    return DeterministicModel(**kwargs)
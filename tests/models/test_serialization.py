@@ -0,0 +1,54 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from minisweagent.models.openai_model import OpenAIModel
+from minisweagent.models.utils.serialization import IncrementalRequestEncoder, _synthetic_history, benchmark
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_encode_matches_json(fast):
+    encoder = IncrementalRequestEncoder(fast=fast)
+    history = _synthetic_history(5, 20) + [{"role": "user", "content": 'ünïcode \\ \n "quotes"'}]
+    for i in range(1, len(history) + 1):
+        payload = {"model": "m", "messages": history[:i], "temperature": 0.0}
+        assert json.loads(encoder.encode(payload)) == payload
+    assert json.loads(encoder.encode({"messages": history[:2]})) == {"messages": history[:2]}
+    assert json.loads(encoder.encode({"model": "m"})) == {"model": "m"}
+
+
+def test_encode_reuses_prefix():
+    encoder = IncrementalRequestEncoder()
+    history = _synthetic_history(3, 10)
+    encoder.encode({"messages": history[:4]})
+    with patch.object(encoder, "_dumps", wraps=encoder._dumps) as dumps:
+        encoder.encode({"messages": history[:6]})
+    assert dumps.call_count == 3  # the payload without messages and the two new messages
+
+
+def test_encode_detects_changed_messages():
+    encoder = IncrementalRequestEncoder()
+    messages = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    encoder.encode({"messages": messages})
+    messages[0]["content"] = "changed"
+    assert json.loads(encoder.encode({"messages": messages}))["messages"][0]["content"] == "changed"
+    assert json.loads(encoder.encode({"messages": messages[:1]}))["messages"] == messages[:1]
+
+
+def test_openai_model_sends_incremental_body():
+    model = OpenAIModel(model_name="gpt-4", api_key="key", model_kwargs={"temperature": 0.0})
+    history = [{"role": "user", "content": "task"}]
+    with patch("requests.post") as mock_post:
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "hi"}}]}
+        for i in range(3):
+            model.query(history)
+            body = json.loads(mock_post.call_args.kwargs["data"])
+            assert body == {"model": "gpt-4", "messages": history, "temperature": 0.0}
+            history = history + [{"role": "assistant", "content": f"a{i}"}, {"role": "user", "content": f"o{i}"}]
+
+
+def test_benchmark():
+    results = benchmark(n_steps=20, observation_size=100)
+    assert set(results) == {"json", "incremental", "incremental_fast"}
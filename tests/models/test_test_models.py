@@ -1,8 +1,21 @@
+import json
 import logging
 import time
+from pathlib import Path
+
+import pytest
 
 import minisweagent.models
-from minisweagent.models.test_models import DeterministicModel, DeterministicModelConfig
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.test_models import (
+    DeterministicModel,
+    DeterministicModelConfig,
+    ReplayMismatchError,
+    ReplayModel,
+)
+from minisweagent.run.utils.save import save_traj
 
 
 def test_basic_functionality_and_cost_tracking(reset_global_stats):
@@ -65,3 +78,37 @@ def test_sleep_and_warning_commands(caplog):
         assert model2.query([{"role": "user", "content": "test"}]) == {"content": "After warning"}
     assert model2.n_calls == 1  # Warning no longer counts as separate call
     assert "Test message" in caplog.text
+
+
+def _run_and_save(model, path: Path) -> DefaultAgent:
+    agent = DefaultAgent(model, LocalEnvironment())
+    exit_status, result = agent.run("task")
+    save_traj(agent, path, exit_status=exit_status, result=result, print_path=False)
+    return agent
+
+
+def test_replay_model_reproduces_trajectory(tmp_path, reset_global_stats):
+    outputs = ["```bash\necho hello\n```", "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\necho done\n```"]
+    recorded = _run_and_save(DeterministicModel(outputs=outputs), tmp_path / "recorded.traj.json")
+    cost_before_replay = GLOBAL_MODEL_STATS.cost
+
+    model = ReplayModel(trajectory_path=str(tmp_path / "recorded.traj.json"), check_prefix=True)
+    replayed = _run_and_save(model, tmp_path / "replayed.traj.json")
+    assert [m["content"] for m in replayed.messages] == [m["content"] for m in recorded.messages]
+    assert model.n_calls == 2
+    assert model.cost == 0.0
+    assert GLOBAL_MODEL_STATS.cost == cost_before_replay
+    with pytest.raises(ReplayMismatchError, match="only has 2 assistant messages"):
+        model.query([])
+
+
+def test_replay_model_prefix_mismatch(tmp_path):
+    path = tmp_path / "recorded.traj.json"
+    path.write_text(json.dumps([{"role": "user", "content": "task"}, {"role": "assistant", "content": "a"}]))
+    assert ReplayModel(trajectory_path=str(path)).query([{"role": "user", "content": "other"}])["content"] == "a"
+    model = ReplayModel(trajectory_path=str(path), check_prefix=True)
+    with pytest.raises(ReplayMismatchError, match="Message 0 differs"):
+        model.query([{"role": "user", "content": "other"}])
+    model = ReplayModel(trajectory_path=str(path), check_prefix=True)
+    content = [{"type": "text", "text": "task", "cache_control": {"type": "ephemeral"}}]
+    assert model.query([{"role": "user", "content": content}])["content"] == "a"
@@ -0,0 +1,108 @@
+import json
+from unittest.mock import patch
+
+import litellm
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models import GLOBAL_MODEL_STATS
+from minisweagent.models.litellm_model import LitellmModel
+from minisweagent.models.openai_model import OpenAIModel
+from minisweagent.models.utils.usage import TokenUsage, get_usage_totals, strip_extra
+from minisweagent.run.utils.save import save_traj
+
+
+def _litellm_response(content: str = "hi", **usage) -> litellm.ModelResponse:
+    return litellm.ModelResponse(choices=[{"message": {"content": content, "role": "assistant"}}], usage=usage)
+
+
+def test_usage_from_litellm_openai_style():
+    response = _litellm_response(prompt_tokens=10, completion_tokens=3, prompt_tokens_details={"cached_tokens": 4})
+    assert TokenUsage.from_litellm(response) == TokenUsage(10, 3, 4, 0)
+
+
+def test_usage_from_litellm_anthropic_style():
+    response = _litellm_response(
+        prompt_tokens=10, completion_tokens=3, cache_read_input_tokens=5, cache_creation_input_tokens=2
+    )
+    assert TokenUsage.from_litellm(response) == TokenUsage(10, 3, 5, 2)
+
+
+def test_usage_from_openai():
+    response = {"usage": {"prompt_tokens": 7, "completion_tokens": 1, "prompt_tokens_details": {"cached_tokens": 6}}}
+    assert TokenUsage.from_openai(response) == TokenUsage(7, 1, 6, 0)
+    assert TokenUsage.from_openai({}) == TokenUsage()
+
+
+def test_usage_addition():
+    assert TokenUsage(1, 2, 3, 4) + TokenUsage(1, 1, 1, 1) == TokenUsage(2, 3, 4, 5)
+
+
+def test_strip_extra():
+    messages = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b", "extra": {"usage": {}}}]
+    stripped = strip_extra(messages)
+    assert stripped == [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    assert stripped[0] is messages[0]
+    assert "extra" in messages[1]
+    assert strip_extra(stripped) is stripped
+
+
+def test_get_usage_totals():
+    messages = [
+        {"role": "user", "content": "a"},
+        {"role": "assistant", "content": "b", "extra": {"usage": TokenUsage(10, 2, 5, 1).to_dict()}},
+        {"role": "assistant", "content": "c", "extra": {"usage": TokenUsage(20, 3, 15, 0).to_dict()}},
+    ]
+    assert get_usage_totals(messages) == TokenUsage(30, 5, 20, 1).to_dict()
+
+
+def test_litellm_model_returns_usage(reset_global_stats):
+    model = LitellmModel(model_name="gpt-4")
+    response = _litellm_response(prompt_tokens=100, completion_tokens=10, prompt_tokens_details={"cached_tokens": 80})
+    messages = [{"role": "assistant", "content": "x", "extra": {"usage": {}}}]
+    with (
+        patch("minisweagent.models.litellm_model.LitellmModel._query", return_value=response) as mock_query,
+        patch("litellm.cost_calculator.completion_cost", return_value=0.25),
+    ):
+        result = model.query(messages)
+    assert mock_query.call_args.args[0] == [{"role": "assistant", "content": "x"}]
+    assert result["extra"] == {"usage": TokenUsage(100, 10, 80, 0).to_dict(), "cost": 0.25}
+    assert GLOBAL_MODEL_STATS.usage == TokenUsage(100, 10, 80, 0).to_dict()
+
+
+def test_openai_model_returns_usage(reset_global_stats):
+    model = OpenAIModel(model_name="gpt-4")
+    body = {"choices": [{"message": {"content": "hi"}}], "usage": {"prompt_tokens": 5, "completion_tokens": 2}}
+    with patch("requests.post") as mock_post:
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = body
+        result = model.query([{"role": "assistant", "content": "x", "extra": {}}])
+    assert json.loads(mock_post.call_args.kwargs["data"])["messages"] == [{"role": "assistant", "content": "x"}]
+    assert result["extra"]["usage"] == TokenUsage(5, 2, 0, 0).to_dict()
+    assert GLOBAL_MODEL_STATS.usage["prompt_tokens"] == 5
+
+
+def test_usage_stored_on_messages_and_in_trajectory(tmp_path):
+    model = LitellmModel(model_name="gpt-4")
+    responses = [
+        _litellm_response("```bash\necho hi\n```", prompt_tokens=100, completion_tokens=10),
+        _litellm_response(
+            "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\n```",
+            prompt_tokens=200,
+            completion_tokens=20,
+            prompt_tokens_details={"cached_tokens": 100},
+        ),
+    ]
+    agent = DefaultAgent(model, LocalEnvironment())
+    with (
+        patch("minisweagent.models.litellm_model.LitellmModel._query", side_effect=responses),
+        patch("litellm.cost_calculator.completion_cost", return_value=0.0),
+    ):
+        exit_status, _ = agent.run("task")
+    assert exit_status == "Submitted"
+    assert agent.messages[2]["extra"]["usage"]["prompt_tokens"] == 100
+    save_traj(agent, tmp_path / "traj.json", print_path=False)
+    model_stats = json.loads((tmp_path / "traj.json").read_text())["info"]["model_stats"]
+    assert model_stats["prompt_tokens"] == 300
+    assert model_stats["completion_tokens"] == 30
+    assert model_stats["cache_read_tokens"] == 100
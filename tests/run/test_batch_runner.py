@@ -0,0 +1,221 @@
+import email.parser
+import itertools
+import json
+import re
+import threading
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.batch import BatchClient, BatchError
+from minisweagent.models.openai_model import OpenAIModel
+from minisweagent.run.extra.utils.batch_runner import BatchRunner
+
+
+class StandInBatchServer:
+    """Offline stand-in for an OpenAI-style batch API. Batches complete after `n_polls` status requests."""
+
+    def __init__(self, respond: Callable[[str, dict], dict | None], *, n_polls: int = 1):
+        self.respond = respond
+        self.n_polls = n_polls
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self.submitted: list[list[dict]] = []
+        self._ids = itertools.count()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.path == "/v1/files":
+                    message = email.parser.BytesParser().parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+                    )
+                    content = next(p for p in message.get_payload() if p.get_filename()).get_payload(decode=True)
+                    self._send(200, json.dumps({"id": server.add_file(content)}).encode())
+                elif self.path == "/v1/batches":
+                    self._send(200, json.dumps(server.create_batch(json.loads(body)["input_file_id"])).encode())
+                else:
+                    self._send(404, b"{}")
+
+            def do_GET(self):
+                if m := re.fullmatch(r"/v1/batches/(\w+)", self.path):
+                    self._send(200, json.dumps(server.poll(m.group(1))).encode())
+                elif m := re.fullmatch(r"/v1/files/(\w+)/content", self.path):
+                    self._send(200, server.files[m.group(1)], "application/jsonl")
+                else:
+                    self._send(404, b"{}")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def add_file(self, content: bytes) -> str:
+        file_id = f"file{next(self._ids)}"
+        self.files[file_id] = content
+        return file_id
+
+    def create_batch(self, input_file_id: str) -> dict:
+        requests = [json.loads(line) for line in self.files[input_file_id].decode().splitlines()]
+        self.submitted.append(requests)
+        batch_id = f"batch{next(self._ids)}"
+        self.batches[batch_id] = {"id": batch_id, "status": "in_progress", "requests": requests, "n_polls": 0}
+        return {"id": batch_id, "status": "in_progress"}
+
+    def poll(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        batch["n_polls"] += 1
+        if batch["status"] == "in_progress" and batch["n_polls"] >= self.n_polls:
+            lines = []
+            for request in batch["requests"]:
+                content = self.respond(request["custom_id"], request["body"])
+                if content is None:
+                    item = {"custom_id": request["custom_id"], "response": None, "error": {"message": "failed"}}
+                else:
+                    response_body = {
+                        "choices": [{"message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": 1000, "completion_tokens": 100},
+                    }
+                    item = {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": response_body}}
+                lines.append(json.dumps(item))
+            batch["status"] = "completed"
+            batch["output_file_id"] = self.add_file("\n".join(lines).encode())
+        return {k: v for k, v in batch.items() if k not in ["requests", "n_polls"]}
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def _commands(*commands: str) -> list[str]:
+    return [f"```bash\n{command}\n```" for command in commands]
+
+
+SCRIPTS = {
+    "a": _commands("echo a1", "echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\necho result-a"),
+    "b": _commands("echo b1", "echo b2", "echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\necho result-b"),
+    "c": ["no action"] + _commands("echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\necho result-c"),
+}
+
+
+def _scripted(custom_id: str, body: dict) -> str:
+    n_assistant = sum(message["role"] == "assistant" for message in body["messages"])
+    return SCRIPTS[custom_id][n_assistant]
+
+
+@pytest.fixture
+def batch_server():
+    servers = []
+
+    def make(respond=_scripted, **kwargs) -> StandInBatchServer:
+        servers.append(StandInBatchServer(respond, **kwargs))
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+def _run(server: StandInBatchServer, job_ids, **kwargs) -> tuple[dict, dict]:
+    client = BatchClient(base_url=server.base_url, api_key="test", poll_interval=0.0)
+    results, agents = {}, {}
+
+    def start_job(job_id: str):
+        model = OpenAIModel(model_name="gpt-4", api_key="test", cost_per_1k_input_tokens=0.5)
+        agents[job_id] = DefaultAgent(model, LocalEnvironment())
+        return agents[job_id], f"task {job_id}"
+
+    def on_finished(job_id, agent, exit_status, result, extra_info):
+        results[job_id] = (exit_status, result)
+
+    BatchRunner(client, **kwargs).run(job_ids, start_job, on_finished)
+    return results, agents
+
+
+def test_batch_runner_step_synchronous(batch_server):
+    server = batch_server(n_polls=3)
+    results, agents = _run(server, ["a", "b", "c"])
+    assert results == {
+        "a": ("Submitted", "result-a\n"),
+        "b": ("Submitted", "result-b\n"),
+        "c": ("Submitted", "result-c\n"),
+    }
+    # One batch per step of the longest agent, with all agents that are still running
+    assert [sorted(r["custom_id"] for r in batch) for batch in server.submitted] == [
+        ["a", "b", "c"],
+        ["a", "b", "c"],
+        ["b"],
+    ]
+    assert server.submitted[0][0]["body"]["messages"][1]["content"].startswith("Your task: task a")
+    assert agents["b"].model.n_calls == 3
+    assert agents["b"].model.cost == pytest.approx(1.5)
+    assert "Please always provide EXACTLY ONE action" in agents["c"].messages[3]["content"]
+
+
+def test_batch_runner_max_active(batch_server):
+    server = batch_server()
+    results, _ = _run(server, ["a", "b", "c"], max_active=2)
+    assert set(results) == {"a", "b", "c"}
+    assert all(len(batch) <= 2 for batch in server.submitted)
+    assert [sorted(r["custom_id"] for r in batch) for batch in server.submitted][:2] == [["a", "b"], ["a", "b"]]
+
+
+def test_batch_runner_retries_failed_requests(batch_server):
+    n_failures = {"a": 0}
+
+    def respond(custom_id, body):
+        if n_failures["a"] < 2:
+            n_failures["a"] += 1
+            return None
+        return _scripted(custom_id, body)
+
+    results, _ = _run(batch_server(respond), ["a"], max_request_retries=3)
+    assert results == {"a": ("Submitted", "result-a\n")}
+    results, _ = _run(batch_server(lambda custom_id, body: None), ["a"], max_request_retries=1)
+    assert results["a"][0] == "BatchError"
+
+
+def test_batch_runner_failing_start_job(batch_server):
+    server = batch_server()
+    client = BatchClient(base_url=server.base_url, api_key="test", poll_interval=0.0)
+    results = {}
+
+    def start_job(job_id):
+        raise RuntimeError("no container")
+
+    BatchRunner(client).run(["a"], start_job, lambda job_id, agent, *args: results.update({job_id: (agent, *args)}))
+    assert results["a"][:3] == (None, "RuntimeError", "no container")
+    assert server.submitted == []
+
+
+def test_batch_client_failed_batch(batch_server):
+    server = batch_server()
+    client = BatchClient(base_url=server.base_url, api_key="test", poll_interval=0.0)
+    batch_id = client.submit({"a": {"messages": []}})
+    server.batches[batch_id]["status"] = "expired"
+    with pytest.raises(BatchError, match="expired"):
+        client.wait(batch_id)
+
+
+def test_run_steps():
+    steps = DefaultAgent(OpenAIModel(model_name="gpt-4"), LocalEnvironment()).run_steps("task")
+    messages = next(steps)
+    for output in SCRIPTS["b"][:-1]:
+        assert messages[-1]["role"] == "user"
+        messages = steps.send({"content": output})
+    assert messages[-1]["content"] == "Observation: {'output': 'b2\\n', 'returncode': 0}"
+    with pytest.raises(StopIteration) as exc_info:
+        steps.send({"content": SCRIPTS["b"][-1]})
+    assert exc_info.value.value == ("Submitted", "result-b\n")
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from minisweagent.run.extra.utils.environment_pool import EnvironmentPool
+
+
+class _FakeEnvironment:
+    def __init__(self, instance_id: str):
+        self.instance_id = instance_id
+        self.cleaned_up = False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class _Factory:
+    def __init__(self, delay: float = 0.0, fail: set[str] | None = None):
+        self.delay = delay
+        self.fail = fail or set()
+        self.created: list[str] = []
+        self.envs: list[_FakeEnvironment] = []
+        self.n_running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, instance: dict) -> _FakeEnvironment:
+        with self._lock:
+            self.created.append(instance["instance_id"])
+            self.n_running += 1
+            self.max_running = max(self.max_running, self.n_running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.n_running -= 1
+        if instance["instance_id"] in self.fail:
+            self.fail.remove(instance["instance_id"])
+            raise RuntimeError("pull failed")
+        self.envs.append(env := _FakeEnvironment(instance["instance_id"]))
+        return env
+
+
+def _instances(n: int) -> list[dict]:
+    return [{"instance_id": f"i{i}"} for i in range(n)]
+
+
+def test_without_lookahead_environments_are_created_on_demand():
+    factory = _Factory()
+    instances = _instances(3)
+    with EnvironmentPool(factory, instances) as pool:
+        assert factory.created == []
+        assert pool.get(instances[1]).instance_id == "i1"  # type: ignore[attr-defined]
+    assert factory.created == ["i1"]
+    assert pool.metrics.snapshot()["n_misses"] == 1
+
+
+def test_prefetches_upcoming_instances_in_order():
+    factory = _Factory(delay=0.05)
+    instances = _instances(6)
+    with EnvironmentPool(factory, instances, lookahead=2, max_concurrent=2) as pool:
+        time.sleep(0.2)
+        assert sorted(factory.created) == ["i0", "i1"]
+        assert pool.get(instances[0]).instance_id == "i0"  # type: ignore[attr-defined]
+        time.sleep(0.2)
+        assert sorted(factory.created) == ["i0", "i1", "i2"]
+        pool.get(instances[1])
+        pool.get(instances[2])
+        pool.get(instances[5])  # not prefetched yet: created on demand and never prefetched
+        time.sleep(0.2)
+    assert sorted(factory.created) == ["i0", "i1", "i2", "i3", "i4", "i5"]
+    snapshot = pool.metrics.snapshot()
+    assert (snapshot["n_hits"], snapshot["n_misses"]) == (3, 1)
+    assert snapshot["hit_rate"] == 0.75
+    assert snapshot["startup_mean"] >= 0.05
+    # prepared but unused environments are cleaned up
+    assert sorted(env.instance_id for env in factory.envs if env.cleaned_up) == ["i3", "i4"]
+    assert snapshot["n_discarded"] == 2
+
+
+def test_bounded_concurrency():
+    factory = _Factory(delay=0.05)
+    with EnvironmentPool(factory, _instances(8), lookahead=8, max_concurrent=3):
+        time.sleep(0.3)
+    assert factory.max_running == 3
+
+
+def test_waits_for_environments_that_are_being_prepared():
+    factory = _Factory(delay=0.2)
+    instances = _instances(2)
+    with EnvironmentPool(factory, instances, lookahead=1) as pool:
+        pool.get(instances[0])
+        pool.record_first_step(time.perf_counter() - 1.0)
+    snapshot = pool.metrics.snapshot()
+    assert snapshot["n_partial_hits"] == 1
+    assert snapshot["wait_mean"] >= 0.1
+    assert snapshot["time_to_first_step_mean"] >= 1.0
+
+
+def test_failed_prefetch_is_retried_on_demand():
+    factory = _Factory(fail={"i0"})
+    instances = _instances(1)
+    with EnvironmentPool(factory, instances, lookahead=1) as pool:
+        assert pool.get(instances[0]).instance_id == "i0"  # type: ignore[attr-defined]
+    assert factory.created == ["i0", "i0"]
+    assert pool.metrics.snapshot()["n_prefetch_errors"] == 1
+
+
+def test_write_metrics(tmp_path):
+    factory = _Factory()
+    with EnvironmentPool(factory, _instances(1)) as pool:
+        pool.get({"instance_id": "i0"})
+    pool.metrics.write(tmp_path)
+    prom = (tmp_path / "environment_metrics.prom").read_text()
+    assert "mswea_environment_pool_misses_total 1" in prom
+    assert 'mswea_environment_startup_seconds_bucket{le="+Inf"} 1' in prom
+    assert (tmp_path / "environment_metrics.json").exists()
+
+
+def test_image_manager_is_asked_before_environments_are_created():
+    calls = []
+
+    class _ImageManager:
+        def ensure(self, instance):
+            calls.append(("ensure", instance["instance_id"]))
+
+        def release(self, instance):
+            calls.append(("release", instance["instance_id"]))
+
+        def close(self):
+            calls.append(("close", ""))
+
+    def factory(instance):
+        calls.append(("create", instance["instance_id"]))
+        return _FakeEnvironment(instance["instance_id"])
+
+    instances = _instances(1)
+    with EnvironmentPool(factory, instances, image_manager=_ImageManager()) as pool:  # type: ignore[arg-type]
+        pool.get(instances[0])
+        pool.release(instances[0])
+    assert calls == [("ensure", "i0"), ("create", "i0"), ("release", "i0"), ("close", "")]
@@ -0,0 +1,147 @@
+import time
+
+import pytest
+
+from minisweagent.run.extra.utils.image_manager import ImageManager
+
+_FAKE_DOCKER = """#!/bin/bash
+# Images are files in $FAKE_DOCKER_DIR; `pull` is logged and fails for images named fail*
+set -e
+dir="$FAKE_DOCKER_DIR"
+name="${@: -1}"
+file="$dir/$(echo "$name" | tr '/:' '__')"
+case "$1 $2" in
+    "images --format") cat "$dir"/*.name 2>/dev/null || true ;;
+    "info --format") echo "$dir" ;;
+    "image rm")
+        [ -e "$dir/in_use" ] && grep -qx "$name" "$dir/in_use" && { echo "image is in use" >&2; exit 1; }
+        echo "rm $name" >> "$dir/log"; rm "$file.name" ;;
+    pull*)
+        echo "pull $name" >> "$dir/log"
+        case "$name" in fail*) exit 1 ;; esac
+        sleep 0.05; echo "$name" > "$file.name" ;;
+    *) echo "unexpected: $*" >&2; exit 1 ;;
+esac
+"""
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    executable = tmp_path / "docker"
+    executable.write_text(_FAKE_DOCKER)
+    executable.chmod(0o755)
+    images = tmp_path / "images"
+    images.mkdir()
+    monkeypatch.setenv("FAKE_DOCKER_DIR", str(images))
+    return executable, images
+
+
+def _log(images_dir) -> list[str]:
+    log = images_dir / "log"
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def _instances(*images: str) -> list[dict]:
+    return [{"instance_id": f"i{i}", "image": image} for i, image in enumerate(images)]
+
+
+def _manager(fake_docker, instances, capacity: int = 100, **kwargs) -> ImageManager:
+    executable, images_dir = fake_docker
+    manager = ImageManager(instances, lambda instance: instance["image"], executable=str(executable), **kwargs)
+    manager.disk_usage = lambda: len(list(images_dir.glob("*.name"))) / capacity  # type: ignore[method-assign]
+    return manager
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_pulls_ahead_in_order_with_lookahead(fake_docker):
+    _, images_dir = fake_docker
+    (images_dir / "present.name").write_text("present:latest\n")
+    instances = _instances("a:1", "present:latest", "b:1", "a:1", "c:1", "d:1")
+    manager = _manager(fake_docker, instances, lookahead=2, max_concurrent_pulls=1)
+    try:
+        _wait_for(lambda: len(_log(images_dir)) == 2)
+        time.sleep(0.2)
+        assert _log(images_dir) == ["pull a:1", "pull b:1"]  # present image is skipped, pipeline is full
+        assert manager.ensure(instances[0]) < 1.0
+        _wait_for(lambda: len(_log(images_dir)) == 3)
+        assert _log(images_dir)[-1] == "pull c:1"
+        manager.ensure(instances[5])  # not pulled yet: pulled on demand
+        assert _log(images_dir)[-1] == "pull d:1"
+    finally:
+        manager.close()
+    assert manager.metrics.snapshot()["n_pulls"] == 4
+
+
+def test_evicts_least_recently_used_unneeded_images(fake_docker):
+    _, images_dir = fake_docker
+    instances = _instances("a:1", "b:1", "c:1", "b:1")
+    manager = _manager(fake_docker, instances, capacity=10, lookahead=0, max_disk_usage=0.5)
+    try:
+        for instance in instances[:3]:
+            manager.ensure(instance)
+        manager.release(instances[2])
+        manager.release(instances[0])
+        manager.release(instances[1])  # b is still needed by instance 3
+        assert not any(line.startswith("rm") for line in _log(images_dir))
+        manager.config.max_disk_usage = 0.15
+        manager.evict()
+        assert _log(images_dir)[-2:] == ["rm c:1", "rm a:1"]  # least recently used first
+        assert (images_dir / "b_1.name").exists()
+    finally:
+        manager.close()
+    assert manager.metrics.snapshot()["n_evictions"] == 2
+
+
+def test_pulling_ahead_waits_for_disk_space(fake_docker):
+    _, images_dir = fake_docker
+    instances = _instances("a:1", "b:1", "c:1", "b:1", "d:1")
+    # the disk is "full" with 3 images
+    manager = _manager(fake_docker, instances, capacity=4, lookahead=3, max_disk_usage=0.75, max_concurrent_pulls=1)
+    try:
+        _wait_for(lambda: len(list(images_dir.glob("*.name"))) == 3)
+        for instance in instances[:3]:
+            manager.ensure(instance)
+        time.sleep(0.2)
+        assert "pull d:1" not in _log(images_dir)
+        for instance in instances[:3]:
+            manager.release(instance)
+        _wait_for(lambda: "pull d:1" in _log(images_dir))
+        assert len([line for line in _log(images_dir) if line.startswith("rm")]) == 1
+        assert (images_dir / "b_1.name").exists()
+    finally:
+        manager.close()
+
+
+def test_images_that_cannot_be_removed_are_kept(fake_docker):
+    _, images_dir = fake_docker
+    instances = _instances("a:1", "b:1")
+    manager = _manager(fake_docker, instances, capacity=2, lookahead=2, max_disk_usage=0.5)
+    try:
+        for instance in instances:
+            manager.ensure(instance)
+        (images_dir / "in_use").write_text("a:1\n")
+        manager.release(instances[0])
+        manager.release(instances[1])
+        assert _log(images_dir)[-1] == "rm b:1"
+        assert (images_dir / "a_1.name").exists()
+    finally:
+        manager.close()
+
+
+def test_failed_pulls_are_retried_on_demand(fake_docker):
+    _, images_dir = fake_docker
+    instances = _instances("fail:1")
+    manager = _manager(fake_docker, instances, lookahead=1)
+    try:
+        _wait_for(lambda: len(_log(images_dir)) == 1)
+        manager.ensure(instances[0])
+        assert _log(images_dir) == ["pull fail:1", "pull fail:1"]
+    finally:
+        manager.close()
+    assert manager.metrics.snapshot()["n_pull_errors"] == 2
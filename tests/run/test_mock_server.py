@@ -0,0 +1,101 @@
+import json
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.models.openai_model import OpenAIModel, OpenAIRateLimitError, OpenAIServerError
+from minisweagent.run.extra.mock_server import MockServer
+
+TRAJECTORY = Path(__file__).parent.parent / "test_data" / "local.traj.json"
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def make(**kwargs) -> MockServer:
+        servers.append(MockServer(port=0, **kwargs).start())
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def _model(server: MockServer) -> OpenAIModel:
+    return OpenAIModel(model_name="mock", base_url=server.base_url, api_key="test")
+
+
+def test_scripted_outputs_drive_an_agent(mock_server):
+    server = mock_server(
+        outputs=["```bash\necho hi\n```", "```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\necho done\n```"]
+    )
+    agent = DefaultAgent(_model(server), LocalEnvironment())
+    assert agent.run("task") == ("Submitted", "done\n")
+    assert agent.model.n_calls == 2
+    assert server.stats["n_completions"] == 2
+    assert httpx.get(server.base_url.removesuffix("/v1") + "/stats").json()["n_requests"] == 2
+
+
+def test_replay_trajectory(mock_server, tmp_path):
+    (tmp_path / "a.traj.json").write_text(json.dumps({"messages": json.loads(TRAJECTORY.read_text())}))
+    server = mock_server(trajectories=[str(tmp_path)])
+    recorded = [m["content"] for m in json.loads(TRAJECTORY.read_text()) if m["role"] == "assistant"]
+    model = _model(server)
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "unknown task"}]
+    assert model.query(messages)["content"] == recorded[0]
+    messages += [{"role": "assistant", "content": recorded[0]}, {"role": "user", "content": "observation"}]
+    assert model.query(messages)["content"] == recorded[1]
+    messages += [{"role": "assistant", "content": recorded[1]}, {"role": "user", "content": "observation"}]
+    assert "COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT" in model.query(messages)["content"]
+
+
+def test_injected_failures(mock_server):
+    server = mock_server(rate_limit_probability=1.0, rate_limit_burst=3)
+    with pytest.raises(OpenAIRateLimitError):
+        _model(server).query([{"role": "user", "content": "task"}])
+    assert server.stats["n_rate_limited"] == 1
+
+    server = mock_server(server_error_probability=1.0)
+    with pytest.raises(OpenAIServerError):
+        _model(server).query([{"role": "user", "content": "task"}])
+    assert server.stats["n_server_errors"] == 1
+
+
+def test_rate_limit_bursts_are_reproducible(mock_server):
+    def status_codes(seed: int) -> list[int]:
+        server = mock_server(rate_limit_probability=0.2, rate_limit_burst=3, seed=seed)
+        body = {"messages": [{"role": "user", "content": "task"}]}
+        return [httpx.post(f"{server.base_url}/chat/completions", json=body).status_code for _ in range(30)]
+
+    codes = status_codes(seed=1)
+    assert codes == status_codes(seed=1)
+    assert 429 in codes and 200 in codes
+    first = codes.index(429)
+    assert codes[first : first + 3] == [429, 429, 429]
+
+
+def test_latency(mock_server):
+    server = mock_server(latency=0.2)
+    start = time.perf_counter()
+    _model(server).query([{"role": "user", "content": "task"}])
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_streaming(mock_server):
+    server = mock_server(outputs=["x" * 50], stream_chunk_size=8)
+    body = {"model": "mock", "messages": [{"role": "user", "content": "task"}], "stream": True}
+    chunks = []
+    with httpx.stream("POST", f"{server.base_url}/chat/completions", json=body) as response:
+        assert response.headers["content-type"] == "text/event-stream"
+        for line in response.iter_lines():
+            if line.startswith("data: ") and line != "data: [DONE]":
+                chunks.append(json.loads(line.removeprefix("data: ")))
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "x" * 50
+    assert len(chunks) == 1 + 7
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    assert chunks[-1]["usage"]["completion_tokens"] == 12
@@ -1,19 +1,23 @@
 import json
 from dataclasses import asdict, dataclass
 from typing import Any
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
+import yaml
 
 from minisweagent import package_dir
+from minisweagent.environments.local import LocalEnvironment
 from minisweagent.models.test_models import DeterministicModel
 from minisweagent.run.extra.swebench import (
     filter_instances,
     get_swebench_docker_image_name,
     main,
+    process_instance,
     remove_from_preds_file,
     update_preds_file,
 )
+from minisweagent.run.extra.utils.environment_pool import EnvironmentPool
 
 
 @pytest.mark.slow
@@ -493,3 +497,21 @@ def test_exception_handling_with_progress_manager(tmp_path):
 
             # on_uncaught_exception should not be called since exceptions are handled properly
             mock_progress_manager.on_uncaught_exception.assert_not_called()
+
+
+def test_process_instance_uses_environment_pool(tmp_path):
+    """The environment comes from the pool and time-to-first-step is recorded"""
+    instances = [{"instance_id": "test__instance-1", "problem_statement": "task"}]
+    config = yaml.safe_load((package_dir / "config" / "extra" / "swebench.yaml").read_text())
+    model = DeterministicModel(outputs=["Done\n```bash\necho COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT\necho patch\n```"])
+    with (
+        EnvironmentPool(lambda instance: LocalEnvironment(), instances, lookahead=1) as pool,
+        patch("minisweagent.run.extra.swebench.get_model", return_value=model),
+        patch("minisweagent.run.extra.swebench.get_sb_environment") as mock_get_sb_environment,
+    ):
+        process_instance(instances[0], tmp_path, config, MagicMock(), pool)
+    mock_get_sb_environment.assert_not_called()
+    assert json.loads((tmp_path / "preds.json").read_text())["test__instance-1"]["model_patch"] == "patch\n"
+    snapshot = pool.metrics.snapshot()
+    assert snapshot["n_hits"] + snapshot["n_partial_hits"] == 1
+    assert snapshot["time_to_first_step_mean"] is not None